@@ -9,13 +9,14 @@ import sys
 import json
 import tempfile
 import logging
+import itertools
+import threading
 from datetime import datetime, timedelta
 from functools import wraps
 from typing import Optional, Callable
 
-from flask import Flask, render_template, request, jsonify, session, send_file, redirect, url_for, g
+from flask import Flask, Response, render_template, request, jsonify, session, send_file, redirect, url_for, g, has_request_context, stream_with_context
 from werkzeug.utils import secure_filename
-import msal
 import requests
 from dotenv import load_dotenv
 
@@ -40,12 +41,24 @@ if not ((3, 11) <= sys.version_info[:2] <= (3, 12)):
     sys.exit(1)
 
 # Import modules from current directory
-from ca_policy_manager import ConditionalAccessManager
-from ca_policy_examples import POLICY_TEMPLATES
-from utils.report_analyzer import SecurityReportAnalyzer
+from ca_policy_manager import batch_delete_policies
+from manager_pool import ManagerPool
 from utils.ai_assistant import PolicyAIAssistant
+from utils.directory_resolver import DirectoryResolver, ApplicationValidator, GroupNameResolver, annotate_policy_names
+from utils.directory_cache import configure_directory_cache, get_directory_cache
+from utils.rate_governor import configure_rate_governor, get_rate_governor
+from utils.policy_cache import (
+    MAX_PAGE_SIZE, NAME_PENDING, SORT_FIELDS, SUMMARY_FIELDS, PolicyCache,
+    name_key, project_policy, query_snapshot, summary_row
+)
+from utils.deploy_engine import DeployEngine, DEFAULT_CONCURRENCY, summarize_results
+from utils.http_cache import CachedBody, json_response, serialize_json
+from utils.template_registry import TEMPLATE_REGISTRY
+from utils.group_provisioning import GroupProvisioner, ca_group_definitions
+from utils.jobs import RUNNING, JobCancelled, JobContext, configure_job_runner, get_job_runner, job_handler, stream_job
 from config import get_config
 from session_manager import SessionManager
+from graph_client import BATCH_LIMIT, configure_graph_client, get_graph_client, odata_params, tenant_id_from_token, token_identity
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -66,15 +79,100 @@ app.config['WTF_CSRF_CHECK_DEFAULT'] = False
 
 csrf = CSRFProtect(app)
 
-# Initialize session manager (Redis or in-memory fallback)
-session_manager = SessionManager()
+# Initialize session manager (Redis or in-memory fallback; Redis connects on first use)
+session_manager = SessionManager(
+    max_connections=app.config.get('REDIS_MAX_CONNECTIONS', 20),
+    socket_timeout=app.config.get('REDIS_SOCKET_TIMEOUT', 10),
+    session_ttl=int(app.config['PERMANENT_SESSION_LIFETIME'].total_seconds()),
+    memory_maxsize=app.config.get('SESSION_STORE_SIZE', 10000),
+    sweep_interval=app.config.get('SESSION_SWEEP_INTERVAL', 60),
+    near_cache_ttl=app.config.get('SESSION_NEAR_CACHE_TTL', 0),
+    near_cache_size=app.config.get('SESSION_NEAR_CACHE_SIZE', 1000)
+)
+
+# Authenticated client-credential managers, reused across requests (token caches persisted via SessionManager)
+manager_pool = ManagerPool(session_manager=session_manager)
+
+# Per-principal policy list snapshots (short TTL, write-through on changes made by this app)
+policy_cache = PolicyCache(ttl=app.config.get('POLICY_CACHE_TTL', 60))
 
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Initialize AI Assistant
-ai_assistant = None
-if app.config.get('AI_ENABLED'):
+# Everything above is created without network I/O, so the module can be
+# imported once in the gunicorn master (--preload) and shared with the
+# workers. Network clients (Redis, Graph connection pool, AI client) are
+# created by init_worker() in each worker after fork.
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+def init_worker():
+    """Create this process's network clients; runs once per process (after fork)"""
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    with _worker_lock:
+        if _worker_pid == os.getpid():
+            return
+        redis_client = session_manager.redis_client if session_manager.use_redis else None
+        
+        # Per-tenant Graph rate governor (shared across workers through Redis when available)
+        rate_governor = configure_rate_governor(
+            max_rate=app.config.get('GRAPH_RATE_LIMIT'),
+            min_rate=app.config.get('GRAPH_RATE_MIN'),
+            burst=app.config.get('GRAPH_RATE_BURST'),
+            max_wait=app.config.get('GRAPH_RATE_MAX_WAIT'),
+            redis_client=redis_client
+        )
+        
+        # Configure the shared Graph transport (pooled keep-alive connections per worker)
+        configure_graph_client(
+            base_url=app.config['GRAPH_ENDPOINT'],
+            pool_size=app.config.get('GRAPH_POOL_SIZE'),
+            connect_timeout=app.config.get('GRAPH_CONNECT_TIMEOUT'),
+            read_timeout=app.config.get('GRAPH_READ_TIMEOUT'),
+            throttle_retries=app.config.get('GRAPH_THROTTLE_RETRIES'),
+            batch_concurrency=app.config.get('GRAPH_BATCH_CONCURRENCY'),
+            governor=rate_governor
+        )
+        
+        # Shared directory lookup cache (per-worker LRU, plus Redis tier when available)
+        configure_directory_cache(
+            maxsize=app.config.get('DIRECTORY_CACHE_SIZE'),
+            ttl=app.config.get('DIRECTORY_CACHE_TTL'),
+            negative_ttl=app.config.get('DIRECTORY_CACHE_NEGATIVE_TTL'),
+            redis_client=redis_client
+        )
+        
+        # Background jobs (thread pool per worker; job state and the optional
+        # queue are shared through Redis when available)
+        configure_job_runner(
+            max_workers=app.config.get('JOB_WORKERS'),
+            ttl=app.config.get('JOB_TTL'),
+            redis_client=redis_client,
+            use_queue=app.config.get('JOB_QUEUE') == 'redis',
+            single_process=app.config.get('WEB_WORKER_PROCESSES', 1) == 1
+        )
+        
+        _worker_pid = os.getpid()
+
+@app.before_request
+def ensure_worker_initialized():
+    """Initialize per-worker clients on the first request (when no post_fork hook ran)"""
+    init_worker()
+
+# AI Assistant (its SDK client is created on first use in each worker)
+_ai_assistant = None
+_ai_assistant_pid = None
+
+def get_ai_assistant() -> Optional[PolicyAIAssistant]:
+    """Return this process's AI assistant, or None when AI features are disabled"""
+    global _ai_assistant, _ai_assistant_pid
+    if not app.config.get('AI_ENABLED'):
+        return None
+    if _ai_assistant_pid == os.getpid():
+        return _ai_assistant
+    _ai_assistant, _ai_assistant_pid = None, os.getpid()
     try:
         # Pass only needed config to avoid Flask config object issues
         ai_config = {
@@ -88,11 +186,13 @@ if app.config.get('AI_ENABLED'):
             'OPENAI_MODEL': app.config.get('OPENAI_MODEL'),
             'LOCAL_MODEL': app.config.get('LOCAL_MODEL')
         }
-        ai_assistant = PolicyAIAssistant(ai_config)
+        _ai_assistant = PolicyAIAssistant(ai_config)
     except Exception as e:
         logger.warning(f"⚠️  Failed to initialize AI Assistant: {e}")
         logger.info("   AI features will be disabled")
-else:
+    return _ai_assistant
+
+if not app.config.get('AI_ENABLED'):
     logger.info("ℹ️  AI features disabled (set AI_ENABLED=true in .env to enable)")
 
 # Add security headers middleware
@@ -152,44 +252,279 @@ def get_session_id() -> str:
         session['id'] = secrets.token_hex(16)
     return session['id']
 
+def session_state(session_id: str) -> dict:
+    """Stored state of a session, read from SessionManager at most once per request
+    
+    Returns {'manager': ..., 'ai_stats': ...}. Outside a request (background
+    jobs) every call reads the store.
+    """
+    if not has_request_context():
+        return session_manager.get_session(session_id)
+    states = g.setdefault('session_states', {})
+    if session_id not in states:
+        states[session_id] = session_manager.get_session(session_id)
+    return states[session_id]
+
+def forget_session_state(session_id: str):
+    """Drop the request's copy of a session's state after writing it"""
+    if has_request_context():
+        g.setdefault('session_states', {}).pop(session_id, None)
+
 def get_ai_stats() -> dict:
     """Get or initialize AI usage stats for current session"""
-    session_id = get_session_id()
-    stats = session_manager.get_ai_stats(session_id)
+    stats = session_state(get_session_id())['ai_stats']
     
     if not stats:
         stats = {
             'explanations': 0,
             'tokens_used': 0,
             'total_cost': 0.0,
-            'response_times': []
+            'response_time_total': 0.0
         }
     
     return stats
 
 def update_ai_stats(tokens_input: int, tokens_output: int, response_time: float):
-    """Update AI usage statistics"""
+    """Update AI usage statistics (atomic increments, one round trip)"""
     session_id = get_session_id()
-    stats = get_ai_stats()
-    stats['explanations'] += 1
-    stats['tokens_used'] += tokens_input + tokens_output
     
     # Azure OpenAI gpt-4o-mini pricing (as of 2024)
     # Input: $0.15 per 1M tokens, Output: $0.60 per 1M tokens
     input_cost = (tokens_input / 1_000_000) * 0.15
     output_cost = (tokens_output / 1_000_000) * 0.60
-    stats['total_cost'] += input_cost + output_cost
-    
-    stats['response_times'].append(response_time)
     
-    session_manager.set_ai_stats(session_id, stats)
+    stats = session_manager.record_ai_usage(
+        session_id,
+        tokens=tokens_input + tokens_output,
+        cost=input_cost + output_cost,
+        response_time=response_time
+    )
+    if not stats:
+        forget_session_state(session_id)
+        return get_ai_stats()
+    # Keep the request's copy current without reading the store again
+    states = g.setdefault('session_states', {})
+    if session_id in states:
+        states[session_id] = {**states[session_id], 'ai_stats': stats}
     return stats
 
+def average_response_time(stats: dict) -> float:
+    """Mean AI response time in seconds (0 before the first response)"""
+    if not stats['explanations']:
+        return 0
+    return round(stats['response_time_total'] / stats['explanations'], 2)
+
+def graph_error_status(error: requests.exceptions.RequestException, default: int = 500) -> int:
+    """HTTP status of a failed Graph call, or a default for transport errors"""
+    response = getattr(error, 'response', None)
+    return response.status_code if response is not None else default
+
+def stream_collection(items, key: str, **fields) -> Response:
+    """
+    Stream paged Graph results as {"success": true, <key>: [...], "count": n}.
+    
+    Extra keyword arguments are written as top-level fields before the list.
+    The first item (and so the first page) is fetched before the response
+    starts so that auth or permission errors still surface as a normal error
+    status. Later pages are written as they arrive, so the full collection is
+    never held in memory.
+    """
+    first = list(itertools.islice(items, 1))
+    
+    def generate():
+        count = 0
+        yield '{"success": true, ' + ''.join(f'"{name}": {json.dumps(value)}, ' for name, value in fields.items()) + f'"{key}": ['
+        try:
+            for item in itertools.chain(first, items):
+                yield (',' if count else '') + json.dumps(item)
+                count += 1
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Paging stopped after {count} items: {e}")
+            yield f'], "count": {count}, "truncated": true}}'
+            return
+        yield f'], "count": {count}}}'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
 def get_manager():
-    """Get manager for current session"""
-    session_id = get_session_id()
-    manager_data = session_manager.get_manager(session_id)
-    return manager_data
+    """Get manager for current session
+    
+    The session only stores the credentials; the authenticated manager (with
+    its token cache) comes from the per-worker pool.
+    """
+    return manager_for_session(get_session_id())
+
+def manager_for_session(session_id: str):
+    """Pooled manager for a session's stored credentials (also usable outside a request)"""
+    manager_data = session_state(session_id)['manager']
+    if not manager_data:
+        return None
+    return manager_pool.get(
+        manager_data['tenant_id'],
+        manager_data['client_id'],
+        manager_data['client_secret'],
+        verify_ssl=manager_data.get('verify_ssl', True)
+    )
+
+def get_graph_token() -> Optional[str]:
+    """Bearer token for the current session (delegated token or app-only manager token)"""
+    if session.get('auth_method') == 'delegated' and session.get('access_token'):
+        return session['access_token']
+    manager = get_manager()
+    return getattr(manager, 'access_token', None) if manager else None
+
+def policy_names_if_requested(policies) -> dict:
+    """Return {'names': {id: displayName}} for the given policies when ?names=true"""
+    if request.args.get('names', 'false').lower() != 'true':
+        return {}
+    token = get_graph_token()
+    if not token:
+        return {}
+    return {'names': DirectoryResolver(token, verify_ssl=get_verify_ssl()).resolve_policies(policies)}
+
+def cached_policies(access_token, fetch, refresh: bool = False, fields=None) -> list:
+    """All policies visible to the token's principal, from the snapshot cache when fresh
+    
+    fetch is only called on a miss (or refresh) and must return every policy
+    with the given fields (None = all fields); its Graph errors propagate to
+    the caller.
+    """
+    identity = token_identity(access_token)
+    if identity is None:
+        return list(fetch())
+    return policy_cache.get_policies(identity, fetch, refresh=refresh, fields=fields)
+
+def fetch_delegated_policies(access_token, top: Optional[int] = None, select=None):
+    """Lazily iterate every policy with a delegated token (all pages)"""
+    return get_graph_client().iter_values(
+        'https://graph.microsoft.com/v1.0/identity/conditionalAccess/policies',
+        params=odata_params(top=top, select=select),
+        headers={
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        },
+        verify=get_verify_ssl()
+    )
+
+def delegated_policies(access_token, refresh: bool = False) -> list:
+    """Policy summaries (SUMMARY_FIELDS) for a delegated session (cached)"""
+    return cached_policies(access_token, policy_fetcher(access_token), refresh, SUMMARY_FIELDS)
+
+def manager_policies(manager, refresh: bool = False) -> list:
+    """Policy summaries (SUMMARY_FIELDS) for a client-credentials session (cached)"""
+    return cached_policies(manager.get_access_token(), policy_fetcher(None, manager), refresh, SUMMARY_FIELDS)
+
+def query_policies(access_token, fetch, refresh: bool = False, fields=None, **criteria):
+    """Filter, sort and page the policy list on the server (see PolicyCache.query)
+    
+    Returns:
+        (policies on the requested page, number of matching policies)
+    """
+    identity = token_identity(access_token)
+    if identity is None:
+        return query_snapshot(fetch(), **criteria)
+    return policy_cache.query(identity, fetch, refresh=refresh, fields=fields, **criteria)
+
+def policy_query_criteria(args) -> dict:
+    """Parse state/search/sort/order/offset/limit query parameters
+    
+    Raises:
+        ValueError: If a parameter is invalid
+    """
+    sort = args.get('sort') or 'displayName'
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_FIELDS)}")
+    order = (args.get('order') or 'asc').lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be 'asc' or 'desc'")
+    offset = int(args.get('offset') or 0)
+    limit = int(args.get('limit') or 50)
+    if offset < 0 or not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"offset must be >= 0 and limit between 1 and {MAX_PAGE_SIZE}")
+    states = {state for state in (args.get('state') or '').split(',') if state}
+    return {
+        'states': states or None,
+        'search': (args.get('search') or '').strip() or None,
+        'sort': sort,
+        'descending': order == 'desc',
+        'offset': offset,
+        'limit': limit
+    }
+
+def policy_fetcher(access_token, manager=None, fields=SUMMARY_FIELDS, top: Optional[int] = None) -> Callable:
+    """Callable returning every policy for the session (used on policy cache misses)
+    
+    Only the given fields are requested from Graph ($select); None fetches
+    full policies.
+    """
+    select = list(fields) if fields else None
+    if manager is not None:
+        return lambda: manager.iter_policies(top=top, select=select)
+    return lambda: fetch_delegated_policies(access_token, top=top, select=select)
+
+def existing_policy_names(access_token, fetch) -> set:
+    """Normalized display names (name_key) of every policy in the tenant"""
+    identity = token_identity(access_token)
+    if identity is None:
+        return {name_key(p.get('displayName')) for p in fetch()}
+    return policy_cache.policy_names(identity, fetch)
+
+def claim_policy_name(access_token, fetch, policy_name) -> Optional[str]:
+    """
+    Look a display name up in the policy name index (case-insensitive) and
+    reserve it until the end of the request, so two concurrent creates of the
+    same name cannot both pass the duplicate check.
+    
+    Returns:
+        None if the name is free, the existing policy's ID, or NAME_PENDING
+        while another request is creating it
+    """
+    identity = token_identity(access_token)
+    if identity is None:
+        key = name_key(policy_name)
+        existing = next((p for p in fetch() if name_key(p.get('displayName')) == key), None)
+        return existing.get('id') if existing else None
+    
+    duplicate_id = policy_cache.claim_name(identity, policy_name, fetch)
+    if duplicate_id is None:
+        g.setdefault('policy_name_claims', []).append((identity[0], policy_name))
+    return duplicate_id
+
+def policy_name_claim_hooks(access_token, fetch):
+    """claim/release callables for DeployEngine backed by the shared name index"""
+    identity = token_identity(access_token)
+    if identity is None:
+        return None, None
+    claim = lambda policy_name: policy_cache.claim_name(identity, policy_name, fetch) is None
+    release = lambda policy_name: policy_cache.release_name(identity[0], policy_name)
+    return claim, release
+
+def duplicate_policy_response(policy_name, duplicate_id, hint):
+    """409 response for a create whose display name is taken"""
+    if duplicate_id == NAME_PENDING:
+        error = f'A policy with the name "{policy_name}" is already being created.'
+        duplicate_id = None
+    else:
+        error = f'A policy with the name "{policy_name}" already exists. {hint}'
+    return jsonify({
+        'success': False,
+        'error': error,
+        'duplicate_policy_id': duplicate_id
+    }), 409  # 409 Conflict
+
+@app.teardown_request
+def release_policy_name_claims(exc=None):
+    """Release display names reserved by claim_policy_name during the request"""
+    for tenant_id, policy_name in g.pop('policy_name_claims', []):
+        policy_cache.release_name(tenant_id, policy_name)
+
+def remember_policy(access_token, policy):
+    """Write a policy created or updated by this app through to the policy cache"""
+    policy_cache.upsert(tenant_id_from_token(access_token), policy)
+
+def forget_policies(access_token, policy_ids):
+    """Remove policies deleted by this app from the policy cache"""
+    policy_cache.remove(tenant_id_from_token(access_token), policy_ids)
 
 def set_manager(manager):
     """Store manager for current session"""
@@ -205,6 +540,93 @@ def set_manager(manager):
         session_manager.set_manager(session_id, manager_data)
     else:
         session_manager.set_manager(session_id, None)
+    forget_session_state(session_id)
+
+def job_auth() -> Optional[dict]:
+    """Credentials a background job needs to act for the current session
+    
+    Delegated sessions pass their access token; client-credential sessions
+    pass the session ID and the job takes the manager from the pool.
+    """
+    if session.get('auth_method') == 'delegated' and session.get('access_token'):
+        return {'access_token': session['access_token']}
+    session_id = get_session_id()
+    if session_state(session_id)['manager']:
+        return {'session_id': session_id}
+    return None
+
+def job_credentials(auth: dict):
+    """(access_token, manager) for the output of job_auth(); manager is None for delegated auth"""
+    if auth.get('access_token'):
+        return auth['access_token'], None
+    manager = manager_for_session(auth['session_id'])
+    if not manager:
+        raise RuntimeError('Not connected')
+    return manager.get_access_token(), manager
+
+def background_requested() -> bool:
+    """Whether the client asked for a background job (?background=true or "background": true)"""
+    if request.args.get('background', 'false').lower() == 'true':
+        return True
+    body = request.get_json(silent=True)
+    return isinstance(body, dict) and body.get('background') is True
+
+def wants_background() -> bool:
+    """Whether to run this request as a background job
+    
+    Only when asked for and when every request can look the job up: its
+    state is in Redis, or a single process serves the app. Otherwise the
+    follow-up /api/jobs requests may reach a worker that does not know it.
+    """
+    return background_requested() and get_job_runner().shared_state
+
+def submit_job(kind: str, total: Optional[int] = None, **params):
+    """Start a background job for the current session; 202 with its ID and status URL"""
+    job = get_job_runner().submit(kind, get_session_id(), params, total=total)
+    return jsonify({
+        'success': True,
+        'job_id': job['id'],
+        'status_url': url_for('get_job', job_id=job['id']),
+        'job': job
+    }), 202
+
+def job_result_response(result: dict):
+    """Response for a job handler run inline (500 when it reports a failure)
+    
+    A client that asked for a background job gets "background": false (job
+    state is not reachable from every worker).
+    """
+    if background_requested():
+        result = {**result, 'background': False}
+    return jsonify(result), (200 if result.get('success', True) else 500)
+
+def job_stream_response(handler, total: Optional[int] = None, **params) -> Response:
+    """Run a job handler for a background request and stream its events (NDJSON)
+    
+    Used when job state is not reachable from every worker, so the progress
+    goes out with the response instead of through /api/jobs. The first line
+    is {"type": "job", "job": {"status": "running", "total": n}}, then one
+    line per job event as it happens, and finally the 'done' event with the
+    status, result and error. A heartbeat line is sent after 15 seconds of
+    silence so proxies keep the connection open; if the client goes away,
+    the job is cancelled at its next check.
+    """
+    def generate():
+        yield json.dumps({'type': 'job', 'job': {'status': RUNNING, 'total': total}}) + '\n'
+        for event in stream_job(handler, params, label=handler.__name__):
+            yield json.dumps(event if event is not None else {'type': 'heartbeat'}) + '\n'
+    
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def report_throttling(job: JobContext, access_token):
+    """Context manager recording Graph throttling of the token's tenant as 'throttled' job events"""
+    return get_rate_governor().watch(
+        tenant_id_from_token(access_token),
+        lambda retry_after: job.event('throttled', retry_after=round(retry_after, 2))
+    )
 
 @app.route('/')
 def index():
@@ -286,42 +708,54 @@ def setup_azure():
                 'manual_guide': '/docs/QUICK_SETUP.md'
             }), 400
         
-        # Run the PowerShell script
-        logger.info("Running Azure App Registration script...")
+        if wants_background():
+            return submit_job('azure_setup', script_path=str(script_path))
+        if background_requested():
+            return job_stream_response(run_azure_setup, script_path=str(script_path))
+        return job_result_response(run_azure_setup(JobContext(), str(script_path)))
+        
+    except Exception as e:
+        logger.error(f"Azure setup error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'manual_guide': '/docs/QUICK_SETUP.md'
+        }), 500
+
+@job_handler('azure_setup')
+def run_azure_setup(job: JobContext, script_path: str) -> dict:
+    """Run the App Registration script (up to 5 minutes); inline or as a background job"""
+    import subprocess
+    
+    # Run the PowerShell script
+    logger.info("Running Azure App Registration script...")
+    job.progress(message='Running App Registration script')
+    try:
         result = subprocess.run(
-            ['powershell.exe', '-ExecutionPolicy', 'Bypass', '-File', str(script_path)],
+            ['powershell.exe', '-ExecutionPolicy', 'Bypass', '-File', script_path],
             capture_output=True,
             text=True,
             timeout=300
         )
-        
-        if result.returncode == 0:
-            return jsonify({
-                'success': True,
-                'message': 'Azure App Registration created successfully!',
-                'next_steps': 'Please restart the Flask app to use the new configuration.'
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Script execution failed',
-                'details': result.stderr,
-                'manual_guide': '/docs/QUICK_SETUP.md'
-            }), 500
-            
     except subprocess.TimeoutExpired:
-        return jsonify({
+        return {
             'success': False,
             'error': 'Setup timed out (5 minutes)',
             'manual_guide': '/docs/QUICK_SETUP.md'
-        }), 500
-    except Exception as e:
-        logger.error(f"Azure setup error: {e}")
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'manual_guide': '/docs/QUICK_SETUP.md'
-        }), 500
+        }
+    
+    if result.returncode == 0:
+        return {
+            'success': True,
+            'message': 'Azure App Registration created successfully!',
+            'next_steps': 'Please restart the Flask app to use the new configuration.'
+        }
+    return {
+        'success': False,
+        'error': 'Script execution failed',
+        'details': result.stderr,
+        'manual_guide': '/docs/QUICK_SETUP.md'
+    }
 
 @app.route('/api/auth/token', methods=['POST'])
 def receive_token():
@@ -337,23 +771,14 @@ def receive_token():
         session['access_token'] = access_token
         session['auth_method'] = 'delegated'
         
-        # Test the token by getting policies
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.get(
-            f"{app.config['GRAPH_ENDPOINT']}/identity/conditionalAccess/policies",
-            headers=headers,
-            verify=get_verify_ssl()
-        )
-        
-        if response.status_code == 200:
-            policies = response.json().get('value', [])
-            return jsonify({'success': True, 'count': len(policies)})
-        else:
+        # Test the token by getting policies (this also warms the policy cache
+        # for the policies table the UI loads next)
+        try:
+            count = len(delegated_policies(access_token, refresh=True))
+        except requests.exceptions.RequestException:
             return jsonify({'success': False, 'error': 'Unable to retrieve policies'}), 400
+        
+        return jsonify({'success': True, 'count': count})
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -364,8 +789,9 @@ def disconnect():
     try:
         session_id = get_session_id()
         
-        # Clear the manager from session
-        session_manager.set_manager(session_id, None)
+        # Clear the stored manager and AI stats (one key)
+        session_manager.clear_session(session_id)
+        forget_session_state(session_id)
         
         # Clear session data (including access_token for delegated auth)
         session.clear()
@@ -390,24 +816,22 @@ def connect():
         if not all([tenant_id, client_id, client_secret]):
             return jsonify({'success': False, 'error': 'Missing required credentials'}), 400
         
-        # Create manager
-        manager = ConditionalAccessManager(
-            tenant_id=tenant_id,
-            client_id=client_id,
-            client_secret=client_secret,
-            verify_ssl=verify_ssl
-        )
+        # Get an authenticated manager (reused from the pool when possible)
+        manager = manager_pool.get(tenant_id, client_id, client_secret, verify_ssl=verify_ssl)
         
-        # Authenticate first
-        if not manager.authenticate():
+        if not manager:
             logger.warning(f"Authentication failed for tenant {tenant_id}")
             return jsonify({
                 'success': False, 
                 'error': 'Authentication failed. Check your credentials.'
             }), 401
         
-        # Test connection by getting policies
-        policies = manager.list_policies()
+        # Test connection by getting policies (warms the policy cache)
+        try:
+            policies = manager_policies(manager, refresh=True)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Could not list policies for tenant {tenant_id}: {e}")
+            policies = []
         
         if policies is None or len(policies) == 0:
             # Check if it's a permissions issue
@@ -448,46 +872,96 @@ def connect():
 
 @app.route('/api/policies', methods=['GET'])
 def list_policies():
-    """Get all policies - supports both client credentials and delegated auth"""
+    """Get all policies (all pages) - supports both client credentials and delegated auth
+    
+    Policies are served from a short-lived per-principal snapshot; changes made
+    through this app are applied to it immediately.
+    
+    Query parameters:
+        view: 'summary' for compact table rows ({"columns": [...], "rows": [[...]]})
+              with only SUMMARY_FIELDS fetched from Graph; open a row through
+              /api/policies/<id> for the full policy
+        top: Graph page size ($top) when the list has to be fetched
+        select: Comma-separated fields to return ($select, also sent to Graph)
+        stream: 'true' to stream pages into the response as they arrive
+        names: 'true' to add an ID -> display name map for every referenced object
+        refresh: 'true' to bypass the snapshot and re-read the list from Graph
+        state, search, sort, order, offset, limit: Return one page of the list,
+              filtered by state (comma-separated) and a case-insensitive name/ID
+              substring, sorted by sort (asc/desc). The response then also has
+              total, offset and limit; stream is ignored.
+    """
     try:
+        top = request.args.get('top', type=int)
+        summary = request.args.get('view') == 'summary'
+        select = SUMMARY_FIELDS if summary else request.args.get('select')
+        fields = select.split(',') if isinstance(select, str) else select
+        stream = request.args.get('stream', 'false').lower() == 'true'
+        refresh = request.args.get('refresh', 'false').lower() == 'true'
+        
         # Check if using delegated auth
         if session.get('auth_method') == 'delegated' and session.get('access_token'):
             # Use delegated token directly
-            headers = {
-                'Authorization': f'Bearer {session["access_token"]}',
-                'Content-Type': 'application/json'
-            }
-            
-            response = requests.get(
-                'https://graph.microsoft.com/v1.0/identity/conditionalAccess/policies',
-                headers=headers,
-                verify=get_verify_ssl()
-            )
-            
-            if response.status_code == 200:
-                policies = response.json().get('value', [])
-                return jsonify({
+            access_token = session['access_token']
+            fetch = policy_fetcher(access_token, fields=fields, top=top)
+        else:
+            # Otherwise use client credentials manager
+            manager = get_manager()
+            if not manager:
+                return jsonify({'success': False, 'error': 'Not connected'}), 401
+            access_token = manager.get_access_token()
+            fetch = policy_fetcher(access_token, manager, fields=fields, top=top)
+        
+        shape = summary_row if summary else (lambda policy: project_policy(policy, fields))
+        key, extra = ('rows', {'view': 'summary', 'columns': list(SUMMARY_FIELDS)}) if summary else ('policies', {})
+        
+        paged = any(name in request.args for name in ('state', 'search', 'sort', 'order', 'offset', 'limit'))
+        if paged:
+            try:
+                criteria = policy_query_criteria(request.args)
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+        
+        identity = token_identity(access_token)
+        try:
+            if paged:
+                page, total = query_policies(access_token, fetch, refresh, fields, **criteria)
+                return json_response({
                     'success': True,
-                    'policies': policies,
-                    'count': len(policies)
+                    **extra,
+                    key: [shape(p) for p in page],
+                    'count': len(page),
+                    'total': total,
+                    'offset': criteria['offset'],
+                    'limit': criteria['limit']
                 })
-            else:
-                return jsonify({
-                    'success': False, 
-                    'error': f'Failed to retrieve policies: {response.status_code}'
-                }), response.status_code
-        
-        # Otherwise use client credentials manager
-        manager = get_manager()
-        if not manager:
-            return jsonify({'success': False, 'error': 'Not connected'}), 401
+            
+            if stream:
+                cached = None if refresh or identity is None else policy_cache.peek(identity, fields)
+                if cached is not None:
+                    items = iter(cached)
+                elif identity is not None:
+                    items = policy_cache.collecting(identity, fetch(), fields)
+                else:
+                    items = fetch()
+                return stream_collection((shape(p) for p in items), key, **extra)
+            
+            policies = [shape(p) for p in cached_policies(access_token, fetch, refresh, fields)]
+        except requests.exceptions.RequestException as e:
+            status = graph_error_status(e)
+            return jsonify({
+                'success': False, 
+                'error': f'Failed to retrieve policies: {status}'
+            }), status
         
-        policies = manager.list_policies()
+        if summary:
+            return json_response({'success': True, **extra, 'rows': policies, 'count': len(policies)})
         
-        return jsonify({
+        return json_response({
             'success': True,
             'policies': policies,
-            'count': len(policies)
+            'count': len(policies),
+            **policy_names_if_requested(policies)
         })
         
     except Exception as e:
@@ -505,7 +979,7 @@ def get_policy(policy_id):
                 'Content-Type': 'application/json'
             }
             
-            response = requests.get(
+            response = get_graph_client().get(
                 f'https://graph.microsoft.com/v1.0/identity/conditionalAccess/policies/{policy_id}',
                 headers=headers,
                 verify=get_verify_ssl()
@@ -515,7 +989,8 @@ def get_policy(policy_id):
                 policy = response.json()
                 return jsonify({
                     'success': True,
-                    'policy': policy
+                    'policy': policy,
+                    **policy_names_if_requested([policy])
                 })
             else:
                 return jsonify({
@@ -532,7 +1007,8 @@ def get_policy(policy_id):
         
         return jsonify({
             'success': True,
-            'policy': policy
+            'policy': policy,
+            **policy_names_if_requested([policy] if policy else [])
         })
         
     except Exception as e:
@@ -554,24 +1030,16 @@ def create_policy():
             }
             
             # First, check if a policy with the same name already exists
-            check_response = requests.get(
-                'https://graph.microsoft.com/v1.0/identity/conditionalAccess/policies',
-                headers=headers,
-                verify=get_verify_ssl()
-            )
+            try:
+                duplicate_id = claim_policy_name(session['access_token'], policy_fetcher(session['access_token']), policy_name)
+            except requests.exceptions.RequestException as check_error:
+                logger.warning(f"Could not check for duplicate policies: {check_error}")
+                duplicate_id = None
             
-            if check_response.status_code == 200:
-                existing_policies = check_response.json().get('value', [])
-                duplicate = next((p for p in existing_policies if p.get('displayName') == policy_name), None)
-                
-                if duplicate:
-                    return jsonify({
-                        'success': False,
-                        'error': f'A policy with the name "{policy_name}" already exists. Please use a different name or update the existing policy.',
-                        'duplicate_policy_id': duplicate.get('id')
-                    }), 409  # 409 Conflict
+            if duplicate_id:
+                return duplicate_policy_response(policy_name, duplicate_id, 'Please use a different name or update the existing policy.')
             
-            response = requests.post(
+            response = get_graph_client().post(
                 'https://graph.microsoft.com/v1.0/identity/conditionalAccess/policies',
                 headers=headers,
                 json=policy_data,
@@ -580,6 +1048,7 @@ def create_policy():
             
             if response.status_code in [200, 201]:
                 policy = response.json()
+                remember_policy(session['access_token'], policy)
                 logger.info(f"Created policy: {policy_name}")
                 return jsonify({
                     'success': True,
@@ -600,19 +1069,20 @@ def create_policy():
         
         # Check for duplicate policy name with client credentials
         try:
-            existing_policies = manager.list_policies()
-            duplicate = next((p for p in existing_policies if p.get('displayName') == policy_name), None)
+            duplicate_id = claim_policy_name(manager.get_access_token(), policy_fetcher(None, manager), policy_name)
             
-            if duplicate:
-                return jsonify({
-                    'success': False,
-                    'error': f'A policy with the name "{policy_name}" already exists. Please use a different name or update the existing policy.',
-                    'duplicate_policy_id': duplicate.get('id')
-                }), 409  # 409 Conflict
+            if duplicate_id:
+                return duplicate_policy_response(policy_name, duplicate_id, 'Please use a different name or update the existing policy.')
         except Exception as check_error:
             logger.warning(f"Could not check for duplicate policies: {check_error}")
         
         result = manager.create_policy(policy_data)
+        if result is None:
+            return jsonify({
+                'success': False,
+                'error': 'Failed to create policy. Check the policy format and your permissions.'
+            }), 500
+        remember_policy(manager.access_token, result)
         
         return jsonify({
             'success': True,
@@ -638,7 +1108,7 @@ def update_policy(policy_id):
                 'Content-Type': 'application/json'
             }
             
-            response = requests.patch(
+            response = get_graph_client().patch(
                 f'https://graph.microsoft.com/v1.0/identity/conditionalAccess/policies/{policy_id}',
                 headers=headers,
                 json=policy_data,
@@ -647,18 +1117,20 @@ def update_policy(policy_id):
             
             if response.status_code in [200, 204]:
                 # Get updated policy
-                get_response = requests.get(
+                get_response = get_graph_client().get(
                     f'https://graph.microsoft.com/v1.0/identity/conditionalAccess/policies/{policy_id}',
                     headers=headers,
                     verify=get_verify_ssl()
                 )
                 if get_response.status_code == 200:
+                    remember_policy(session['access_token'], get_response.json())
                     return jsonify({
                         'success': True,
                         'policy': get_response.json(),
                         'message': 'Policy updated successfully'
                     })
                 else:
+                    policy_cache.invalidate(tenant_id_from_token(session['access_token']))
                     return jsonify({
                         'success': True,
                         'message': 'Policy updated successfully'
@@ -675,6 +1147,12 @@ def update_policy(policy_id):
             return jsonify({'success': False, 'error': 'Not connected'}), 401
         
         result = manager.update_policy(policy_id, policy_data)
+        if result:
+            updated = manager.get_policy(policy_id)
+            if updated:
+                remember_policy(manager.access_token, updated)
+            else:
+                policy_cache.invalidate(manager.tenant_id)
         
         return jsonify({
             'success': True,
@@ -697,13 +1175,14 @@ def delete_policy(policy_id):
                 'Content-Type': 'application/json'
             }
             
-            response = requests.delete(
+            response = get_graph_client().delete(
                 f'https://graph.microsoft.com/v1.0/identity/conditionalAccess/policies/{policy_id}',
                 headers=headers,
                 verify=get_verify_ssl()
             )
             
             if response.status_code in [200, 204]:
+                forget_policies(session['access_token'], [policy_id])
                 return jsonify({
                     'success': True,
                     'message': 'Policy deleted successfully'
@@ -719,7 +1198,8 @@ def delete_policy(policy_id):
         if not manager:
             return jsonify({'success': False, 'error': 'Not connected'}), 401
         
-        manager.delete_policy(policy_id)
+        if manager.delete_policy(policy_id):
+            forget_policies(manager.access_token, [policy_id])
         
         return jsonify({
             'success': True,
@@ -729,61 +1209,18 @@ def delete_policy(policy_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def enrich_policy_with_group_names(policy, access_token):
-    """Enrich policy JSON with group display names for better AI explanations"""
+def enrich_policy_with_names(policy, access_token):
+    """Enrich policy JSON with display names for every referenced ID for better AI explanations
+    
+    Users, groups, roles, service principals, named locations and applications
+    are resolved in bulk (getByIds / list / $batch), then added next to each ID
+    field as '<field>WithNames' (e.g. includeGroupsWithNames).
+    """
     try:
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
-        # Helper to batch lookup group names
-        def lookup_group_names(group_ids):
-            if not group_ids:
-                return []
-            
-            group_info = []
-            for group_id in group_ids:
-                try:
-                    response = requests.get(
-                        f'https://graph.microsoft.com/v1.0/groups/{group_id}?$select=id,displayName',
-                        headers=headers,
-                        verify=get_verify_ssl(),
-                        timeout=5
-                    )
-                    if response.status_code == 200:
-                        group_data = response.json()
-                        group_info.append({
-                            'id': group_id,
-                            'displayName': group_data.get('displayName', group_id)
-                        })
-                    else:
-                        # Keep ID if lookup fails
-                        group_info.append({
-                            'id': group_id,
-                            'displayName': group_id
-                        })
-                except Exception as e:
-                    logger.warning(f"Failed to lookup group {group_id}: {str(e)}")
-                    group_info.append({
-                        'id': group_id,
-                        'displayName': group_id
-                    })
-            return group_info
-        
-        # Enrich includeGroups and excludeGroups
-        if 'conditions' in policy and 'users' in policy['conditions']:
-            users = policy['conditions']['users']
-            
-            if 'includeGroups' in users and users['includeGroups']:
-                users['includeGroupsWithNames'] = lookup_group_names(users['includeGroups'])
-            
-            if 'excludeGroups' in users and users['excludeGroups']:
-                users['excludeGroupsWithNames'] = lookup_group_names(users['excludeGroups'])
-        
-        return policy
+        names = DirectoryResolver(access_token, verify_ssl=get_verify_ssl()).resolve_policies([policy])
+        return annotate_policy_names(policy, names)
     except Exception as e:
-        logger.warning(f"Failed to enrich policy with group names: {str(e)}")
+        logger.warning(f"Failed to enrich policy with names: {str(e)}")
         return policy  # Return original policy if enrichment fails
 
 @app.route('/api/policies/<policy_id>/explain', methods=['GET'])
@@ -799,7 +1236,7 @@ def explain_policy(policy_id):
             'Content-Type': 'application/json'
         }
         
-        response = requests.get(
+        response = get_graph_client().get(
             f"{app.config['GRAPH_ENDPOINT']}/identity/conditionalAccess/policies/{policy_id}",
             headers=headers,
             verify=get_verify_ssl()
@@ -810,10 +1247,11 @@ def explain_policy(policy_id):
         
         policy = response.json()
         
-        # Enrich policy with group display names for better AI explanations
-        policy = enrich_policy_with_group_names(policy, session.get('access_token'))
+        # Enrich policy with display names for better AI explanations
+        policy = enrich_policy_with_names(policy, session.get('access_token'))
         
         # Get AI explanation
+        ai_assistant = get_ai_assistant()
         if ai_assistant and ai_assistant.ai_enabled:
             import time
             start_time = time.time()
@@ -825,19 +1263,18 @@ def explain_policy(policy_id):
             # Track usage if we got token info (only for real AI responses)
             if explanation.get('ai_enabled') and explanation.get('usage'):
                 usage = explanation['usage']
-                update_ai_stats(
+                stats = update_ai_stats(
                     tokens_input=usage.get('prompt_tokens', 0),
                     tokens_output=usage.get('completion_tokens', 0),
                     response_time=response_time
                 )
                 
-                # Add usage stats to response
-                stats = get_ai_stats()
+                # Add usage stats to response (the update returns the new totals)
                 explanation['session_stats'] = {
                     'total_explanations': stats['explanations'],
                     'total_tokens': stats['tokens_used'],
                     'total_cost': round(stats['total_cost'], 4),
-                    'avg_response_time': round(sum(stats['response_times']) / len(stats['response_times']), 2) if stats['response_times'] else 0
+                    'avg_response_time': average_response_time(stats)
                 }
         else:
             explanation = {
@@ -856,12 +1293,14 @@ def explain_policy(policy_id):
 def get_ai_statistics():
     """Get AI usage statistics for current session"""
     stats = get_ai_stats()
+    ai_assistant = get_ai_assistant()
     
-    return jsonify({
+    # Polled by the UI; unchanged stats are answered with 304 Not Modified
+    return json_response({
         'explanations': stats['explanations'],
         'tokens_used': stats['tokens_used'],
         'total_cost': round(stats['total_cost'], 4),
-        'avg_response_time': round(sum(stats['response_times']) / len(stats['response_times']), 2) if stats['response_times'] else 0,
+        'avg_response_time': average_response_time(stats),
         'ai_enabled': ai_assistant and ai_assistant.ai_enabled if ai_assistant else False
     })
 
@@ -877,265 +1316,182 @@ def get_named_locations():
             'Content-Type': 'application/json'
         }
         
-        response = requests.get(
+        locations_data = get_graph_client().iter_values(
             f"{app.config['GRAPH_ENDPOINT']}/identity/conditionalAccess/namedLocations",
             headers=headers,
             verify=get_verify_ssl()
         )
         
-        if response.status_code != 200:
+        # Normalize different location types (pages are fetched as the loop advances)
+        normalized_locations = []
+        try:
+            for loc in locations_data:
+                loc_type = loc.get('@odata.type', '')
+                
+                if 'ipNamedLocation' in loc_type:
+                    normalized_locations.append({
+                        'id': loc.get('id'),
+                        'displayName': loc.get('displayName'),
+                        'type': 'IP Ranges',
+                        'isTrusted': loc.get('isTrusted', False),
+                        'ipRanges': [r.get('cidrAddress') for r in loc.get('ipRanges', [])],
+                        'countriesAndRegions': [],
+                        'includeUnknownCountriesAndRegions': False
+                    })
+                elif 'countryNamedLocation' in loc_type:
+                    normalized_locations.append({
+                        'id': loc.get('id'),
+                        'displayName': loc.get('displayName'),
+                        'type': 'Countries/Regions',
+                        'isTrusted': False,
+                        'ipRanges': [],
+                        'countriesAndRegions': loc.get('countriesAndRegions', []),
+                        'includeUnknownCountriesAndRegions': loc.get('includeUnknownCountriesAndRegions', False)
+                    })
+                else:
+                    # Unknown type - include anyway
+                    normalized_locations.append({
+                        'id': loc.get('id'),
+                        'displayName': loc.get('displayName'),
+                        'type': 'Unknown',
+                        'isTrusted': loc.get('isTrusted', False),
+                        'ipRanges': [],
+                        'countriesAndRegions': [],
+                        'includeUnknownCountriesAndRegions': False
+                    })
+        except requests.exceptions.RequestException as e:
+            status = graph_error_status(e)
             return jsonify({
                 'error': 'Failed to fetch named locations',
-                'status': response.status_code,
-                'details': response.text
-            }), response.status_code
-        
-        locations_data = response.json().get('value', [])
-        
-        # Normalize different location types
-        normalized_locations = []
-        for loc in locations_data:
-            loc_type = loc.get('@odata.type', '')
-            
-            if 'ipNamedLocation' in loc_type:
-                normalized_locations.append({
-                    'id': loc.get('id'),
-                    'displayName': loc.get('displayName'),
-                    'type': 'IP Ranges',
-                    'isTrusted': loc.get('isTrusted', False),
-                    'ipRanges': [r.get('cidrAddress') for r in loc.get('ipRanges', [])],
-                    'countriesAndRegions': [],
-                    'includeUnknownCountriesAndRegions': False
-                })
-            elif 'countryNamedLocation' in loc_type:
-                normalized_locations.append({
-                    'id': loc.get('id'),
-                    'displayName': loc.get('displayName'),
-                    'type': 'Countries/Regions',
-                    'isTrusted': False,
-                    'ipRanges': [],
-                    'countriesAndRegions': loc.get('countriesAndRegions', []),
-                    'includeUnknownCountriesAndRegions': loc.get('includeUnknownCountriesAndRegions', False)
-                })
-            else:
-                # Unknown type - include anyway
-                normalized_locations.append({
-                    'id': loc.get('id'),
-                    'displayName': loc.get('displayName'),
-                    'type': 'Unknown',
-                    'isTrusted': loc.get('isTrusted', False),
-                    'ipRanges': [],
-                    'countriesAndRegions': [],
-                    'includeUnknownCountriesAndRegions': False
-                })
+                'status': status,
+                'details': e.response.text if e.response is not None else str(e)
+            }), status
         
-        return jsonify({'locations': normalized_locations})
+        return json_response({'locations': normalized_locations})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/policies/bulk-delete', methods=['POST'])
 def bulk_delete_policies():
-    """Delete multiple policies - supports both client credentials and delegated auth"""
+    """Delete multiple policies - supports both client credentials and delegated auth
+    
+    Deletes are packed 20 per $batch call with several calls in flight, and
+    throttled deletes are retried with backoff. The response includes one
+    result per policy ID, in request order. With "background": true the
+    deletes run as a job (202 + job ID, see /api/jobs/<id>), or stream their
+    events when job state is not shared (see job_stream_response).
+    """
     try:
         policy_ids = request.json.get('policy_ids', [])
         
-        success_count = 0
-        errors = []
-        
-        # Check if using delegated auth
-        if session.get('auth_method') == 'delegated' and session.get('access_token'):
-            # Use delegated token directly
-            headers = {
-                'Authorization': f'Bearer {session["access_token"]}',
-                'Content-Type': 'application/json'
-            }
-            
-            for policy_id in policy_ids:
-                try:
-                    response = requests.delete(
-                        f'https://graph.microsoft.com/v1.0/identity/conditionalAccess/policies/{policy_id}',
-                        headers=headers,
-                        verify=get_verify_ssl()
-                    )
-                    
-                    if response.status_code in [200, 204]:
-                        success_count += 1
-                    else:
-                        errors.append(f"Failed to delete {policy_id}: {response.status_code}")
-                except Exception as e:
-                    errors.append(f"Failed to delete {policy_id}: {str(e)}")
-        else:
-            # Use client credentials manager
-            manager = get_manager()
-            if not manager:
-                return jsonify({'success': False, 'error': 'Not connected'}), 401
-            
-            for policy_id in policy_ids:
-                try:
-                    manager.delete_policy(policy_id)
-                    success_count += 1
-                except Exception as e:
-                    errors.append(f"Failed to delete {policy_id}: {str(e)}")
+        auth = job_auth()
+        if auth is None:
+            return jsonify({'success': False, 'error': 'Not connected'}), 401
         
-        return jsonify({
-            'success': True,
-            'deleted': success_count,
-            'total': len(policy_ids),
-            'errors': errors,
-            'message': f'Deleted {success_count} of {len(policy_ids)} policies'
-        })
+        if wants_background():
+            return submit_job('bulk_delete', total=len(policy_ids), auth=auth, policy_ids=policy_ids)
+        if background_requested():
+            return job_stream_response(run_bulk_delete, total=len(policy_ids), auth=auth, policy_ids=policy_ids)
+        return job_result_response(run_bulk_delete(JobContext(), auth, policy_ids))
         
+    except requests.exceptions.RequestException as e:
+        return jsonify({'success': False, 'error': str(e)}), graph_error_status(e)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def resolve_group_names_to_ids(policy_data, access_token):
-    """Replace group names with Object IDs in policy data"""
-    import copy
-    policy = copy.deepcopy(policy_data)
-    
+@job_handler('bulk_delete')
+def run_bulk_delete(job: JobContext, auth: dict, policy_ids: list) -> dict:
+    """Delete policies in rounds of concurrent $batch calls, reporting each round's results"""
+    access_token, manager = job_credentials(auth)
+    graph = manager.graph if manager else get_graph_client()
     headers = {
         'Authorization': f'Bearer {access_token}',
         'Content-Type': 'application/json'
     }
     
-    # Helper to resolve a list of group names
-    def resolve_groups(group_list):
-        if not group_list:
-            return []
-        
-        resolved = []
-        for group_name in group_list:
-            # If already a GUID, keep it
-            if len(group_name) == 36 and '-' in group_name:
-                resolved.append(group_name)
-                continue
-            
-            # Look up group by name
-            try:
-                response = requests.get(
-                    f'https://graph.microsoft.com/v1.0/groups?$filter=displayName eq \'{group_name}\'&$select=id,displayName',
-                    headers=headers,
-                    verify=get_verify_ssl()
-                )
-                if response.status_code == 200:
-                    groups = response.json().get('value', [])
-                    if groups:
-                        resolved.append(groups[0]['id'])
-                    else:
-                        print(f"⚠️  Group not found: {group_name}")
-                        resolved.append(group_name)  # Keep original if not found
+    # One round is as many $batch calls as are sent in parallel, so splitting
+    # the IDs costs no throughput but gives a progress and cancellation point
+    round_size = BATCH_LIMIT * max(1, graph.batch_concurrency)
+    results = []
+    with report_throttling(job, access_token):
+        for start in range(0, len(policy_ids), round_size):
+            if job.cancelled:
+                break
+            chunk = policy_ids[start:start + round_size]
+            job.event('started', ids=chunk)
+            if manager:
+                chunk_results = manager.delete_policies(chunk)
+            else:
+                chunk_results = batch_delete_policies(graph, chunk, headers=headers, verify=get_verify_ssl())
+            forget_policies(access_token, [r['id'] for r in chunk_results if r['success']])
+            results.extend(chunk_results)
+            job.add_results(chunk_results, done=len(results))
+            for r in chunk_results:
+                if r['success']:
+                    job.event('deleted', id=r['id'], done=len(results), total=len(policy_ids))
                 else:
-                    print(f"⚠️  Failed to lookup group {group_name}: {response.status_code}")
-                    resolved.append(group_name)
-            except Exception as e:
-                print(f"⚠️  Error looking up group {group_name}: {str(e)}")
-                resolved.append(group_name)
-        
-        return resolved
-    
-    # Resolve groups in conditions.users
-    if 'conditions' in policy and 'users' in policy['conditions']:
-        users = policy['conditions']['users']
-        
-        if 'includeGroups' in users:
-            users['includeGroups'] = resolve_groups(users['includeGroups'])
-        
-        if 'excludeGroups' in users:
-            users['excludeGroups'] = resolve_groups(users['excludeGroups'])
-    
-    return policy
-
-def validate_and_clean_applications(policy_data, access_token):
-    """Validate and remove invalid application IDs from policy before deployment"""
-    import copy
-    policy = copy.deepcopy(policy_data)
+                    job.event('failed', id=r['id'], error=r['error'], done=len(results), total=len(policy_ids))
     
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json'
-    }
+    success_count = sum(1 for r in results if r['success'])
+    errors = [f"Failed to delete {r['id']}: {r['error']}" for r in results if not r['success']]
     
-    # Well-known Microsoft apps that always exist
-    well_known_apps = {
-        "00000003-0000-0000-c000-000000000000": "Microsoft Graph",
-        "0000000a-0000-0000-c000-000000000000": "Microsoft Intune (MAM/MDM)"
+    payload = {
+        'success': True,
+        'deleted': success_count,
+        'total': len(policy_ids),
+        'errors': errors,
+        'results': results,
+        'message': f'Deleted {success_count} of {len(policy_ids)} policies'
     }
+    if len(results) < len(policy_ids):
+        raise JobCancelled(payload)
+    return payload
+
+def resolve_group_names_to_ids(policy_data, access_token, resolver: Optional[GroupNameResolver] = None):
+    """Replace group names with Object IDs in policy data
     
-    def validate_app_id(app_id):
-        """Check if an application exists in the tenant"""
-        try:
-            if app_id in well_known_apps:
-                return True
-            
-            # Check if service principal exists
-            response = requests.get(
-                f'https://graph.microsoft.com/v1.0/servicePrincipals?$filter=appId eq \'{app_id}\'',
-                headers=headers,
-                verify=get_verify_ssl()
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                exists = len(result.get("value", [])) > 0
-                if not exists:
-                    print(f"⚠️  Application {app_id} not found in tenant")
-                return exists
-            else:
-                print(f"⚠️  Failed to validate app {app_id}: {response.status_code}")
-                return False
-        except Exception as e:
-            print(f"❌ Error validating app {app_id}: {e}")
-            return False
-    
-    try:
-        exclude_apps = policy.get("conditions", {}).get("applications", {}).get("excludeApplications", [])
-        
-        if exclude_apps:
-            print(f"🔍 Validating {len(exclude_apps)} excluded applications...")
-            valid_apps = []
-            
-            for app_id in exclude_apps:
-                if validate_app_id(app_id):
-                    valid_apps.append(app_id)
-                else:
-                    print(f"   ⚠️  Removing invalid app: {app_id}")
-            
-            if valid_apps:
-                policy["conditions"]["applications"]["excludeApplications"] = valid_apps
-                print(f"   ✅ Kept {len(valid_apps)} valid excluded applications")
-            else:
-                # Remove excludeApplications key if no valid apps remain
-                del policy["conditions"]["applications"]["excludeApplications"]
-                print(f"   ℹ️  Removed excludeApplications (no valid apps)")
+    When deploying several policies, pass one GroupNameResolver that has
+    already been prefetched with all of them, so every distinct group name
+    is looked up once for the whole deployment.
+    """
+    if resolver is None:
+        resolver = GroupNameResolver(access_token, verify_ssl=get_verify_ssl())
+        resolver.prefetch([policy_data])
+    return resolver.resolve_policy(policy_data)
+
+def validate_and_clean_applications(policy_data, access_token, validator: Optional[ApplicationValidator] = None):
+    """Validate and remove invalid application IDs from policy before deployment
     
-    except Exception as e:
-        print(f"⚠️  Error cleaning policy applications: {e}")
+    When deploying several policies, pass one ApplicationValidator that has
+    already been prefetched with all of them, so each app ID is checked once
+    (in chunked 'appId in (...)' queries) for the whole deployment.
+    """
+    if validator is None:
+        validator = ApplicationValidator(access_token, verify_ssl=get_verify_ssl())
+        validator.prefetch([policy_data])
+    return validator.clean_policy(policy_data)
+
+def build_templates_payload():
+    """The /api/templates response body"""
+    templates = [entry.summary() for entry in TEMPLATE_REGISTRY.entries]
     
-    return policy
+    return {
+        'success': True,
+        'templates': templates,
+        'count': len(templates),
+        'categories': list(TEMPLATE_REGISTRY.categories)
+    }
+
+# The template library only changes between deploys: serialize and compress it once
+with app.app_context():
+    templates_body = CachedBody(serialize_json(build_templates_payload()), precompress=True)
 
 @app.route('/api/templates', methods=['GET'])
 def list_templates():
-    """Get all policy templates"""
+    """Get all policy templates (precomputed, with ETag and compression)"""
     try:
-        templates = []
-        
-        for category, category_templates in POLICY_TEMPLATES.items():
-            for template_name, template in category_templates.items():
-                templates.append({
-                    'category': category,
-                    'name': template_name,
-                    'display_name': template.get('displayName', template_name),
-                    'state': template.get('state', 'Unknown'),
-                    'template': template
-                })
-        
-        return jsonify({
-            'success': True,
-            'templates': templates,
-            'count': len(templates),
-            'categories': list(POLICY_TEMPLATES.keys())
-        })
+        return templates_body.respond()
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1152,10 +1508,12 @@ def deploy_template():
         
         # Check if using delegated auth
         if session.get('auth_method') == 'delegated' and session.get('access_token'):
-            # Resolve group names to IDs
+            # Resolve group names to IDs (only this template's; the shared
+            # directory cache answers repeated deploys)
             template_data = resolve_group_names_to_ids(template_data, session['access_token'])
             
-            # Validate and clean application IDs
+            # Validate and clean application IDs (only this template's; the shared
+            # directory cache answers repeated deploys)
             template_data = validate_and_clean_applications(template_data, session['access_token'])
             
             # Use delegated token directly
@@ -1165,24 +1523,16 @@ def deploy_template():
             }
             
             # Check if a policy with the same name already exists
-            check_response = requests.get(
-                'https://graph.microsoft.com/v1.0/identity/conditionalAccess/policies',
-                headers=headers,
-                verify=get_verify_ssl()
-            )
+            try:
+                duplicate_id = claim_policy_name(session['access_token'], policy_fetcher(session['access_token']), policy_name)
+            except requests.exceptions.RequestException as check_error:
+                logger.warning(f"Could not check for duplicate policies: {check_error}")
+                duplicate_id = None
             
-            if check_response.status_code == 200:
-                existing_policies = check_response.json().get('value', [])
-                duplicate = next((p for p in existing_policies if p.get('displayName') == policy_name), None)
-                
-                if duplicate:
-                    return jsonify({
-                        'success': False,
-                        'error': f'A policy with the name "{policy_name}" already exists. Please delete the existing policy first or rename the template.',
-                        'duplicate_policy_id': duplicate.get('id')
-                    }), 409  # 409 Conflict
+            if duplicate_id:
+                return duplicate_policy_response(policy_name, duplicate_id, 'Please delete the existing policy first or rename the template.')
             
-            response = requests.post(
+            response = get_graph_client().post(
                 'https://graph.microsoft.com/v1.0/identity/conditionalAccess/policies',
                 headers=headers,
                 json=template_data,
@@ -1191,6 +1541,7 @@ def deploy_template():
             
             if response.status_code in [200, 201]:
                 policy = response.json()
+                remember_policy(session['access_token'], policy)
                 return jsonify({
                     'success': True,
                     'policy': policy,
@@ -1209,20 +1560,18 @@ def deploy_template():
         
         # Check for duplicate policy name with client credentials
         try:
-            existing_policies = manager.list_policies()
-            duplicate = next((p for p in existing_policies if p.get('displayName') == policy_name), None)
+            duplicate_id = claim_policy_name(manager.get_access_token(), policy_fetcher(None, manager), policy_name)
             
-            if duplicate:
-                return jsonify({
-                    'success': False,
-                    'error': f'A policy with the name "{policy_name}" already exists. Please delete the existing policy first or rename the template.',
-                    'duplicate_policy_id': duplicate.get('id')
-                }), 409  # 409 Conflict
+            if duplicate_id:
+                return duplicate_policy_response(policy_name, duplicate_id, 'Please delete the existing policy first or rename the template.')
         except Exception as check_error:
             # If we can't check for duplicates, log it but proceed
             print(f"Warning: Could not check for duplicate policies: {check_error}")
         
         result = manager.create_policy(template_data)
+        if result is None:
+            return jsonify({'success': False, 'error': 'Failed to deploy template'}), 500
+        remember_policy(manager.access_token, result)
         
         return jsonify({
             'success': True,
@@ -1235,208 +1584,204 @@ def deploy_template():
 
 @app.route('/api/templates/deploy-all', methods=['POST'])
 def deploy_all_templates():
-    """Deploy all templates in a category or all - supports both client credentials and delegated auth"""
+    """Deploy all templates in a category or all - supports both client credentials and delegated auth
+    
+    Templates are created in parallel (DEPLOY_CONCURRENCY at a time); the
+    per-template results are returned in template order. With
+    "background": true the deployment runs as a job (202 + job ID), or
+    streams its events when job state is not shared.
+    """
     try:
         category = request.json.get('category')
         
-        success_count = 0
-        errors = []
-        skipped_count = 0
+        auth = job_auth()
+        if auth is None:
+            return jsonify({'success': False, 'error': 'Not connected'}), 401
         
-        if category and category in POLICY_TEMPLATES:
-            templates_to_deploy = POLICY_TEMPLATES[category]
-        else:
-            # Deploy all templates
-            templates_to_deploy = {}
-            for cat_templates in POLICY_TEMPLATES.values():
-                templates_to_deploy.update(cat_templates)
+        if background_requested():
+            total = len(TEMPLATE_REGISTRY.in_category(category) if category in TEMPLATE_REGISTRY.by_category else TEMPLATE_REGISTRY)
+            if wants_background():
+                return submit_job('deploy_all', total=total, auth=auth, category=category)
+            return job_stream_response(run_deploy_all, total=total, auth=auth, category=category)
+        return job_result_response(run_deploy_all(JobContext(), auth, category))
         
-        # Check if using delegated auth
-        if session.get('auth_method') == 'delegated' and session.get('access_token'):
-            # Use delegated token directly
-            headers = {
-                'Authorization': f'Bearer {session["access_token"]}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Get existing policies once for efficiency
-            check_response = requests.get(
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Job event type for each DeployEngine result status
+DEPLOY_EVENTS = {'deployed': 'created', 'skipped': 'skipped', 'failed': 'failed', 'cancelled': 'cancelled'}
+
+@job_handler('deploy_all')
+def run_deploy_all(job: JobContext, auth: dict, category: Optional[str] = None) -> dict:
+    """Deploy the templates of a category (or all), reporting each result as it finishes"""
+    # Frozen templates; each deploy works on its own copy
+    if category and category in TEMPLATE_REGISTRY.by_category:
+        templates_to_deploy = TEMPLATE_REGISTRY.templates(category)
+    else:
+        # Deploy all templates
+        templates_to_deploy = TEMPLATE_REGISTRY.templates()
+    
+    concurrency = app.config.get('DEPLOY_CONCURRENCY', DEFAULT_CONCURRENCY)
+    access_token, manager = job_credentials(auth)
+    job.progress(0, len(templates_to_deploy), 'Resolving groups and applications')
+    
+    if manager is None:
+        # Delegated token (captured by the route: worker threads have no session)
+        verify_ssl = get_verify_ssl()
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+        
+        # Existing names come from the policy name index; claims are shared
+        # with concurrent requests through it
+        fetch = policy_fetcher(access_token)
+        try:
+            existing_names = existing_policy_names(access_token, fetch)
+        except requests.exceptions.RequestException:
+            existing_names = set()
+        
+        # Resolve the group names and validate the excluded apps of every
+        # template in one pass
+        group_resolver = GroupNameResolver(access_token, verify_ssl=verify_ssl)
+        group_resolver.prefetch(templates_to_deploy.values())
+        validator = ApplicationValidator(access_token, verify_ssl=verify_ssl)
+        validator.prefetch(templates_to_deploy.values())
+        
+        def deploy(template_name, template):
+            template = resolve_group_names_to_ids(TEMPLATE_REGISTRY.instance(template_name), access_token, group_resolver)
+            template = validate_and_clean_applications(template, access_token, validator)
+            response = get_graph_client().post(
                 'https://graph.microsoft.com/v1.0/identity/conditionalAccess/policies',
                 headers=headers,
-                verify=get_verify_ssl()
+                json=template,
+                verify=verify_ssl
             )
-            existing_policies = check_response.json().get('value', []) if check_response.status_code == 200 else []
-            existing_names = {p.get('displayName') for p in existing_policies}
-            
-            for template_name, template in templates_to_deploy.items():
-                try:
-                    policy_name = template.get('displayName', '')
-                    
-                    # Skip if duplicate
-                    if policy_name in existing_names:
-                        skipped_count += 1
-                        errors.append(f"Skipped {policy_name}: Already exists")
-                        continue
-                    
-                    response = requests.post(
-                        'https://graph.microsoft.com/v1.0/identity/conditionalAccess/policies',
-                        headers=headers,
-                        json=template,
-                        verify=get_verify_ssl()
-                    )
-                    
-                    if response.status_code in [200, 201]:
-                        success_count += 1
-                        existing_names.add(policy_name)  # Add to set to prevent duplicates in same batch
-                    else:
-                        errors.append(f"Failed to deploy {template_name}: {response.status_code}")
-                except Exception as e:
-                    errors.append(f"Failed to deploy {template_name}: {str(e)}")
-        else:
-            # Use client credentials manager
-            manager = get_manager()
-            if not manager:
-                return jsonify({'success': False, 'error': 'Not connected'}), 401
-            
-            # Get existing policies once for efficiency
-            try:
-                existing_policies = manager.list_policies()
-                existing_names = {p.get('displayName') for p in existing_policies}
-            except Exception:
-                existing_names = set()
-            
-            for template_name, template in templates_to_deploy.items():
-                try:
-                    policy_name = template.get('displayName', '')
-                    
-                    # Skip if duplicate
-                    if policy_name in existing_names:
-                        skipped_count += 1
-                        errors.append(f"Skipped {policy_name}: Already exists")
-                        continue
-                    
-                    manager.create_policy(template)
-                    success_count += 1
-                    existing_names.add(policy_name)  # Add to set to prevent duplicates in same batch
-                except Exception as e:
-                    errors.append(f"Failed to deploy {template_name}: {str(e)}")
-        
-        return jsonify({
-            'success': True,
-            'deployed': success_count,
-            'skipped': skipped_count,
-            'total': len(templates_to_deploy),
-            'errors': errors,
-            'message': f'Deployed {success_count} of {len(templates_to_deploy)} templates' + (f' ({skipped_count} skipped - already exist)' if skipped_count > 0 else '')
-        })
-        
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+            if response.status_code not in [200, 201]:
+                raise requests.exceptions.HTTPError(str(response.status_code), response=response)
+            policy = response.json()
+            remember_policy(access_token, policy)
+            return policy
+    else:
+        # Client credentials manager
+        # Existing names come from the policy name index; claims are shared
+        # with concurrent requests through it
+        fetch = policy_fetcher(access_token, manager)
+        try:
+            existing_names = existing_policy_names(access_token, fetch)
+        except Exception:
+            existing_names = set()
+        
+        # Resolve the group names and validate the excluded apps of every
+        # template in one pass
+        manager.prefetch_groups(templates_to_deploy.values())
+        manager.prefetch_applications(templates_to_deploy.values())
+        
+        def deploy(template_name, template):
+            policy = manager.create_policy(manager.resolve_group_names(TEMPLATE_REGISTRY.instance(template_name)))
+            if policy is not None:
+                remember_policy(manager.access_token, policy)
+            return policy
+    
+    claim_name, release_name = policy_name_claim_hooks(access_token, fetch)
+    engine = DeployEngine(max_workers=concurrency, existing_names=existing_names,
+                          claim_name=claim_name, release_name=release_name)
+    total = len(templates_to_deploy)
+    finished = itertools.count(1)
+    
+    def on_result(result):
+        done = next(finished)
+        job.add_results([result], done=done)
+        job.event(DEPLOY_EVENTS[result['status']], done=done, total=total,
+                  **{k: v for k, v in result.items() if k != 'status'})
+    
+    with report_throttling(job, access_token):
+        summary = summarize_results(engine.run(
+            templates_to_deploy, deploy,
+            on_result=on_result,
+            should_stop=lambda: job.cancelled,
+            on_start=lambda template_name, display_name: job.event('started', template=template_name, displayName=display_name)
+        ))
+    
+    payload = {
+        'success': True,
+        **summary,
+        'message': f"Deployed {summary['deployed']} of {summary['total']} templates" + (f" ({summary['skipped']} skipped - already exist)" if summary['skipped'] > 0 else '')
+    }
+    if summary['cancelled']:
+        raise JobCancelled(payload)
+    return payload
 
 @app.route('/api/groups/create-ca-groups', methods=['POST'])
 def create_ca_groups():
-    """Create all required CA policy groups - supports both client credentials and delegated auth"""
+    """Create all required CA policy groups - supports both client credentials and delegated auth
+    
+    Existing groups are listed in one query and only the missing ones are
+    created, through $batch. With "background": true the groups are created
+    as a job (202 + job ID), or the events are streamed when job state is
+    not shared.
+    """
     try:
-        # Define all required groups
-        persona_groups = [
-            {'name': 'CA-BreakGlassAccounts', 'description': 'Emergency break-glass admin accounts excluded from all CA policies'},
-            {'name': 'CA-Persona-Admins', 'description': 'Administrative users persona group for CA policies'},
-            {'name': 'CA-Persona-Internals', 'description': 'Internal employees persona group for CA policies'},
-            {'name': 'CA-Persona-Externals', 'description': 'External contractors/consultants persona group for CA policies'},
-            {'name': 'CA-Persona-Guests', 'description': 'Guest users (B2B) persona group for CA policies'},
-            {'name': 'CA-Persona-GuestAdmins', 'description': 'Guest administrators persona group for CA policies'},
-            {'name': 'CA-Persona-Microsoft365ServiceAccounts', 'description': 'Microsoft 365 service accounts persona group for CA policies'},
-            {'name': 'CA-Persona-AzureServiceAccounts', 'description': 'Azure service accounts persona group for CA policies'},
-            {'name': 'CA-Persona-CorpServiceAccounts', 'description': 'Corporate service accounts persona group for CA policies'},
-            {'name': 'CA-Persona-WorkloadIdentities', 'description': 'Workload identities persona group for CA policies'},
-            {'name': 'CA-Persona-Developers', 'description': 'Developer users persona group for CA policies'}
-        ]
-        
-        # Define exclusion groups for each persona and policy type
-        exclusion_groups = []
-        personas = ['Admins', 'Internals', 'Externals', 'Guests', 'GuestAdmins', 
-                   'Microsoft365ServiceAccounts', 'AzureServiceAccounts', 'CorpServiceAccounts', 
-                   'WorkloadIdentities', 'Developers']
-        policy_types = ['BaseProtection', 'IdentityProtection', 'DataandAppProtection', 
-                       'AttackSurfaceReduction', 'Compliance']
-        
-        for persona in personas:
-            for policy_type in policy_types:
-                exclusion_groups.append({
-                    'name': f'CA-Persona-{persona}-{policy_type}-Exclusions',
-                    'description': f'Exclusions for {persona} {policy_type} CA policies'
-                })
-        
-        all_groups = persona_groups + exclusion_groups
-        
-        created_count = 0
-        skipped_count = 0
-        errors = []
-        
-        # Check if using delegated auth
-        if session.get('auth_method') == 'delegated' and session.get('access_token'):
-            headers = {
-                'Authorization': f'Bearer {session["access_token"]}',
-                'Content-Type': 'application/json'
-            }
-            
-            for group in all_groups:
-                try:
-                    # Check if group already exists
-                    check_response = requests.get(
-                        f'https://graph.microsoft.com/v1.0/groups?$filter=displayName eq \'{group["name"]}\'',
-                        headers=headers,
-                        verify=get_verify_ssl()
-                    )
-                    
-                    if check_response.status_code == 200:
-                        existing = check_response.json().get('value', [])
-                        if existing:
-                            skipped_count += 1
-                            continue
-                    
-                    # Create the group
-                    group_data = {
-                        'displayName': group['name'],
-                        'mailNickname': group['name'].replace('-', ''),
-                        'description': group['description'],
-                        'mailEnabled': False,
-                        'securityEnabled': True
-                    }
-                    
-                    response = requests.post(
-                        'https://graph.microsoft.com/v1.0/groups',
-                        headers=headers,
-                        json=group_data,
-                        verify=get_verify_ssl()
-                    )
-                    
-                    if response.status_code == 201:
-                        created_count += 1
-                    else:
-                        errors.append(f"Failed to create {group['name']}: {response.status_code} - {response.text}")
-                        
-                except Exception as e:
-                    errors.append(f"Error creating {group['name']}: {str(e)}")
-        else:
-            # Use client credentials - not implemented in original manager, will need Graph API calls
-            return jsonify({
-                'success': False, 
-                'error': 'Group creation requires delegated authentication. Please sign in with Entra ID first.'
-            }), 400
+        auth = job_auth()
+        if auth is None:
+            return jsonify({'success': False, 'error': 'Not connected'}), 401
         
-        return jsonify({
-            'success': True,
-            'created': created_count,
-            'skipped': skipped_count,
-            'total': len(all_groups),
-            'errors': errors,
-            'message': f'Created {created_count} groups, skipped {skipped_count} existing groups'
-        })
+        if wants_background():
+            return submit_job('create_ca_groups', total=len(ca_group_definitions()), auth=auth)
+        if background_requested():
+            return job_stream_response(run_create_ca_groups, total=len(ca_group_definitions()), auth=auth)
+        return job_result_response(run_create_ca_groups(JobContext(), auth))
         
+    except requests.exceptions.RequestException as e:
+        return jsonify({'success': False, 'error': str(e)}), graph_error_status(e)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@job_handler('create_ca_groups')
+def run_create_ca_groups(job: JobContext, auth: dict) -> dict:
+    """Provision the persona and exclusion groups, reporting each group's outcome"""
+    all_groups = ca_group_definitions()
+    access_token, manager = job_credentials(auth)
+    provisioner = GroupProvisioner(
+        access_token,
+        verify_ssl=manager.verify_ssl if manager else get_verify_ssl(),
+        graph_client=manager.graph if manager else None
+    )
+    
+    finished = itertools.count(1)
+    
+    def on_result(result):
+        done = next(finished)
+        job.add_results([result], done=done)
+        job.event(result['status'], done=done, total=len(all_groups),
+                  **{k: v for k, v in result.items() if k != 'status'})
+    
+    job.progress(0, len(all_groups), 'Listing existing groups')
+    with report_throttling(job, access_token):
+        results = provisioner.provision(
+            all_groups,
+            on_result=on_result,
+            on_round=lambda names: job.event('started', names=names),
+            should_stop=lambda: job.cancelled
+        )
+    
+    created_count = sum(1 for r in results if r['status'] == 'created')
+    skipped_count = sum(1 for r in results if r['status'] == 'skipped')
+    errors = [f"Failed to create {r['name']}: {r['error']}" for r in results if r['status'] == 'failed']
+    
+    payload = {
+        'success': True,
+        'created': created_count,
+        'skipped': skipped_count,
+        'total': len(all_groups),
+        'errors': errors,
+        'results': results,
+        'message': f'Created {created_count} groups, skipped {skipped_count} existing groups'
+    }
+    if any(r['status'] == 'cancelled' for r in results):
+        raise JobCancelled(payload)
+    return payload
+
 @app.route('/api/report/upload', methods=['POST'])
 def upload_report():
     """Upload security assessment report"""
@@ -1497,64 +1842,86 @@ def upload_report():
 
 @app.route('/api/report/analyze', methods=['POST'])
 def analyze_report():
-    """Analyze uploaded security report"""
+    """Analyze uploaded security report
+    
+    With "background": true the analysis runs as a job (202 + job ID). It is
+    never streamed: its summary must be written to the session, so without
+    shared job state it runs inline.
+    """
     try:
         report_path = session.get('report_path')
         
         if not report_path or not os.path.exists(report_path):
             return jsonify({'success': False, 'error': 'No report uploaded'}), 400
         
-        # Create analyzer
-        analyzer = SecurityReportAnalyzer(report_path)
-        
-        # Parse and extract findings
-        if not analyzer.parse_html():
-            return jsonify({'success': False, 'error': 'Failed to parse report'}), 500
+        if wants_background():
+            return submit_job('analyze_report', report_path=report_path)
         
-        findings = analyzer.extract_findings()
-        stats = analyzer.get_statistics()
-        
-        # Debug: Show first few findings with their mapped policies
-        print(f"\n🔍 Checking first 3 findings:")
-        for i, finding in enumerate(findings[:3]):
-            print(f"  Finding {i+1}: {finding['title'][:80]}")
-            print(f"    Mapped policies: {finding.get('mapped_policies', [])}")
-        
-        # Get recommendations
-        import ca_policy_examples
-        print(f"📊 Policy templates available: {list(ca_policy_examples.POLICY_TEMPLATES.keys())}")
-        print(f"📊 Total templates: {sum(len(v) for v in ca_policy_examples.POLICY_TEMPLATES.values())}")
-        
-        try:
-            recommendations = analyzer.get_policy_recommendations(ca_policy_examples)
-            print(f"📊 Generated {len(recommendations)} recommendations")
-            if recommendations:
-                print(f"📊 Sample recommendation: {recommendations[0]['policy_display_name']}")
-        except Exception as e:
-            print(f"❌ Error in get_policy_recommendations: {e}")
-            import traceback
-            traceback.print_exc()
-            recommendations = []
-        
-        # Store minimal data in session (session cookie has 4KB limit)
-        # Only store IDs/indices for findings, not full data
-        session['findings_count'] = len(findings)
-        session['recommendations_count'] = len(recommendations)
-        session['stats'] = stats
-        
-        return jsonify({
-            'success': True,
-            'findings': findings,
-            'recommendations': recommendations,
-            'stats': stats,
-            'message': f'Analyzed report: {len(findings)} findings, {len(recommendations)} recommendations'
-        })
+        result = run_report_analysis(JobContext(), report_path)
+        store_report_summary(result)
+        return job_result_response(result)
         
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def store_report_summary(result: dict):
+    """Keep a finished analysis' counts in the session for the dashboard"""
+    if not result or not result.get('success'):
+        return
+    # Store minimal data in session (session cookie has 4KB limit)
+    # Only store IDs/indices for findings, not full data
+    session['findings_count'] = len(result['findings'])
+    session['recommendations_count'] = len(result['recommendations'])
+    session['stats'] = result['stats']
+
+@job_handler('analyze_report')
+def run_report_analysis(job: JobContext, report_path: str) -> dict:
+    """Parse a report and map its findings to policy recommendations"""
+    # Create analyzer (BeautifulSoup/pandas are only loaded once a report is analyzed)
+    from utils.report_analyzer import SecurityReportAnalyzer
+    analyzer = SecurityReportAnalyzer(report_path)
+    
+    # Parse and extract findings
+    job.progress(message='Parsing report')
+    if not analyzer.parse_html():
+        return {'success': False, 'error': 'Failed to parse report'}
+    
+    job.progress(message='Extracting findings')
+    findings = analyzer.extract_findings()
+    stats = analyzer.get_statistics()
+    
+    # Debug: Show first few findings with their mapped policies
+    print("\n🔍 Checking first 3 findings:")
+    for i, finding in enumerate(findings[:3]):
+        print(f"  Finding {i+1}: {finding['title'][:80]}")
+        print(f"    Mapped policies: {finding.get('mapped_policies', [])}")
+    
+    # Get recommendations
+    print(f"📊 Policy templates available: {list(TEMPLATE_REGISTRY.categories)}")
+    print(f"📊 Total templates: {len(TEMPLATE_REGISTRY)}")
+    
+    job.progress(message='Building recommendations')
+    try:
+        recommendations = analyzer.get_policy_recommendations(TEMPLATE_REGISTRY)
+        print(f"📊 Generated {len(recommendations)} recommendations")
+        if recommendations:
+            print(f"📊 Sample recommendation: {recommendations[0]['policy_display_name']}")
+    except Exception as e:
+        print(f"❌ Error in get_policy_recommendations: {e}")
+        import traceback
+        traceback.print_exc()
+        recommendations = []
+    
+    return {
+        'success': True,
+        'findings': findings,
+        'recommendations': recommendations,
+        'stats': stats,
+        'message': f'Analyzed report: {len(findings)} findings, {len(recommendations)} recommendations'
+    }
+
 @app.route('/api/report/deploy-recommendations', methods=['POST'])
 def deploy_recommendations():
     """Deploy selected recommendations from report"""
@@ -1579,7 +1946,11 @@ def deploy_recommendations():
                 
                 if template:
                     try:
-                        manager.create_policy(template)
+                        policy = manager.create_policy(template)
+                        if policy is None:
+                            errors.append(f"Failed to deploy {rec.get('policy_display_name')}")
+                            continue
+                        remember_policy(manager.access_token, policy)
                         success_count += 1
                     except Exception as e:
                         errors.append(f"Failed to deploy {rec.get('policy_display_name')}: {str(e)}")
@@ -1633,6 +2004,70 @@ def export_findings():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status, progress and partial results of a background job
+    
+    ?since=<n> returns only the results after the first n (for polling).
+    """
+    job = get_job_runner().get(job_id, get_session_id())
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    try:
+        since = max(0, int(request.args.get('since', 0)))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'since must be an integer'}), 400
+    job['results_count'] = len(job['results'])
+    job['results'] = job['results'][since:]
+    
+    # Jobs cannot write the session; a background analysis is recorded when
+    # its owner fetches it after it finished
+    if job['kind'] == 'analyze_report' and job['status'] == 'succeeded':
+        store_report_summary(job['result'])
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events stream of a job's per-item events
+    
+    Each event has the job event's type ('started', 'created', 'deleted',
+    'skipped', 'throttled', 'failed', ...) as its SSE event name, its
+    sequence number as the SSE id (so EventSource resumes with Last-Event-ID
+    after a reconnect) and the event as JSON data. A comment is sent every
+    15 seconds of silence so proxies keep the connection open. The stream
+    ends after the 'done' event.
+    """
+    runner = get_job_runner()
+    if runner.get(job_id, get_session_id()) is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    try:
+        after = max(0, int(request.headers.get('Last-Event-ID') or request.args.get('after', 0)))
+    except ValueError:
+        after = 0
+    
+    def generate():
+        yield 'retry: 3000\n\n'
+        for event in runner.follow(job_id, after):
+            if event is None:
+                yield ': keep-alive\n\n'
+                continue
+            yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a background job (items already finished stay done)"""
+    job = get_job_runner().cancel(job_id, get_session_id())
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job}), 202
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -1643,6 +2078,25 @@ def health_check():
         'session_id': session.get('id')
     })
 
+@app.route('/api/stats', methods=['GET'])
+def worker_stats():
+    """Cache, pool, job and session counters of this worker (connected sessions only)
+    
+    Rate governor figures are limited to the caller's own tenant.
+    """
+    access_token = get_graph_token()
+    if not access_token:
+        return jsonify({'success': False, 'error': 'Not connected'}), 401
+    return jsonify({
+        'success': True,
+        'directory_cache': get_directory_cache().stats(),
+        'rate_governor': get_rate_governor().stats(tenant_ids=[tenant_id_from_token(access_token)]),
+        'manager_pool': manager_pool.stats(),
+        'policy_cache': policy_cache.stats(),
+        'jobs': get_job_runner().stats(),
+        'sessions': session_manager.stats()
+    })
+
 @app.route('/api/user/info', methods=['GET'])
 def get_user_info():
     """Get current user information"""
@@ -1655,14 +2109,14 @@ def get_user_info():
             }
             
             # Get user profile from Microsoft Graph
-            user_response = requests.get(
+            user_response = get_graph_client().get(
                 'https://graph.microsoft.com/v1.0/me',
                 headers=headers,
                 verify=get_verify_ssl()
             )
             
             # Get organization info
-            org_response = requests.get(
+            org_response = get_graph_client().get(
                 'https://graph.microsoft.com/v1.0/organization',
                 headers=headers,
                 verify=get_verify_ssl()
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Async CA Policy Manager - asyncio-native counterpart of ConditionalAccessManager
+Built on httpx (HTTP/2 when the 'h2' package is installed) so fan-out work such
+as deploying or deleting many policies runs dozens of Graph calls concurrently
+from a single thread.
+
+Requires: pip install "httpx[http2]"
+
+Example:
+    async with AsyncConditionalAccessManager.from_manager(manager) as async_manager:
+        created = await async_manager.create_policies(templates)
+"""
+
+import time
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401 - only needed for httpx's HTTP/2 support
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+from ca_policy_manager import ConditionalAccessManager
+from graph_client import (
+    BATCH_LIMIT, GRAPH_ENDPOINT, RETRY_STATUSES,
+    _retry_after_seconds, backoff_seconds, is_resendable, odata_params, tenant_id_from_token
+)
+from utils.directory_resolver import ApplicationValidator
+from utils.rate_governor import RateGovernor, get_rate_governor
+
+# Concurrent Graph calls per manager (HTTP/2 multiplexes them over one connection)
+DEFAULT_CONCURRENCY = 20
+
+
+class AsyncConditionalAccessManager:
+    """
+    Async manager for Conditional Access policies with the same method surface
+    as ConditionalAccessManager.
+
+    All calls share one httpx.AsyncClient and are bounded by a semaphore;
+    throttled responses (429/503) are retried after Retry-After, and every
+    call passes through the per-tenant RateGovernor.
+    """
+
+    def __init__(self, tenant_id: Optional[str] = None, client_id: Optional[str] = None,
+                 client_secret: Optional[str] = None, verify_ssl: bool = True,
+                 manager: Optional[ConditionalAccessManager] = None,
+                 access_token: Optional[str] = None,
+                 max_concurrency: int = DEFAULT_CONCURRENCY, http2: bool = True,
+                 connect_timeout: float = 5.0, read_timeout: float = 30.0,
+                 throttle_retries: int = 3, max_retry_after: float = 30.0,
+                 governor: Optional[RateGovernor] = None):
+        """
+        Initialize the async CA Policy Manager.
+
+        Pass client credentials (like ConditionalAccessManager), an existing
+        manager (its token and refresh-ahead are reused), or a delegated
+        access token.
+
+        Args:
+            tenant_id: Azure AD Tenant ID
+            client_id: Azure AD App Registration Client ID
+            client_secret: Client Secret for authentication
+            verify_ssl: Enable SSL certificate verification
+            manager: Existing ConditionalAccessManager to take tokens from
+            access_token: Delegated bearer token (used as-is)
+            max_concurrency: Maximum Graph calls in flight at once
+            http2: Use HTTP/2 when the h2 package is installed
+            connect_timeout: Seconds to wait for a connection
+            read_timeout: Seconds to wait for a response
+            throttle_retries: Times a 429/503 response is retried
+            max_retry_after: Upper bound in seconds for a single wait
+            governor: Rate governor (defaults to the shared one)
+        """
+        if not HTTPX_AVAILABLE:
+            raise ImportError('httpx is required for AsyncConditionalAccessManager. Install with: pip install "httpx[http2]"')
+
+        if manager is None and access_token is None:
+            manager = ConditionalAccessManager(tenant_id, client_id, client_secret, verify_ssl=verify_ssl)
+        self.manager = manager
+        self._access_token = access_token
+        self.tenant_id = manager.tenant_id if manager else (tenant_id or tenant_id_from_token(access_token))
+        self.verify_ssl = manager.verify_ssl if manager else verify_ssl
+        self.graph_endpoint = GRAPH_ENDPOINT
+        self.throttle_retries = throttle_retries
+        self.max_retry_after = max_retry_after
+        self.governor = governor or get_rate_governor()
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._app_validator: Optional[ApplicationValidator] = None
+
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.client = httpx.AsyncClient(
+            base_url=self.graph_endpoint,
+            http2=self.http2,
+            verify=self.verify_ssl,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            headers={'Accept': 'application/json'}
+        )
+
+    @classmethod
+    def from_manager(cls, manager: ConditionalAccessManager, **kwargs: Any) -> 'AsyncConditionalAccessManager':
+        """Create an async manager that shares an existing manager's credentials and token."""
+        return cls(manager=manager, **kwargs)
+
+    @classmethod
+    def from_access_token(cls, access_token: str, verify_ssl: bool = True,
+                          **kwargs: Any) -> 'AsyncConditionalAccessManager':
+        """Create an async manager for a delegated (signed-in user) token."""
+        return cls(access_token=access_token, verify_ssl=verify_ssl, **kwargs)
+
+    async def __aenter__(self) -> 'AsyncConditionalAccessManager':
+        return self
+
+    async def __aexit__(self, *exc_info: Any):
+        await self.close()
+
+    async def close(self):
+        """Close the pooled connections."""
+        await self.client.aclose()
+
+    @property
+    def access_token(self) -> Optional[str]:
+        return self.manager.access_token if self.manager else self._access_token
+
+    async def authenticate(self) -> bool:
+        """
+        Make sure a valid token is available (client credentials run MSAL in a thread).
+
+        Returns:
+            bool: True if a token is available, False otherwise
+        """
+        if self.manager is None:
+            return bool(self._access_token)
+        return bool(await asyncio.to_thread(self.manager.get_access_token))
+
+    async def _get_headers(self) -> Dict[str, str]:
+        """Get HTTP headers with authentication token."""
+        if self.manager is not None:
+            token = self.manager.access_token
+            if not token or self.manager.token_expires_at - time.time() <= 60:
+                # MSAL blocks on the network, so only call it off the event loop
+                token = await asyncio.to_thread(self.manager.get_access_token)
+            else:
+                # Never blocks here (a refresh-ahead runs on its own thread)
+                token = self.manager.get_access_token()
+        else:
+            token = self._access_token
+        return {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+
+    async def _acquire_rate(self, cost: int = 1):
+        """Wait (without blocking the loop) until the tenant's rate governor allows the call."""
+        if not self.tenant_id:
+            return
+        cost = min(max(cost, 1), self.governor.burst)
+        waited = 0.0
+        wait = self.governor.try_acquire(self.tenant_id, cost)
+        while wait > 0 and waited < self.governor.max_wait:
+            await asyncio.sleep(wait)
+            waited += wait
+            wait = self.governor.try_acquire(self.tenant_id, cost)
+
+    async def request(self, method: str, url: str, cost: int = 1, **kwargs: Any) -> 'httpx.Response':
+        """
+        Send a Graph request, bounded by the concurrency semaphore.
+
+        Args:
+            method: HTTP method
+            url: Absolute Graph URL or path relative to the Graph root
+            cost: Rate governor tokens this request uses
+            **kwargs: Passed through to httpx (json, params...)
+
+        Returns:
+            httpx.Response (throttled responses are retried first)
+        """
+        headers = {**await self._get_headers(), **(kwargs.pop('headers', None) or {})}
+        attempt = 0
+        async with self._semaphore:
+            while True:
+                await self._acquire_rate(cost)
+                response = await self.client.request(method, url, headers=headers, **kwargs)
+                if response.status_code not in RETRY_STATUSES:
+                    self.governor.record_success(self.tenant_id)
+                    return response
+
+                attempt += 1
+                delay = min(_retry_after_seconds(response.headers, default=backoff_seconds(attempt)),
+                            self.max_retry_after)
+                self.governor.record_throttle(self.tenant_id, delay)
+                if attempt > self.throttle_retries:
+                    return response
+
+    async def iter_pages(self, url: str, params: Optional[Dict[str, Any]] = None) -> AsyncIterator[List[Dict]]:
+        """
+        Lazily yield each page of a Graph collection, following @odata.nextLink.
+
+        Raises:
+            httpx.HTTPStatusError: If any page request fails
+        """
+        next_url: Optional[str] = url
+        while next_url:
+            response = await self.request('GET', next_url, params=params)
+            response.raise_for_status()
+            data = response.json()
+            yield data.get('value', [])
+            next_url = data.get('@odata.nextLink')
+            params = None
+
+    async def iter_values(self, url: str, params: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict]:
+        """Lazily yield every item of a paged Graph collection."""
+        async for page in self.iter_pages(url, params=params):
+            for item in page:
+                yield item
+
+    def iter_policies(self, top: Optional[int] = None, select: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        """Async iterator over all Conditional Access policies, one page at a time."""
+        return self.iter_values('/identity/conditionalAccess/policies', params=odata_params(top=top, select=select))
+
+    def iter_named_locations(self, top: Optional[int] = None, select: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        """Async iterator over all named locations, one page at a time."""
+        return self.iter_values('/identity/conditionalAccess/namedLocations', params=odata_params(top=top, select=select))
+
+    def iter_groups(self, filter: Optional[str] = None, top: Optional[int] = None,
+                    select: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+        """Async iterator over directory groups, one page at a time."""
+        return self.iter_values('/groups', params=odata_params(top=top, select=select, filter=filter))
+
+    async def batch(self, sub_requests: List[Dict], max_attempts: int = 3) -> List[Dict]:
+        """
+        Send sub-requests through JSON $batch; all chunks are sent concurrently.
+
+        Args:
+            sub_requests: Dicts with 'method', 'url' (e.g. '/groups/{id}') and optional 'body'
+            max_attempts: Attempts per sub-request before giving up
+
+        Returns:
+            One {'status', 'headers', 'body'} dict per sub-request, in input order
+        """
+        results: List[Optional[Dict]] = [None] * len(sub_requests)
+        pending = list(range(len(sub_requests)))
+        attempt = 0
+
+        async def send(chunk: List[int]) -> Tuple[List[int], float]:
+            payload = []
+            for index in chunk:
+                sub = sub_requests[index]
+                entry = {'id': str(index), 'method': sub.get('method', 'GET').upper(), 'url': sub['url']}
+                if sub.get('body') is not None:
+                    entry['body'] = sub['body']
+                    entry['headers'] = {'Content-Type': 'application/json'}
+                payload.append(entry)
+            response = await self.request('POST', '/$batch', json={'requests': payload}, cost=len(chunk))
+            response.raise_for_status()
+            throttled = []
+            retry_after = 0.0
+            for sub_response in response.json().get('responses', []):
+                index = int(sub_response['id'])
+                status = sub_response.get('status', 500)
+                headers = sub_response.get('headers') or {}
+                if attempt < max_attempts and is_resendable(sub_requests[index].get('method', 'GET'), status):
+                    throttled.append(index)
+                    retry_after = max(retry_after, _retry_after_seconds(headers, default=0.0))
+                    continue
+                results[index] = {'status': status, 'headers': headers,
+                                  'body': sub_response.get('body')}
+            return throttled, retry_after
+
+        while pending:
+            attempt += 1
+            chunks = [pending[i:i + BATCH_LIMIT] for i in range(0, len(pending), BATCH_LIMIT)]
+            outcomes = await asyncio.gather(*(send(chunk) for chunk in chunks))
+            pending = sorted(index for throttled, _ in outcomes for index in throttled)
+            if pending:
+                # Wait as long as the most demanding throttled sub-response asked
+                retry_after = max(wait for _, wait in outcomes)
+                delay = min(retry_after or backoff_seconds(attempt), self.max_retry_after)
+                self.governor.record_throttle(self.tenant_id, delay)
+                await asyncio.sleep(delay)
+
+        return [r if r is not None else {'status': 500, 'headers': {}, 'body': None} for r in results]
+
+    async def _get_app_validator(self) -> ApplicationValidator:
+        token = (await self._get_headers())['Authorization'][len('Bearer '):]
+        if self._app_validator is None or self._app_validator.headers['Authorization'] != f'Bearer {token}':
+            self._app_validator = ApplicationValidator(token, verify_ssl=self.verify_ssl, tenant_id=self.tenant_id)
+        return self._app_validator
+
+    async def prefetch_applications(self, policies: Iterable[Dict]) -> None:
+        """Validate the excluded applications of many policies in one pass."""
+        validator = await self._get_app_validator()
+        await asyncio.to_thread(validator.prefetch, list(policies))
+
+    async def clean_policy_applications(self, policy_definition: Dict) -> Dict:
+        """Remove invalid application IDs from a policy (see ConditionalAccessManager)."""
+        validator = await self._get_app_validator()
+        return await asyncio.to_thread(validator.clean_policy, policy_definition)
+
+    async def list_policies(self) -> List[Dict]:
+        """
+        List all Conditional Access policies (all pages).
+
+        Returns:
+            List of CA policy objects
+        """
+        try:
+            policies = [policy async for policy in self.iter_policies()]
+            print(f"📋 Found {len(policies)} Conditional Access policies")
+            return policies
+        except httpx.HTTPError as e:
+            print(f"❌ Error listing policies: {e}")
+            return []
+
+    async def get_policy(self, policy_id: str) -> Optional[Dict]:
+        """Get a specific Conditional Access policy by ID."""
+        try:
+            response = await self.request('GET', f'/identity/conditionalAccess/policies/{policy_id}')
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError as e:
+            print(f"❌ Error getting policy {policy_id}: {e}")
+            return None
+
+    async def create_policy(self, policy_definition: Dict) -> Optional[Dict]:
+        """
+        Create a new Conditional Access policy.
+
+        Returns:
+            Created policy object or None if failed
+        """
+        try:
+            cleaned_policy = await self.clean_policy_applications(policy_definition)
+            response = await self.request('POST', '/identity/conditionalAccess/policies', json=cleaned_policy)
+            response.raise_for_status()
+            policy = response.json()
+            print(f"✅ Created policy: {policy.get('displayName', 'Unknown')}")
+            return policy
+        except httpx.HTTPError as e:
+            print(f"❌ Error creating policy: {e}")
+            return None
+
+    async def create_policies(self, policy_definitions: Iterable[Dict]) -> List[Optional[Dict]]:
+        """Create many policies concurrently; results are in input order."""
+        policy_definitions = list(policy_definitions)
+        await self.prefetch_applications(policy_definitions)
+        return list(await asyncio.gather(*(self.create_policy(p) for p in policy_definitions)))
+
+    async def update_policy(self, policy_id: str, policy_definition: Dict) -> bool:
+        """Update an existing Conditional Access policy."""
+        try:
+            response = await self.request('PATCH', f'/identity/conditionalAccess/policies/{policy_id}',
+                                          json=policy_definition)
+            response.raise_for_status()
+            print(f"✅ Updated policy: {policy_id}")
+            return True
+        except httpx.HTTPError as e:
+            print(f"❌ Error updating policy: {e}")
+            return False
+
+    async def delete_policy(self, policy_id: str) -> bool:
+        """Delete a Conditional Access policy."""
+        try:
+            response = await self.request('DELETE', f'/identity/conditionalAccess/policies/{policy_id}')
+            response.raise_for_status()
+            print(f"✅ Deleted policy: {policy_id}")
+            return True
+        except httpx.HTTPError as e:
+            print(f"❌ Error deleting policy: {e}")
+            return False
+
+    async def delete_policies(self, policy_ids: List[str]) -> List[Dict]:
+        """
+        Delete many policies via concurrent $batch calls.
+
+        Returns:
+            One {'id', 'success', 'status', 'error'} dict per ID, in input order
+        """
+        responses = await self.batch([
+            {'method': 'DELETE', 'url': f'/identity/conditionalAccess/policies/{policy_id}'}
+            for policy_id in policy_ids
+        ])
+        results = []
+        for policy_id, response in zip(policy_ids, responses):
+            success = response['status'] in (200, 204)
+            error = None
+            if not success:
+                error = ((response.get('body') or {}).get('error') or {}).get('message') or str(response['status'])
+            results.append({'id': policy_id, 'success': success, 'status': response['status'], 'error': error})
+        return results
+
+    async def _set_state(self, policy_id: str, state: str) -> bool:
+        return await self.update_policy(policy_id, {"state": state})
+
+    async def enable_policy(self, policy_id: str) -> bool:
+        """Enable a Conditional Access policy."""
+        return await self._set_state(policy_id, "enabled")
+
+    async def disable_policy(self, policy_id: str) -> bool:
+        """Disable a Conditional Access policy."""
+        return await self._set_state(policy_id, "disabled")
+
+    async def set_report_only(self, policy_id: str) -> bool:
+        """Set a policy to report-only mode."""
+        return await self._set_state(policy_id, "enabledForReportingButNotEnforced")
+
+
+def run_async(coroutine_factory: Callable[[], Any]) -> Any:
+    """
+    Run a coroutine from synchronous code (e.g. a Flask view) on a private event loop.
+
+    Args:
+        coroutine_factory: Zero-argument callable returning the coroutine, so
+                           that loop-bound objects are created inside the loop
+
+    Returns:
+        The coroutine's result
+    """
+    async def runner():
+        return await coroutine_factory()
+    return asyncio.run(runner())
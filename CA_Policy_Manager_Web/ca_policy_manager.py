@@ -6,9 +6,17 @@
 import requests
 import json
 import os
+import time
+import threading
 from datetime import datetime
-from typing import Dict, List, Optional
-import msal
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Iterator, Iterable
+
+from graph_client import GraphClient, get_graph_client, odata_params
+from utils.directory_resolver import ApplicationValidator, GroupNameResolver
+
+# MSAL is imported when a manager is first created, not when this module loads
+if TYPE_CHECKING:
+    import msal
 
 class ConditionalAccessManager:
     """
@@ -19,7 +27,14 @@ class ConditionalAccessManager:
     - Client ID, Tenant ID, and Client Secret
     """
     
-    def __init__(self, tenant_id: str, client_id: str, client_secret: str, verify_ssl: bool = True):
+    # Refresh app-only tokens this many seconds before they expire (MSAL itself
+    # only refreshes in the last 5 minutes)
+    TOKEN_REFRESH_MARGIN = 600
+    
+    def __init__(self, tenant_id: str, client_id: str, client_secret: str, verify_ssl: bool = True,
+                 graph_client: Optional[GraphClient] = None,
+                 token_cache: Optional['msal.SerializableTokenCache'] = None,
+                 on_token_cache_change: Optional[Callable[['msal.SerializableTokenCache'], None]] = None):
         """
         Initialize the CA Policy Manager.
         
@@ -28,6 +43,10 @@ class ConditionalAccessManager:
             client_id: Azure AD App Registration Client ID
             client_secret: Client Secret for authentication
             verify_ssl: Enable SSL certificate verification (set to False for corporate proxies)
+            graph_client: Optional transport (defaults to the shared per-worker client)
+            token_cache: Optional MSAL token cache (e.g. restored from Redis)
+            on_token_cache_change: Called with the token cache whenever it changes,
+                                   so it can be persisted
         """
         self.tenant_id = tenant_id
         self.client_id = client_id
@@ -36,7 +55,19 @@ class ConditionalAccessManager:
         self.scope = ["https://graph.microsoft.com/.default"]
         self.graph_endpoint = "https://graph.microsoft.com/v1.0"
         self.access_token = None
+        self.token_expires_at = 0.0
+        import msal
+        self.token_cache = token_cache or msal.SerializableTokenCache()
+        self._on_token_cache_change = on_token_cache_change
+        self._msal_app = None
+        self._token_lock = threading.Lock()
+        self._refreshing = False
         self.verify_ssl = verify_ssl
+        self._graph_client = graph_client
+        self._app_validator = None
+        self._app_validator_token = None
+        self._group_resolver = None
+        self._group_resolver_token = None
         
         # Disable SSL warnings if verification is disabled
         if not verify_ssl:
@@ -44,27 +75,59 @@ class ConditionalAccessManager:
             urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
             print("⚠️  SSL certificate verification disabled")
         
-    def authenticate(self) -> bool:
+    def _build_msal_app(self, token_cache: 'msal.SerializableTokenCache') -> 'msal.ConfidentialClientApplication':
+        import msal
+        return msal.ConfidentialClientApplication(
+            self.client_id,
+            authority=self.authority,
+            client_credential=self.client_secret,
+            token_cache=token_cache
+        )
+    
+    def _get_msal_app(self) -> 'msal.ConfidentialClientApplication':
+        """MSAL client for this manager, created once and bound to its token cache."""
+        if self._msal_app is None:
+            self._msal_app = self._build_msal_app(self.token_cache)
+        return self._msal_app
+    
+    def authenticate(self, force_refresh: bool = False) -> bool:
         """
         Authenticate with Microsoft Graph using client credentials flow.
         
+        A valid token in the MSAL token cache is reused without contacting
+        Entra ID unless force_refresh is set.
+        
+        Args:
+            force_refresh: Fetch a new token even if the cached one is valid
+        
         Returns:
             bool: True if authentication successful, False otherwise
         """
         try:
-            app = msal.ConfidentialClientApplication(
-                self.client_id,
-                authority=self.authority,
-                client_credential=self.client_secret
-            )
+            if force_refresh:
+                # acquire_token_for_client() always answers from the cache while the
+                # token has more than 5 minutes left, so fetch into an empty cache
+                # and swap it in once the new token has arrived
+                import msal
+                token_cache = msal.SerializableTokenCache()
+                app = self._build_msal_app(token_cache)
+            else:
+                token_cache = self.token_cache
+                app = self._get_msal_app()
             
-            result = app.acquire_token_silent(self.scope, account=None)
-            if not result:
-                result = app.acquire_token_for_client(scopes=self.scope)
+            result = app.acquire_token_for_client(scopes=self.scope)
             
             if "access_token" in result:
+                if force_refresh:
+                    self.token_cache, self._msal_app = token_cache, app
+                is_new = result["access_token"] != self.access_token
                 self.access_token = result["access_token"]
-                print("✅ Successfully authenticated with Microsoft Graph")
+                self.token_expires_at = time.time() + int(result.get("expires_in", 0))
+                if self.token_cache.has_state_changed and self._on_token_cache_change:
+                    self._on_token_cache_change(self.token_cache)
+                    self.token_cache.has_state_changed = False
+                if is_new:
+                    print("✅ Successfully authenticated with Microsoft Graph")
                 return True
             else:
                 print(f"❌ Authentication failed: {result.get('error_description', 'Unknown error')}")
@@ -74,13 +137,114 @@ class ConditionalAccessManager:
             print(f"❌ Authentication error: {e}")
             return False
     
+    @property
+    def graph(self) -> GraphClient:
+        """Pooled Graph transport used for all API calls."""
+        return self._graph_client or get_graph_client()
+    
+    def _refresh_in_background(self):
+        """Refresh the token on a background thread (at most one at a time)."""
+        with self._token_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        
+        def refresh():
+            try:
+                self.authenticate(force_refresh=True)
+            finally:
+                self._refreshing = False
+        
+        threading.Thread(target=refresh, name='token-refresh', daemon=True).start()
+    
+    def get_access_token(self) -> Optional[str]:
+        """
+        Return a valid access token, refreshing it ahead of expiry.
+        
+        Inside the refresh margin the current token is returned straight away
+        while a new one is fetched in the background; callers only wait on
+        Entra ID when there is no usable token at all.
+        
+        Returns:
+            Access token, or None if authentication fails
+        """
+        remaining = self.token_expires_at - time.time()
+        if self.access_token and remaining > self.TOKEN_REFRESH_MARGIN:
+            return self.access_token
+        if self.access_token and remaining > 60:
+            self._refresh_in_background()
+            return self.access_token
+        with self._token_lock:
+            if not self.access_token or self.token_expires_at - time.time() <= 60:
+                self.authenticate()
+        return self.access_token
+    
     def _get_headers(self) -> Dict[str, str]:
         """Get HTTP headers with authentication token."""
         return {
-            "Authorization": f"Bearer {self.access_token}",
+            "Authorization": f"Bearer {self.get_access_token()}",
             "Content-Type": "application/json"
         }
     
+    def _get_app_validator(self) -> ApplicationValidator:
+        """Application validator memoized for this manager (recreated if the token changes)."""
+        token = self.get_access_token()
+        if self._app_validator is None or self._app_validator_token != token:
+            self._app_validator = ApplicationValidator(
+                token,
+                verify_ssl=self.verify_ssl,
+                graph_client=self._graph_client,
+                tenant_id=self.tenant_id
+            )
+            self._app_validator_token = token
+        return self._app_validator
+    
+    def prefetch_applications(self, policies: Iterable[Dict]) -> None:
+        """
+        Validate the excluded applications of many policies in one pass.
+        
+        Call before deploying a batch of policies so that each later
+        create_policy() validates its apps without further Graph calls.
+        
+        Args:
+            policies: Policy definitions about to be deployed
+        """
+        self._get_app_validator().prefetch(policies)
+    
+    def _get_group_resolver(self) -> GroupNameResolver:
+        """Group name resolver memoized for this manager (recreated if the token changes)."""
+        token = self.get_access_token()
+        if self._group_resolver is None or self._group_resolver_token != token:
+            self._group_resolver = GroupNameResolver(
+                token,
+                verify_ssl=self.verify_ssl,
+                graph_client=self._graph_client,
+                tenant_id=self.tenant_id
+            )
+            self._group_resolver_token = token
+        return self._group_resolver
+    
+    def prefetch_groups(self, policies: Iterable[Dict]) -> None:
+        """
+        Resolve the group names used by many policies in one pass.
+        
+        Args:
+            policies: Policy definitions about to be deployed
+        """
+        self._get_group_resolver().prefetch(policies)
+    
+    def resolve_group_names(self, policy: Dict) -> Dict:
+        """
+        Replace group display names in a policy with object IDs.
+        
+        Args:
+            policy: Policy definition (not modified)
+            
+        Returns:
+            Copy of the policy with resolvable group names replaced
+        """
+        return self._get_group_resolver().resolve_policy(policy)
+    
     def validate_application_id(self, app_id: str) -> bool:
         """
         Validate if an application ID exists in the tenant.
@@ -91,32 +255,10 @@ class ConditionalAccessManager:
         Returns:
             True if the app exists, False otherwise
         """
-        try:
-            # Well-known Microsoft apps that always exist
-            well_known_apps = {
-                "00000003-0000-0000-c000-000000000000": "Microsoft Graph",
-                "0000000a-0000-0000-c000-000000000000": "Microsoft Intune (MAM/MDM)"
-            }
-            
-            if app_id in well_known_apps:
-                return True
-            
-            # Check if service principal exists
-            url = f"{self.graph_endpoint}/servicePrincipals?$filter=appId eq '{app_id}'"
-            response = requests.get(url, headers=self._get_headers(), verify=self.verify_ssl)
-            response.raise_for_status()
-            
-            result = response.json()
-            exists = len(result.get("value", [])) > 0
-            
-            if not exists:
-                print(f"⚠️  Application {app_id} not found in tenant")
-            
-            return exists
-            
-        except Exception as e:
-            print(f"❌ Error validating app {app_id}: {e}")
-            return False
+        exists = self._get_app_validator().validate([app_id]).get(app_id, False)
+        if not exists:
+            print(f"⚠️  Application {app_id} not found in tenant")
+        return exists
     
     def clean_policy_applications(self, policy_definition: Dict) -> Dict:
         """
@@ -128,48 +270,94 @@ class ConditionalAccessManager:
         Returns:
             Cleaned policy definition
         """
-        import copy
-        cleaned_policy = copy.deepcopy(policy_definition)
+        return self._get_app_validator().clean_policy(policy_definition)
+    
+    def iter_policies(self, top: Optional[int] = None, select: Optional[List[str]] = None) -> Iterator[Dict]:
+        """
+        Stream Conditional Access policies page by page.
         
-        try:
-            exclude_apps = cleaned_policy.get("conditions", {}).get("applications", {}).get("excludeApplications", [])
+        Pages are fetched lazily via @odata.nextLink, so callers can stop early.
+        
+        Args:
+            top: Optional page size ($top)
+            select: Optional list of fields to return ($select)
             
-            if exclude_apps:
-                print(f"🔍 Validating {len(exclude_apps)} excluded applications...")
-                valid_apps = []
-                
-                for app_id in exclude_apps:
-                    if self.validate_application_id(app_id):
-                        valid_apps.append(app_id)
-                    else:
-                        print(f"   ⚠️  Removing invalid app: {app_id}")
-                
-                if valid_apps:
-                    cleaned_policy["conditions"]["applications"]["excludeApplications"] = valid_apps
-                    print(f"   ✅ Kept {len(valid_apps)} valid excluded applications")
-                else:
-                    # Remove excludeApplications key if no valid apps remain
-                    del cleaned_policy["conditions"]["applications"]["excludeApplications"]
-                    print(f"   ℹ️  Removed excludeApplications (no valid apps)")
+        Yields:
+            CA policy objects
+            
+        Raises:
+            requests.exceptions.RequestException: If a page request fails
+        """
+        yield from self.graph.iter_values(
+            f"{self.graph_endpoint}/identity/conditionalAccess/policies",
+            params=odata_params(top=top, select=select),
+            headers=self._get_headers(),
+            verify=self.verify_ssl
+        )
+    
+    def iter_named_locations(self, top: Optional[int] = None, select: Optional[List[str]] = None) -> Iterator[Dict]:
+        """
+        Stream Conditional Access named locations page by page.
         
-        except Exception as e:
-            print(f"⚠️  Error cleaning policy applications: {e}")
+        Args:
+            top: Optional page size ($top)
+            select: Optional list of fields to return ($select)
+            
+        Yields:
+            Named location objects
+        """
+        yield from self.graph.iter_values(
+            f"{self.graph_endpoint}/identity/conditionalAccess/namedLocations",
+            params=odata_params(top=top, select=select),
+            headers=self._get_headers(),
+            verify=self.verify_ssl
+        )
+    
+    def iter_groups(self, filter: Optional[str] = None, top: Optional[int] = None,
+                    select: Optional[List[str]] = None) -> Iterator[Dict]:
+        """
+        Stream directory groups page by page.
+        
+        Args:
+            filter: Optional OData filter, e.g. "displayName eq 'CA-BreakGlassAccounts'"
+            top: Optional page size ($top)
+            select: Optional list of fields to return ($select)
+            
+        Yields:
+            Group objects
+        """
+        yield from self.graph.iter_values(
+            f"{self.graph_endpoint}/groups",
+            params=odata_params(top=top, select=select, filter=filter),
+            headers=self._get_headers(),
+            verify=self.verify_ssl
+        )
+    
+    def batch(self, sub_requests: List[Dict]) -> List[Dict]:
+        """
+        Send several Graph calls in as few JSON $batch round trips as possible.
         
-        return cleaned_policy
+        Args:
+            sub_requests: Dicts with 'method', 'url' (e.g. '/groups/{id}') and optional 'body'
+            
+        Returns:
+            One {'status', 'headers', 'body'} dict per sub-request, in input order
+        """
+        return self.graph.batch(sub_requests, headers=self._get_headers(), verify=self.verify_ssl)
     
-    def list_policies(self) -> List[Dict]:
+    def list_policies(self, select: Optional[List[str]] = None) -> List[Dict]:
         """
-        List all Conditional Access policies.
+        List all Conditional Access policies (all pages).
         
+        Args:
+            select: Optional list of fields to return ($select), e.g.
+                    SUMMARY_FIELDS for a lightweight listing
+            
         Returns:
             List of CA policy objects
         """
         try:
-            url = f"{self.graph_endpoint}/identity/conditionalAccess/policies"
-            response = requests.get(url, headers=self._get_headers(), verify=self.verify_ssl)
-            response.raise_for_status()
-            
-            policies = response.json().get("value", [])
+            policies = list(self.iter_policies(select=select))
             print(f"✅ Retrieved {len(policies)} Conditional Access policies")
             return policies
             
@@ -189,7 +377,7 @@ class ConditionalAccessManager:
         """
         try:
             url = f"{self.graph_endpoint}/identity/conditionalAccess/policies/{policy_id}"
-            response = requests.get(url, headers=self._get_headers(), verify=self.verify_ssl)
+            response = self.graph.get(url, headers=self._get_headers(), verify=self.verify_ssl)
             response.raise_for_status()
             
             policy = response.json()
@@ -215,7 +403,7 @@ class ConditionalAccessManager:
             cleaned_policy = self.clean_policy_applications(policy_definition)
             
             url = f"{self.graph_endpoint}/identity/conditionalAccess/policies"
-            response = requests.post(
+            response = self.graph.post(
                 url,
                 headers=self._get_headers(),
                 data=json.dumps(cleaned_policy),
@@ -246,7 +434,7 @@ class ConditionalAccessManager:
         """
         try:
             url = f"{self.graph_endpoint}/identity/conditionalAccess/policies/{policy_id}"
-            response = requests.patch(
+            response = self.graph.patch(
                 url,
                 headers=self._get_headers(),
                 data=json.dumps(policy_definition),
@@ -275,7 +463,7 @@ class ConditionalAccessManager:
         """
         try:
             url = f"{self.graph_endpoint}/identity/conditionalAccess/policies/{policy_id}"
-            response = requests.delete(url, headers=self._get_headers(), verify=self.verify_ssl)
+            response = self.graph.delete(url, headers=self._get_headers(), verify=self.verify_ssl)
             response.raise_for_status()
             
             print(f"✅ Deleted policy: {policy_id}")
@@ -285,6 +473,27 @@ class ConditionalAccessManager:
             print(f"❌ Error deleting policy: {e}")
             return False
     
+    def delete_policies(self, policy_ids: List[str], max_workers: Optional[int] = None) -> List[Dict]:
+        """
+        Delete many Conditional Access policies via $batch.
+        
+        Args:
+            policy_ids: Policy IDs (GUIDs) to delete
+            max_workers: Concurrent $batch calls (defaults to the client setting)
+            
+        Returns:
+            One result dict per ID, in input order (see batch_delete_policies)
+        """
+        results = batch_delete_policies(
+            self.graph, policy_ids,
+            headers=self._get_headers(),
+            verify=self.verify_ssl,
+            max_workers=max_workers
+        )
+        deleted = sum(1 for r in results if r['success'])
+        print(f"✅ Deleted {deleted} of {len(policy_ids)} policies")
+        return results
+    
     def enable_policy(self, policy_id: str) -> bool:
         """
         Enable a Conditional Access policy (set state to 'enabled').
@@ -445,6 +654,39 @@ class ConditionalAccessManager:
         print(f"Total: {len(policies)} policies\n")
 
 
+def batch_delete_policies(graph: GraphClient, policy_ids: List[str],
+                          max_workers: Optional[int] = None, **kwargs) -> List[Dict]:
+    """
+    Delete CA policies 20 per $batch call, several calls in flight at once.
+    
+    Throttled deletes are retried by GraphClient.batch with Retry-After /
+    exponential backoff with jitter.
+    
+    Args:
+        graph: Graph transport
+        policy_ids: Policy IDs (GUIDs) to delete
+        max_workers: Concurrent $batch calls
+        **kwargs: Passed through to the $batch requests (headers, verify...)
+        
+    Returns:
+        One {'id', 'success', 'status', 'error'} dict per ID, in input order
+    """
+    responses = graph.batch(
+        [{'method': 'DELETE', 'url': f'/identity/conditionalAccess/policies/{policy_id}'}
+         for policy_id in policy_ids],
+        max_workers=max_workers,
+        **kwargs
+    )
+    results = []
+    for policy_id, response in zip(policy_ids, responses):
+        success = response['status'] in (200, 204)
+        error = None
+        if not success:
+            error = ((response.get('body') or {}).get('error') or {}).get('message') or str(response['status'])
+        results.append({'id': policy_id, 'success': success, 'status': response['status'], 'error': error})
+    return results
+
+
 def create_sample_policy() -> Dict:
     """
     Create a sample CA policy template for reference.
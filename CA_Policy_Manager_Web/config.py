@@ -65,6 +65,54 @@ class Config:
     # Microsoft Graph
     GRAPH_ENDPOINT = 'https://graph.microsoft.com/v1.0'
     
+    # Graph HTTP transport (one pooled keep-alive session per worker)
+    GRAPH_POOL_SIZE = int(os.environ.get('GRAPH_POOL_SIZE', '20'))
+    GRAPH_CONNECT_TIMEOUT = float(os.environ.get('GRAPH_CONNECT_TIMEOUT', '5'))
+    GRAPH_READ_TIMEOUT = float(os.environ.get('GRAPH_READ_TIMEOUT', '30'))
+    GRAPH_THROTTLE_RETRIES = int(os.environ.get('GRAPH_THROTTLE_RETRIES', '3'))
+    GRAPH_BATCH_CONCURRENCY = int(os.environ.get('GRAPH_BATCH_CONCURRENCY', '4'))
+    
+    # Per-tenant Graph rate governor (requests/second; backs off on 429, recovers on success)
+    GRAPH_RATE_LIMIT = float(os.environ.get('GRAPH_RATE_LIMIT', '20'))
+    GRAPH_RATE_MIN = float(os.environ.get('GRAPH_RATE_MIN', '1'))
+    GRAPH_RATE_BURST = float(os.environ.get('GRAPH_RATE_BURST', '40'))
+    GRAPH_RATE_MAX_WAIT = float(os.environ.get('GRAPH_RATE_MAX_WAIT', '60'))
+    
+    # Parallel policy creates for "deploy all" (CA writes are throttled per tenant)
+    DEPLOY_CONCURRENCY = int(os.environ.get('DEPLOY_CONCURRENCY', '4'))
+    
+    # Directory lookup cache (group/app/object names, shared via Redis when REDIS_URL is set)
+    DIRECTORY_CACHE_SIZE = int(os.environ.get('DIRECTORY_CACHE_SIZE', '10000'))
+    DIRECTORY_CACHE_TTL = int(os.environ.get('DIRECTORY_CACHE_TTL', '900'))
+    DIRECTORY_CACHE_NEGATIVE_TTL = int(os.environ.get('DIRECTORY_CACHE_NEGATIVE_TTL', '120'))
+    
+    # Policy list snapshot per signed-in principal (seconds; ?refresh=true bypasses it)
+    POLICY_CACHE_TTL = int(os.environ.get('POLICY_CACHE_TTL', '60'))
+    
+    # Background jobs for bulk operations (jobs per worker; state kept this many
+    # seconds; JOB_QUEUE=redis dispatches them through Redis to any worker)
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))
+    JOB_TTL = int(os.environ.get('JOB_TTL', '3600'))
+    JOB_QUEUE = os.environ.get('JOB_QUEUE', 'thread').lower()
+    # Processes serving the app (gunicorn.conf.py sets it; the development
+    # server runs one). Without Redis, background jobs need a single process
+    WEB_WORKER_PROCESSES = int(os.environ.get('WEB_WORKER_PROCESSES', '1'))
+    
+    # Redis connection pool per worker (sessions, jobs, caches and the rate
+    # governor share it; keep it above JOB_WORKERS when JOB_QUEUE=redis)
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', '20'))
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', '10'))
+    
+    # In-memory session store used without Redis (most entries kept, least
+    # recently used evicted first; expired entries purged every N seconds)
+    SESSION_STORE_SIZE = int(os.environ.get('SESSION_STORE_SIZE', '10000'))
+    SESSION_SWEEP_INTERVAL = int(os.environ.get('SESSION_SWEEP_INTERVAL', '60'))
+    
+    # Per-worker near cache for Redis sessions (seconds; 0 = off). Writes are
+    # broadcast over Redis pub/sub so other workers drop their copies.
+    SESSION_NEAR_CACHE_TTL = float(os.environ.get('SESSION_NEAR_CACHE_TTL', '0'))
+    SESSION_NEAR_CACHE_SIZE = int(os.environ.get('SESSION_NEAR_CACHE_SIZE', '1000'))
+    
     # AI Configuration (optional)
     AZURE_OPENAI_ENDPOINT = os.environ.get('AZURE_OPENAI_ENDPOINT', '')
     AZURE_OPENAI_API_KEY = os.environ.get('AZURE_OPENAI_API_KEY', '')
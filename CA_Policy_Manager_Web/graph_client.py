@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+Graph Client - Pooled, keep-alive HTTP transport for Microsoft Graph
+Shared by ConditionalAccessManager and the Flask routes in app.py
+"""
+
+import os
+import json
+import time
+import base64
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Tuple, Iterator, List, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.directory_cache import MISSING
+from utils.rate_governor import RateGovernor, get_rate_governor
+
+GRAPH_ENDPOINT = "https://graph.microsoft.com/v1.0"
+
+# Graph accepts at most 20 sub-requests per JSON $batch call
+BATCH_LIMIT = 20
+
+# Status codes Graph uses for throttling / transient overload
+THROTTLE_STATUSES = {429, 503, 504}
+
+# Statuses that mean the request was not processed, so it is safe to resend
+# even a POST once the server's Retry-After has passed
+RETRY_STATUSES = {429, 503}
+
+# Methods whose request can be resent after a 504 (a gateway timeout may come
+# after the request was processed, so resending a POST could repeat it)
+IDEMPOTENT_METHODS = {'GET', 'DELETE'}
+
+
+def is_resendable(method: str, status: int) -> bool:
+    """Whether a throttled (sub-)request with this method and status may be resent."""
+    return status in RETRY_STATUSES or (status in THROTTLE_STATUSES and method.upper() in IDEMPOTENT_METHODS)
+
+
+class GraphClient:
+    """
+    Thin wrapper around a pooled requests.Session for Microsoft Graph.
+
+    Connections to graph.microsoft.com are kept alive and reused across
+    calls, so only the first request per pooled connection pays for the
+    TCP + TLS handshake. One instance is shared per worker process
+    (see get_graph_client()).
+    """
+
+    def __init__(self, base_url: str = GRAPH_ENDPOINT, pool_size: int = 20,
+                 connect_timeout: float = 5.0, read_timeout: float = 30.0,
+                 connect_retries: int = 2, throttle_retries: int = 3,
+                 max_retry_after: float = 30.0, batch_concurrency: int = 4,
+                 governor: Optional[RateGovernor] = None):
+        """
+        Initialize the Graph transport.
+
+        Args:
+            base_url: Graph API root used to resolve relative paths
+            pool_size: Maximum number of keep-alive connections per host
+            connect_timeout: Default seconds to wait for a connection
+            read_timeout: Default seconds to wait for a response
+            connect_retries: Retries for failed connection attempts (never
+                             retries a request that reached the server)
+            throttle_retries: Times a 429/503 response is retried after
+                              waiting for its Retry-After
+            max_retry_after: Upper bound in seconds for a single wait
+            batch_concurrency: $batch calls batch() keeps in flight at once
+            governor: Optional per-tenant rate governor every request passes
+                      through (the tenant is read from the bearer token)
+        """
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        self.throttle_retries = throttle_retries
+        self.max_retry_after = max_retry_after
+        self.batch_concurrency = max(1, batch_concurrency)
+        self.governor = governor
+        self._token_tenants: Dict[str, Optional[str]] = {}
+        self._token_tenants_lock = threading.Lock()
+
+        retry = Retry(
+            total=connect_retries,
+            connect=connect_retries,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=0.2,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+            pool_block=False
+        )
+
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Accept': 'application/json'})
+
+    def _build_url(self, url: str) -> str:
+        """Resolve a path such as '/groups' against the Graph root."""
+        if url.startswith('http://') or url.startswith('https://'):
+            return url
+        return f"{self.base_url}/{url.lstrip('/')}"
+
+    @staticmethod
+    def _auth_headers(headers: Optional[Dict[str, str]], access_token: Optional[str]) -> Dict[str, str]:
+        """Copy of headers with the bearer token of access_token added (if given)."""
+        merged: Dict[str, str] = dict(headers or {})
+        if access_token:
+            merged['Authorization'] = f'Bearer {access_token}'
+        return merged
+
+    def _tenant_for(self, headers: Optional[Dict[str, str]]) -> Optional[str]:
+        """Tenant ID of the bearer token in a headers dict (memoized per token)."""
+        authorization = (headers or {}).get('Authorization', '')
+        if not authorization.startswith('Bearer '):
+            return None
+        token = authorization[len('Bearer '):]
+        tenant_id = self._token_tenants.get(token, MISSING)
+        if tenant_id is MISSING:
+            tenant_id = tenant_id_from_token(token)
+            with self._token_tenants_lock:
+                if len(self._token_tenants) >= 256:
+                    self._token_tenants.clear()
+                self._token_tenants[token] = tenant_id
+        return tenant_id
+
+    def request(self, method: str, url: str, access_token: Optional[str] = None,
+                cost: int = 1, **kwargs: Any) -> requests.Response:
+        """
+        Send a request over the pooled session.
+        
+        Throttled responses (429/503) are retried up to throttle_retries
+        times, waiting for the Retry-After the server asked for (or an
+        exponential backoff with jitter when it gives none). With a governor,
+        each attempt first waits for the tenant's rate limit, and the wait
+        after a throttled response applies to every caller of that tenant.
+
+        Args:
+            method: HTTP method
+            url: Absolute Graph URL or path relative to base_url
+            access_token: Optional bearer token (added to headers if given)
+            cost: Rate governor tokens this request uses (sub-requests of a $batch)
+            **kwargs: Passed through to requests (headers, json, params, verify...)
+
+        Returns:
+            requests.Response
+        """
+        headers = self._auth_headers(kwargs.pop('headers', None), access_token)
+        kwargs.setdefault('timeout', self.timeout)
+        url = self._build_url(url)
+        tenant_id = self._tenant_for(headers) if self.governor else None
+
+        attempt = 0
+        while True:
+            if tenant_id:
+                self.governor.acquire(tenant_id, cost)
+            response = self.session.request(method, url, headers=headers, **kwargs)
+            if response.status_code not in RETRY_STATUSES:
+                if tenant_id:
+                    self.governor.record_success(tenant_id)
+                return response
+
+            attempt += 1
+            delay = min(_retry_after_seconds(response.headers, default=backoff_seconds(attempt)),
+                        self.max_retry_after)
+            if tenant_id:
+                # The governor pauses the tenant; the next acquire() waits
+                self.governor.record_throttle(tenant_id, delay)
+            if attempt > self.throttle_retries:
+                return response
+            if not tenant_id:
+                time.sleep(delay)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('PATCH', url, **kwargs)
+
+    def delete(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('DELETE', url, **kwargs)
+
+    def iter_pages(self, url: str, params: Optional[Dict[str, Any]] = None,
+                   **kwargs: Any) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Lazily yield each page of a Graph collection, following @odata.nextLink.
+
+        The next page is only requested when the caller asks for it, so
+        breaking out of the loop stops paging.
+
+        Args:
+            url: Collection URL or path
+            params: Query parameters for the first request (see odata_params)
+            **kwargs: Passed through to request (access_token, headers, verify...)
+
+        Yields:
+            The 'value' list of each page
+
+        Raises:
+            requests.exceptions.HTTPError: If any page request fails
+        """
+        next_url: Optional[str] = url
+        while next_url:
+            response = self.get(next_url, params=params, **kwargs)
+            response.raise_for_status()
+            data = response.json()
+            yield data.get('value', [])
+
+            # nextLink already carries the original query string
+            next_url = data.get('@odata.nextLink')
+            params = None
+
+    def iter_values(self, url: str, params: Optional[Dict[str, Any]] = None,
+                    **kwargs: Any) -> Iterator[Dict[str, Any]]:
+        """Lazily yield every item of a paged Graph collection."""
+        for page in self.iter_pages(url, params=params, **kwargs):
+            yield from page
+
+    def _relative_url(self, url: str) -> str:
+        """Strip the Graph root from a URL, as required inside $batch."""
+        if url.startswith(self.base_url):
+            url = url[len(self.base_url):]
+        return url if url.startswith('/') else f'/{url}'
+
+    def _send_batch_chunk(self, sub_requests: List[Dict[str, Any]], chunk: List[int],
+                          retry_throttled: bool, **kwargs: Any) -> Tuple[Dict[int, Dict[str, Any]], List[int], float]:
+        """
+        Send one $batch call for the sub-requests at the given indexes.
+
+        Returns:
+            (results by index, throttled indexes, longest Retry-After seen)
+        """
+        payload = []
+        for index in chunk:
+            sub = sub_requests[index]
+            entry: Dict[str, Any] = {
+                'id': str(index),
+                'method': sub.get('method', 'GET').upper(),
+                'url': self._relative_url(sub['url'])
+            }
+            if sub.get('body') is not None:
+                entry['body'] = sub['body']
+                entry['headers'] = {'Content-Type': 'application/json', **(sub.get('headers') or {})}
+            elif sub.get('headers'):
+                entry['headers'] = sub['headers']
+            payload.append(entry)
+
+        response = self.post('$batch', json={'requests': payload}, cost=len(chunk), **kwargs)
+        if retry_throttled and all(is_resendable(entry['method'], response.status_code) for entry in payload):
+            return {}, list(chunk), _retry_after_seconds(response.headers, default=0.0)
+        response.raise_for_status()
+
+        results: Dict[int, Dict[str, Any]] = {}
+        throttled: List[int] = []
+        retry_after = 0.0
+        for sub_response in response.json().get('responses', []):
+            index = int(sub_response['id'])
+            status = sub_response.get('status', 500)
+            headers = sub_response.get('headers') or {}
+            if retry_throttled and is_resendable(sub_requests[index].get('method', 'GET'), status):
+                throttled.append(index)
+                retry_after = max(retry_after, _retry_after_seconds(headers, default=0.0))
+                continue
+            results[index] = {
+                'status': status,
+                'headers': headers,
+                'body': sub_response.get('body')
+            }
+        if throttled and self.governor:
+            tenant_id = self._tenant_for(self._auth_headers(kwargs.get('headers'), kwargs.get('access_token')))
+            self.governor.record_throttle(tenant_id, retry_after or 1.0)
+        return results, throttled, retry_after
+
+    def batch(self, sub_requests: List[Dict[str, Any]], max_attempts: int = 3,
+              max_workers: Optional[int] = None, **kwargs: Any) -> List[Dict[str, Any]]:
+        """
+        Send sub-requests through JSON $batch, BATCH_LIMIT at a time.
+
+        Up to max_workers $batch calls are in flight at once. Throttled
+        sub-responses (429/503, and 504 for GET/DELETE) are retried on their
+        own after the longest Retry-After in that round (or an exponential
+        backoff with jitter when none is given); successful siblings are not
+        resent. A 504 to a POST sub-request is returned as is, since Graph
+        may already have processed it.
+
+        Args:
+            sub_requests: Dicts with 'method' and 'url' (path such as
+                          '/groups/{id}'), plus optional 'body' and 'headers'
+            max_attempts: Attempts per sub-request before giving up
+            max_workers: Concurrent $batch calls (defaults to batch_concurrency)
+            **kwargs: Passed through to request (access_token, headers, verify...)
+
+        Returns:
+            One {'status', 'headers', 'body'} dict per sub-request, in input order
+
+        Raises:
+            requests.exceptions.HTTPError: If a $batch call itself fails
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(sub_requests)
+        pending = list(range(len(sub_requests)))
+        workers = max(1, max_workers or self.batch_concurrency)
+        attempt = 0
+
+        while pending:
+            attempt += 1
+            retry_throttled = attempt < max_attempts
+            chunks = [pending[start:start + BATCH_LIMIT] for start in range(0, len(pending), BATCH_LIMIT)]
+
+            if workers == 1 or len(chunks) == 1:
+                outcomes = [self._send_batch_chunk(sub_requests, chunk, retry_throttled, **kwargs)
+                            for chunk in chunks]
+            else:
+                with ThreadPoolExecutor(max_workers=min(workers, len(chunks)),
+                                        thread_name_prefix='graph-batch') as executor:
+                    futures = [executor.submit(self._send_batch_chunk, sub_requests, chunk,
+                                               retry_throttled, **kwargs)
+                               for chunk in chunks]
+                    outcomes = [future.result() for future in futures]
+
+            throttled: List[int] = []
+            retry_after = 0.0
+            for chunk_results, chunk_throttled, chunk_retry_after in outcomes:
+                for index, result in chunk_results.items():
+                    results[index] = result
+                throttled.extend(chunk_throttled)
+                retry_after = max(retry_after, chunk_retry_after)
+
+            pending = sorted(throttled)
+            if pending:
+                time.sleep(min(retry_after or backoff_seconds(attempt), self.max_retry_after))
+
+        return [r if r is not None else {'status': 500, 'headers': {}, 'body': None} for r in results]
+
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
+
+
+def _retry_after_seconds(headers: Dict[str, Any], default: float = 1.0) -> float:
+    """Read a Retry-After header (seconds), falling back to a default."""
+    for key, value in (headers or {}).items():
+        if key.lower() == 'retry-after':
+            try:
+                return max(float(value), 0.0)
+            except (TypeError, ValueError):
+                return default
+    return default
+
+
+def backoff_seconds(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter for the given (1-based) attempt."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _token_claims(access_token: Optional[str]) -> Dict[str, Any]:
+    """Decode the claims of a JWT access token without checking its signature."""
+    try:
+        payload = access_token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))
+    except Exception:
+        return {}
+
+
+def tenant_id_from_token(access_token: Optional[str]) -> Optional[str]:
+    """
+    Read the tenant ID ('tid' claim) from a Graph access token.
+
+    The signature is not checked - Graph does that on every call. The value
+    is only used to partition caches and rate limits per tenant.
+    """
+    return _token_claims(access_token).get('tid')
+
+
+def token_identity(access_token: Optional[str]) -> Optional[Tuple[str, str]]:
+    """
+    (tenant ID, principal object ID) of a Graph access token.
+
+    The principal is the signed-in user for delegated tokens and the service
+    principal for app-only tokens. Used to partition per-principal caches.
+    """
+    claims = _token_claims(access_token)
+    tenant_id = claims.get('tid')
+    principal_id = claims.get('oid') or claims.get('appid') or claims.get('sub')
+    return (tenant_id, principal_id) if tenant_id and principal_id else None
+
+
+def odata_params(top: Optional[int] = None, select: Optional[Union[str, List[str]]] = None,
+                 filter: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build OData query parameters, skipping any that are not set.
+
+    Args:
+        top: Page size ($top)
+        select: Field list ($select), as a comma-separated string or list
+        filter: OData filter expression ($filter)
+
+    Returns:
+        Dictionary suitable for the params argument of GraphClient calls
+    """
+    params: Dict[str, Any] = {}
+    if top:
+        params['$top'] = int(top)
+    if select:
+        params['$select'] = select if isinstance(select, str) else ','.join(select)
+    if filter:
+        params['$filter'] = filter
+    return params
+
+
+# Per-worker singleton. The owning PID is tracked so that a client created
+# before gunicorn forks is never shared (sockets must not cross processes).
+_client: Optional[GraphClient] = None
+_client_pid: Optional[int] = None
+_client_settings: Dict[str, Any] = {}
+_client_lock = threading.Lock()
+
+
+def configure_graph_client(**settings: Any):
+    """
+    Set the constructor arguments used for the shared GraphClient.
+
+    Args:
+        **settings: Keyword arguments for GraphClient (pool_size, read_timeout...)
+    """
+    global _client, _client_pid
+    with _client_lock:
+        _client_settings.clear()
+        _client_settings.update({k: v for k, v in settings.items() if v is not None})
+        if _client is not None:
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+def get_graph_client() -> GraphClient:
+    """
+    Return the GraphClient for the current worker process, creating it on first use.
+
+    Unless configured otherwise, it reports to the shared RateGovernor.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = GraphClient(**{'governor': get_rate_governor(), **_client_settings})
+                _client_pid = pid
+    return _client
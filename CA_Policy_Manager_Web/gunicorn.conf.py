@@ -0,0 +1,50 @@
+"""
+Gunicorn configuration for CA Policy Manager
+
+Usage:
+    gunicorn --config gunicorn.conf.py app:app
+
+Preload mode (GUNICORN_PRELOAD=true) imports app.py once in the master
+process before forking. The template library, the compiled template registry,
+the precompressed /api/templates payload and the imported modules are then
+shared copy-on-write by all workers instead of being built in each one. This
+is safe because importing app.py opens no network connections: Redis, the
+Graph connection pool and the AI client are created per worker in post_fork.
+
+Note that with preload, code changes need a full restart (a HUP reload keeps
+the preloaded app).
+"""
+
+import gc
+import os
+import sys
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '4'))
+# Threads per worker (gthread). An open job progress stream holds a thread
+# until the job finishes, so a single-threaded sync worker would be blocked
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '600'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'false').lower() == 'true'
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """Master is ready (and has imported the app if preloading)."""
+    if preload_app:
+        # Move everything allocated so far out of the GC's reach so collections
+        # in the workers do not touch (and so copy) the shared pages
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    """Create the worker's own network clients right after fork."""
+    # Read by config.py (WEB_WORKER_PROCESSES): without Redis, background job
+    # state is only reachable from every request when there is one worker
+    os.environ['WEB_WORKER_PROCESSES'] = str(server.cfg.workers)
+    web_app = sys.modules.get('app')
+    if web_app is not None and hasattr(web_app, 'init_worker'):
+        # Preloaded: the config was read in the master, before this was set
+        web_app.app.config['WEB_WORKER_PROCESSES'] = server.cfg.workers
+        web_app.init_worker()
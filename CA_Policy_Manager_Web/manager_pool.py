@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Manager Pool - Per-worker pool of authenticated ConditionalAccessManager instances
+Managers are keyed by (tenant, client) and reused across requests and sessions;
+their MSAL token caches are persisted through SessionManager so a new worker
+(or a restarted one) starts with a valid token
+"""
+
+import hmac
+import hashlib
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from ca_policy_manager import ConditionalAccessManager
+from utils.directory_cache import MISSING, TTLCache
+
+if TYPE_CHECKING:
+    import msal
+
+
+class ManagerPool:
+    """
+    Bounded LRU of authenticated managers for client-credential sessions.
+
+    A pooled manager is only handed out to callers presenting the same client
+    secret it was created with.
+    """
+
+    def __init__(self, session_manager=None, maxsize: int = 64, idle_ttl: int = 3600):
+        """
+        Args:
+            session_manager: Optional SessionManager used to persist token caches
+            maxsize: Maximum number of managers kept per worker
+            idle_ttl: Seconds an unused manager stays in the pool
+        """
+        self.session_manager = session_manager
+        self.idle_ttl = idle_ttl
+        self._managers = TTLCache(maxsize=maxsize, ttl=idle_ttl)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(tenant_id: str, client_id: str, client_secret: str) -> str:
+        # The secret's hash is part of the key: MSAL would otherwise hand a
+        # cached token to anyone who knows only the tenant and client ID
+        secret_hash = hashlib.sha256(client_secret.encode()).hexdigest()[:32]
+        return f"{tenant_id}:{client_id}:{secret_hash}"
+
+    @staticmethod
+    def _same_secret(stored: str, given: str) -> bool:
+        # compare_digest only accepts ASCII str, so compare the UTF-8 bytes
+        return hmac.compare_digest(stored.encode('utf-8'), given.encode('utf-8'))
+
+    def _load_token_cache(self, cache_key: str) -> 'msal.SerializableTokenCache':
+        import msal
+        token_cache = msal.SerializableTokenCache()
+        if self.session_manager is not None:
+            serialized = self.session_manager.get_token_cache(cache_key)
+            if serialized:
+                try:
+                    token_cache.deserialize(serialized)
+                except Exception as e:
+                    print(f"⚠️  Ignoring unreadable token cache for {cache_key}: {e}")
+        return token_cache
+
+    def _persist_callback(self, cache_key: str):
+        def persist(token_cache: 'msal.SerializableTokenCache'):
+            if self.session_manager is not None:
+                self.session_manager.set_token_cache(cache_key, token_cache.serialize(), ttl=self.idle_ttl)
+        return persist
+
+    def get(self, tenant_id: str, client_id: str, client_secret: str,
+            verify_ssl: bool = True) -> Optional[ConditionalAccessManager]:
+        """
+        Return an authenticated manager for the credentials, creating it if needed.
+
+        Args:
+            tenant_id: Azure AD Tenant ID
+            client_id: App Registration Client ID
+            client_secret: Client Secret
+            verify_ssl: Enable SSL certificate verification
+
+        Returns:
+            ConditionalAccessManager with a valid token, or None if authentication fails
+        """
+        key = (tenant_id, client_id, bool(verify_ssl))
+        manager = self._managers.get(key)
+        if manager is not MISSING and self._same_secret(manager.client_secret, client_secret):
+            return manager if manager.get_access_token() else None
+
+        with self._lock:
+            manager = self._managers.get(key)
+            if manager is MISSING or not self._same_secret(manager.client_secret, client_secret):
+                cache_key = self._cache_key(tenant_id, client_id, client_secret)
+                manager = ConditionalAccessManager(
+                    tenant_id=tenant_id,
+                    client_id=client_id,
+                    client_secret=client_secret,
+                    verify_ssl=verify_ssl,
+                    token_cache=self._load_token_cache(cache_key),
+                    on_token_cache_change=self._persist_callback(cache_key)
+                )
+                if not manager.authenticate():
+                    return None
+                self._managers.set(key, manager)
+
+        return manager if manager.get_access_token() else None
+
+    def discard(self, tenant_id: str, client_id: str):
+        """Drop pooled managers for a tenant/client pair (e.g. after a secret rotation)."""
+        for verify_ssl in (True, False):
+            self._managers.delete((tenant_id, client_id, verify_ssl))
+
+    def stats(self) -> Dict[str, Any]:
+        return self._managers.stats()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Import-time report for app.py
+
+Shows what a gunicorn worker pays to import the app, which heavy dependencies
+are deferred until first use (MSAL, BeautifulSoup/pandas, OpenAI SDK) and how
+much startup time that saves per worker.
+
+Usage (from CA_Policy_Manager_Web):
+    python scripts/import_time_report.py [--runs 3] [--top 15]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the app loads lazily, and what needs them
+DEFERRED_MODULES = {
+    'msal': 'client-credential sign-in',
+    'utils.report_analyzer': 'security report analysis (BeautifulSoup, pandas)',
+    'openai': 'AI policy explanations',
+}
+
+CHECK_LOADED = ('msal', 'bs4', 'pandas', 'openai', 'redis', 'utils.report_analyzer')
+
+
+def run_importtime(code: str) -> Tuple[Dict[str, int], Dict[str, int], str]:
+    """
+    Run code with -X importtime.
+
+    Returns:
+        ({module: cumulative microseconds}, {module: nesting depth}, stdout)
+    """
+    env = dict(os.environ)
+    env.setdefault('SECRET_KEY', 'import-time-report')
+    env.setdefault('DEMO_MODE', 'true')
+    env['PYTHONPATH'] = APP_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=APP_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else 'import failed')
+
+    timings, depths = {}, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = int(cumulative_us.strip())
+        depths[name.strip()] = (len(name) - len(name.lstrip())) // 2
+    return timings, depths, result.stdout
+
+
+def direct_imports(timings: Dict[str, int], depths: Dict[str, int], limit: int) -> List[Tuple[str, int]]:
+    """Largest modules imported directly by app.py."""
+    direct = [(name, us) for name, us in timings.items() if depths.get(name) == 1]
+    return sorted(direct, key=lambda item: item[1], reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help='Measurements to take (median is reported)')
+    parser.add_argument('--top', type=int, default=15, help='Number of modules to list')
+    args = parser.parse_args()
+
+    check = ','.join(repr(m) for m in CHECK_LOADED)
+    app_code = f"import sys, app; print('LOADED:' + ','.join(m for m in ({check}) if m in sys.modules))"
+
+    app_runs, deferred_runs = [], {name: [] for name in DEFERRED_MODULES}
+    timings, depths, loaded = {}, {}, ''
+    for _ in range(max(1, args.runs)):
+        timings, depths, loaded = run_importtime(app_code)
+        app_runs.append(timings.get('app', 0))
+        for name in DEFERRED_MODULES:
+            try:
+                deferred, _, _ = run_importtime(f"import app; import {name}")
+                deferred_runs[name].append(deferred.get(name, 0))
+            except RuntimeError:
+                deferred_runs[name].append(None)
+
+    app_us = statistics.median(app_runs)
+    print(f"📊 import app: {app_us / 1000:.1f} ms (median of {len(app_runs)})")
+    print("\nLargest direct imports:")
+    for name, cumulative in direct_imports(timings, depths, args.top):
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    loaded = next((line[len('LOADED:'):] for line in loaded.splitlines() if line.startswith('LOADED:')), '')
+    print(f"\nHeavy modules loaded by 'import app': {loaded or 'none of ' + ', '.join(CHECK_LOADED)}")
+
+    print("\nDeferred until first use:")
+    saved_us = 0
+    for name, purpose in DEFERRED_MODULES.items():
+        samples = [s for s in deferred_runs[name] if s is not None]
+        if not samples:
+            print(f"  {'n/a':>8}     {name} (not installed) - {purpose}")
+            continue
+        cost = statistics.median(samples)
+        saved_us += cost
+        print(f"  {cost / 1000:8.1f} ms  {name} - {purpose}")
+
+    print(f"\n✅ Startup saving: {saved_us / 1000:.1f} ms per worker "
+          f"({saved_us / (app_us + saved_us) * 100 if app_us + saved_us else 0:.0f}% of an eager import)")
+    print("   With GUNICORN_PRELOAD=true the remaining import cost is paid once, in the master.")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,44 +2,117 @@
 """
 Session Manager - Redis-backed session storage with in-memory fallback
 Supports production scaling and development scenarios
+
+Each session is one Redis hash (session:<id>) holding the stored manager
+credentials and the AI usage counters, so a read or an update is a single
+round trip and the whole session expires (or is cleared) as one key.
+
+With a near cache enabled, each worker also keeps recently read sessions in
+memory for a few seconds. Every write publishes the session ID on a Redis
+channel, and all workers drop their copy when they receive it.
 """
 
 import os
 import json
+import time
+import threading
 from typing import Optional, Dict, Any
 from datetime import timedelta
 
+from utils.directory_cache import MISSING, TTLCache
+from utils.session_store import MemorySessionStore
+
+# AI usage counters kept as hash fields (field -> type)
+AI_STAT_FIELDS = {
+    'explanations': int,
+    'tokens_used': int,
+    'total_cost': float,
+    'response_time_total': float
+}
+
+# Pub/sub channel carrying the IDs of sessions written by any worker
+INVALIDATION_CHANNEL = 'session_invalidate'
+
 class SessionManager:
     """
     Manages user sessions with Redis backend for production,
     fallback to in-memory for development.
+    
+    The Redis connection is opened on first use in each process, so the
+    manager can be created before gunicorn forks its workers (--preload).
     """
     
-    def __init__(self, redis_url: Optional[str] = None):
+    def __init__(self, redis_url: Optional[str] = None, max_connections: int = 20,
+                 socket_timeout: float = 10, session_ttl: int = 3600,
+                 memory_maxsize: int = 10000, sweep_interval: float = 60,
+                 near_cache_ttl: float = 0, near_cache_size: int = 1000):
         """
         Initialize session manager.
         
         Args:
             redis_url: Redis connection URL (uses env var if not provided)
+            max_connections: Size of the per-process Redis connection pool
+                             (shared by everything that uses redis_client)
+            socket_timeout: Seconds to wait for a Redis reply or a free pooled connection
+            session_ttl: Seconds a session is kept after its last update
+            memory_maxsize: Most entries kept by the in-memory fallback (LRU beyond that)
+            sweep_interval: Seconds between purges of expired in-memory entries
+            near_cache_ttl: Seconds a worker may serve a session read from Redis
+                            without asking again (0 disables the near cache)
+            near_cache_size: Most sessions kept in each worker's near cache
         """
         self.redis_url = redis_url or os.environ.get('REDIS_URL')
         self.use_redis = self.redis_url is not None
-        self.redis_client = None
-        self.in_memory_sessions = {}
-        self.session_ttl = 3600  # 1 hour default
+        self.max_connections = max_connections
+        self.socket_timeout = socket_timeout
+        self._redis_client = None
+        self._redis_pid = None
+        self.session_ttl = session_ttl
+        # Used without Redis (or if it is unreachable): per-entry TTL, LRU size cap
+        self.memory_store = MemorySessionStore(
+            maxsize=memory_maxsize,
+            ttl=session_ttl,
+            sweep_interval=sweep_interval
+        )
+        # Per-worker copies of Redis sessions; only used while subscribed to
+        # INVALIDATION_CHANNEL, since missed invalidations would serve stale data
+        self.near_cache = TTLCache(maxsize=near_cache_size, ttl=near_cache_ttl) if near_cache_ttl > 0 else None
+        self._near_cache_ready = False
+        self._near_cache_generation = 0
         
-        if self.use_redis:
-            self._initialize_redis()
-        else:
+        if not self.use_redis:
             print("ℹ️  Using in-memory session storage (development only)")
     
+    @property
+    def redis_client(self):
+        """Redis client for the current process (connected on first use, never inherited across fork)"""
+        if self.use_redis and self._redis_pid != os.getpid():
+            self._initialize_redis()
+        return self._redis_client
+    
     def _initialize_redis(self):
-        """Initialize Redis client"""
+        """Initialize Redis client on an explicit, bounded connection pool"""
+        self._redis_pid = os.getpid()
+        self._redis_client = None
         try:
             import redis
-            self.redis_client = redis.from_url(self.redis_url, decode_responses=True)
-            self.redis_client.ping()
+            # Blocking pool: when every connection is busy, callers wait for
+            # one (up to socket_timeout) instead of failing immediately
+            pool = redis.BlockingConnectionPool.from_url(
+                self.redis_url,
+                max_connections=self.max_connections,
+                timeout=self.socket_timeout,
+                socket_timeout=self.socket_timeout,
+                socket_connect_timeout=self.socket_timeout,
+                health_check_interval=30,
+                decode_responses=True
+            )
+            client = redis.Redis(connection_pool=pool)
+            client.ping()
+            self._redis_client = client
             print("✅ Connected to Redis for session management")
+            if self.near_cache is not None:
+                self._start_invalidation_listener(client)
         except ImportError:
             print("⚠️  redis package not installed. Install with: pip install redis")
             self.use_redis = False
@@ -48,30 +121,149 @@ class SessionManager:
             print("   Falling back to in-memory session storage")
             self.use_redis = False
     
+    @staticmethod
+    def _key(session_id: str) -> str:
+        """Redis hash holding one session's state"""
+        return f"session:{session_id}"
+    
+    @staticmethod
+    def _ai_stats(fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """AI usage counters from hash fields (None if the session has none yet)"""
+        if not any(fields.get(name) is not None for name in AI_STAT_FIELDS):
+            return None
+        return {name: cast(fields.get(name) or 0) for name, cast in AI_STAT_FIELDS.items()}
+    
+    def _write(self, session_id: str, ttl: Optional[int], set_fields: Optional[Dict[str, Any]] = None,
+               delete_fields: tuple = ()):
+        """Set/delete hash fields and refresh the session TTL in one MULTI round trip"""
+        key = self._key(session_id)
+        pipe = self.redis_client.pipeline(transaction=True)
+        if delete_fields:
+            pipe.hdel(key, *delete_fields)
+        if set_fields:
+            pipe.hset(key, mapping=set_fields)
+        pipe.expire(key, ttl or self.session_ttl)
+        self._publish_invalidation(pipe, session_id)
+        pipe.execute()
+    
+    def _start_invalidation_listener(self, client):
+        """Subscribe this process to session invalidations (daemon thread)"""
+        self.near_cache.clear()
+        self._near_cache_ready = False
+        threading.Thread(
+            target=self._listen_for_invalidations,
+            args=(client, os.getpid()),
+            name='session-invalidation',
+            daemon=True
+        ).start()
+    
+    def _listen_for_invalidations(self, client, pid: int):
+        """Drop near-cache entries written by any worker; resubscribes after errors"""
+        while self._redis_pid == pid:
+            pubsub = client.pubsub()
+            try:
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                while self._redis_pid == pid:
+                    message = pubsub.get_message(timeout=1.0)
+                    if not message:
+                        continue
+                    if message['type'] == 'subscribe':
+                        # Only serve cached sessions once invalidations are guaranteed to arrive
+                        self._near_cache_ready = True
+                    elif message['type'] == 'message':
+                        self._near_cache_invalidate(message['data'])
+            except Exception as e:
+                print(f"⚠️  Session invalidation listener error: {e}")
+                time.sleep(1)
+            finally:
+                # Invalidations may have been missed while unsubscribed
+                self._near_cache_ready = False
+                self.near_cache.clear()
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+    
+    def _near_cache_get(self, session_id: str) -> Any:
+        """Cached session state, or MISSING"""
+        if not self._near_cache_ready:
+            return MISSING
+        return self.near_cache.get(session_id)
+    
+    def _near_cache_set(self, session_id: str, state: Dict[str, Any], generation: int):
+        """Cache state read from Redis, unless an invalidation arrived during the read"""
+        if self._near_cache_ready and generation == self._near_cache_generation:
+            self.near_cache.set(session_id, state)
+    
+    def _near_cache_invalidate(self, session_id: str):
+        self._near_cache_generation += 1
+        self.near_cache.delete(session_id)
+    
+    def _publish_invalidation(self, pipe, session_id: str):
+        """Queue the invalidation on a write pipeline (sent in the same round trip)"""
+        if self.near_cache is not None:
+            self._near_cache_invalidate(session_id)
+            pipe.publish(INVALIDATION_CHANNEL, session_id)
+    
+    def get_session(self, session_id: str) -> Dict[str, Any]:
+        """
+        Retrieve all state of a session in one read.
+        
+        Args:
+            session_id: Session identifier
+        
+        Returns:
+            {'manager': manager data or None, 'ai_stats': counters or None}
+        """
+        try:
+            if self.use_redis and self.redis_client:
+                if self.near_cache is not None:
+                    cached = self._near_cache_get(session_id)
+                    if cached is not MISSING:
+                        return cached
+                generation = self._near_cache_generation
+                fields = self.redis_client.hgetall(self._key(session_id))
+                manager = fields.get('manager')
+                state = {
+                    'manager': json.loads(manager) if manager else None,
+                    'ai_stats': self._ai_stats(fields)
+                }
+                if self.near_cache is not None:
+                    self._near_cache_set(session_id, state, generation)
+                return state
+            else:
+                fields = self.memory_store.get(session_id) or {}
+                return {'manager': fields.get('manager'), 'ai_stats': self._ai_stats(fields)}
+        except Exception as e:
+            print(f"❌ Error retrieving session {session_id}: {e}")
+            return {'manager': None, 'ai_stats': None}
+    
     def get_manager(self, session_id: str) -> Optional[Dict[str, Any]]:
         """
         Retrieve manager data for session.
         
         Args:
             session_id: Session identifier
-            
+        
         Returns:
             Manager data or None if not found
         """
         try:
             if self.use_redis and self.redis_client:
-                data = self.redis_client.get(f"manager:{session_id}")
+                if self.near_cache is not None:
+                    return self.get_session(session_id)['manager']
+                data = self.redis_client.hget(self._key(session_id), 'manager')
                 return json.loads(data) if data else None
             else:
-                return self.in_memory_sessions.get(session_id)
+                return (self.memory_store.get(session_id) or {}).get('manager')
         except Exception as e:
             print(f"❌ Error retrieving session {session_id}: {e}")
             return None
     
-    def set_manager(self, session_id: str, manager_data: Dict[str, Any], 
+    def set_manager(self, session_id: str, manager_data: Dict[str, Any],
                    ttl: Optional[int] = None):
         """
-        Store manager data for session.
+        Store manager data for session (None removes it).
         
         Args:
             session_id: Session identifier
@@ -79,16 +271,17 @@ class SessionManager:
             ttl: Time to live in seconds (uses default if not provided)
         """
         try:
-            ttl = ttl or self.session_ttl
-            
             if self.use_redis and self.redis_client:
-                self.redis_client.setex(
-                    f"manager:{session_id}",
-                    ttl,
-                    json.dumps(manager_data)
-                )
+                if manager_data is None:
+                    self._write(session_id, ttl, delete_fields=('manager',))
+                else:
+                    self._write(session_id, ttl, set_fields={'manager': json.dumps(manager_data)})
             else:
-                self.in_memory_sessions[session_id] = manager_data
+                self.memory_store.update(
+                    session_id,
+                    lambda fields: {**(fields or {}), 'manager': manager_data},
+                    ttl
+                )
         except Exception as e:
             print(f"❌ Error storing session {session_id}: {e}")
     
@@ -96,31 +289,113 @@ class SessionManager:
         """Get AI usage stats for session"""
         try:
             if self.use_redis and self.redis_client:
-                data = self.redis_client.get(f"ai_stats:{session_id}")
-                return json.loads(data) if data else None
+                if self.near_cache is not None:
+                    return self.get_session(session_id)['ai_stats']
+                values = self.redis_client.hmget(self._key(session_id), list(AI_STAT_FIELDS))
+                return self._ai_stats(dict(zip(AI_STAT_FIELDS, values)))
             else:
-                return self.in_memory_sessions.get(f"ai_stats:{session_id}")
+                return self._ai_stats(self.memory_store.get(session_id) or {})
         except Exception as e:
             print(f"❌ Error retrieving AI stats for {session_id}: {e}")
             return None
     
-    def set_ai_stats(self, session_id: str, stats: Dict[str, Any], 
+    def set_ai_stats(self, session_id: str, stats: Dict[str, Any],
                     ttl: Optional[int] = None):
         """Set AI usage stats for session"""
         try:
-            ttl = ttl or self.session_ttl
+            fields = {name: cast(stats.get(name) or 0) for name, cast in AI_STAT_FIELDS.items()}
             
             if self.use_redis and self.redis_client:
-                self.redis_client.setex(
-                    f"ai_stats:{session_id}",
-                    ttl,
-                    json.dumps(stats)
-                )
+                self._write(session_id, ttl, set_fields=fields)
             else:
-                self.in_memory_sessions[f"ai_stats:{session_id}"] = stats
+                self.memory_store.update(session_id, lambda current: {**(current or {}), **fields}, ttl)
         except Exception as e:
             print(f"❌ Error storing AI stats for {session_id}: {e}")
     
+    def record_ai_usage(self, session_id: str, tokens: int, cost: float, response_time: float,
+                        ttl: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Count one AI response against the session's usage stats.
+        
+        The counters are incremented atomically (HINCRBY/HINCRBYFLOAT) and the
+        session TTL refreshed in the same MULTI, so concurrent requests never
+        overwrite each other's updates.
+        
+        Args:
+            session_id: Session identifier
+            tokens: Prompt plus completion tokens
+            cost: Cost of the response in USD
+            response_time: Seconds the response took
+            ttl: Time to live in seconds (uses default if not provided)
+        
+        Returns:
+            The updated stats, or None if they could not be stored
+        """
+        try:
+            if self.use_redis and self.redis_client:
+                key = self._key(session_id)
+                pipe = self.redis_client.pipeline(transaction=True)
+                pipe.hincrby(key, 'explanations', 1)
+                pipe.hincrby(key, 'tokens_used', tokens)
+                pipe.hincrbyfloat(key, 'total_cost', cost)
+                pipe.hincrbyfloat(key, 'response_time_total', response_time)
+                pipe.expire(key, ttl or self.session_ttl)
+                self._publish_invalidation(pipe, session_id)
+                values = pipe.execute()[:len(AI_STAT_FIELDS)]
+                return self._ai_stats(dict(zip(AI_STAT_FIELDS, values)))
+            else:
+                increments = {'explanations': 1, 'tokens_used': tokens,
+                              'total_cost': cost, 'response_time_total': response_time}
+                
+                def add(current):
+                    current = current or {}
+                    return {**current, **{name: (current.get(name) or 0) + amount
+                                          for name, amount in increments.items()}}
+                
+                return self._ai_stats(self.memory_store.update(session_id, add, ttl))
+        except Exception as e:
+            print(f"❌ Error storing AI stats for {session_id}: {e}")
+            return None
+    
+    def get_token_cache(self, cache_key: str) -> Optional[str]:
+        """
+        Get a serialized MSAL token cache.
+        
+        Args:
+            cache_key: Cache identifier (e.g. '<tenant_id>:<client_id>')
+        
+        Returns:
+            Serialized cache or None if not found
+        """
+        try:
+            if self.use_redis and self.redis_client:
+                return self.redis_client.get(f"msal_cache:{cache_key}")
+            else:
+                return self.memory_store.get(f"msal_cache:{cache_key}")
+        except Exception as e:
+            print(f"❌ Error retrieving token cache {cache_key}: {e}")
+            return None
+    
+    def set_token_cache(self, cache_key: str, serialized_cache: str,
+                        ttl: Optional[int] = None):
+        """
+        Store a serialized MSAL token cache so other workers can reuse its tokens.
+        
+        Args:
+            cache_key: Cache identifier (e.g. '<tenant_id>:<client_id>')
+            serialized_cache: Output of SerializableTokenCache.serialize()
+            ttl: Time to live in seconds (uses default if not provided)
+        """
+        try:
+            ttl = ttl or self.session_ttl
+            
+            if self.use_redis and self.redis_client:
+                self.redis_client.setex(f"msal_cache:{cache_key}", ttl, serialized_cache)
+            else:
+                self.memory_store.set(f"msal_cache:{cache_key}", serialized_cache, ttl)
+        except Exception as e:
+            print(f"❌ Error storing token cache {cache_key}: {e}")
+    
     def clear_session(self, session_id: str):
         """
         Clear all data for session.
@@ -130,17 +405,37 @@ class SessionManager:
         """
         try:
             if self.use_redis and self.redis_client:
-                self.redis_client.delete(f"manager:{session_id}")
-                self.redis_client.delete(f"ai_stats:{session_id}")
+                pipe = self.redis_client.pipeline(transaction=True)
+                pipe.delete(self._key(session_id))
+                self._publish_invalidation(pipe, session_id)
+                pipe.execute()
             else:
-                self.in_memory_sessions.pop(session_id, None)
-                self.in_memory_sessions.pop(f"ai_stats:{session_id}", None)
+                self.memory_store.delete(session_id)
         except Exception as e:
             print(f"❌ Error clearing session {session_id}: {e}")
     
-    def cleanup_expired(self):
-        """Cleanup expired in-memory sessions (manual for non-Redis)"""
-        if not self.use_redis:
-            # In-memory sessions don't auto-expire
-            # In production (Redis), expiration is automatic
-            pass
+    def cleanup_expired(self) -> int:
+        """
+        Cleanup expired in-memory sessions now instead of waiting for the sweeper.
+        
+        In production (Redis), expiration is automatic.
+        
+        Returns:
+            Number of entries removed
+        """
+        if self.use_redis:
+            return 0
+        return self.memory_store.sweep()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Storage backend, in-memory store and near cache counters for monitoring"""
+        near_cache = None
+        if self.near_cache is not None:
+            near_cache = {**self.near_cache.stats(), 'ttl': self.near_cache.ttl,
+                          'subscribed': self._near_cache_ready}
+        return {
+            'backend': 'redis' if self.use_redis else 'memory',
+            'session_ttl': self.session_ttl,
+            'memory': self.memory_store.stats(),
+            'near_cache': near_cache
+        }
@@ -12,4 +12,6 @@ mkdir -p $UPLOAD_FOLDER
 
 # Start Gunicorn
 echo "Starting Gunicorn..."
-gunicorn --bind=0.0.0.0:8000 --workers=4 --timeout=600 --access-logfile '-' --error-logfile '-' app:app
+# Settings live in gunicorn.conf.py; set GUNICORN_PRELOAD=true to load the
+# app once and share it between workers
+gunicorn --config gunicorn.conf.py app:app
@@ -4,8 +4,14 @@ let selectedPolicyIds = new Set();
 let selectedRecommendations = new Set();
 let allPolicies = [];
 let allRecommendations = [];
-let currentSortColumn = null;
-let currentSortDirection = 'asc';
+let policyNames = new Map();
+let policyTotal = 0;
+let policySearchTimer = null;
+
+// Filtering, sorting and paging of the policies table happen on the server;
+// the browser only holds the visible page
+const POLICY_PAGE_SIZE = 50;
+let policyQuery = { search: '', state: '', sort: 'displayName', order: 'asc', offset: 0 };
 
 // Initialize on page load
 document.addEventListener('DOMContentLoaded', function() {
@@ -324,24 +330,53 @@ async function connect() {
     }
 }
 
-// Refresh policies list
-async function refreshPolicies() {
+// Refresh policies list (forceRefresh re-reads the list from Graph instead of the server cache)
+async function refreshPolicies(forceRefresh = false) {
+    const data = await loadPolicyPage(forceRefresh);
+    if (data && data.success) {
+        showToast(`Loaded ${data.total} policies`, 'success');
+    }
+}
+
+// Load the current page of the policies table
+async function loadPolicyPage(forceRefresh = false) {
     const loader = document.getElementById('policiesLoader');
     const tbody = document.getElementById('policiesTableBody');
     
     loader.classList.remove('d-none');
     
     try {
-        const response = await fetch('/api/policies');
+        // Summary view: only the table columns are fetched; viewPolicy() loads
+        // the full policy when a row is opened
+        const params = new URLSearchParams({
+            view: 'summary',
+            sort: policyQuery.sort,
+            order: policyQuery.order,
+            offset: policyQuery.offset,
+            limit: POLICY_PAGE_SIZE
+        });
+        if (policyQuery.search) params.set('search', policyQuery.search);
+        if (policyQuery.state) params.set('state', policyQuery.state);
+        if (forceRefresh) params.set('refresh', 'true');
+        
+        const response = await fetch(`/api/policies?${params}`);
         const data = await response.json();
         
         if (data.success) {
-            allPolicies = data.policies;
-            displayPolicies(data.policies);
-            showToast(`Loaded ${data.count} policies`, 'success');
+            // The page may have emptied (e.g. after deleting its last policies)
+            if (data.count === 0 && data.total > 0 && policyQuery.offset > 0) {
+                policyQuery.offset = Math.floor((data.total - 1) / POLICY_PAGE_SIZE) * POLICY_PAGE_SIZE;
+                return loadPolicyPage();
+            }
+            allPolicies = rowsToPolicies(data.columns, data.rows);
+            allPolicies.forEach(policy => policyNames.set(policy.id, policy.displayName));
+            policyTotal = data.total;
+            displayPolicies(allPolicies);
+            updatePolicyPager();
         } else {
             tbody.innerHTML = '<tr><td colspan="6" class="text-center text-danger">Failed to load policies: ' + data.error + '</td></tr>';
         }
+        return data;
     } catch (error) {
         tbody.innerHTML = '<tr><td colspan="6" class="text-center text-danger">Error loading policies: ' + error.message + '</td></tr>';
     } finally {
@@ -349,48 +384,60 @@ async function refreshPolicies() {
     }
 }
 
+// Turn compact summary rows ({columns, rows}) back into policy objects
+function rowsToPolicies(columns, rows) {
+    return rows.map(row => Object.fromEntries(columns.map((column, i) => [column, row[i]])));
+}
+
 // Sort policies by column
 function sortPolicies(column) {
     // Toggle sort direction if same column, otherwise default to ascending
-    if (currentSortColumn === column) {
-        currentSortDirection = currentSortDirection === 'asc' ? 'desc' : 'asc';
+    if (policyQuery.sort === column) {
+        policyQuery.order = policyQuery.order === 'asc' ? 'desc' : 'asc';
     } else {
-        currentSortColumn = column;
-        currentSortDirection = 'asc';
+        policyQuery.sort = column;
+        policyQuery.order = 'asc';
     }
-    
-    // Sort the policies array
-    const sortedPolicies = [...allPolicies].sort((a, b) => {
-        let aVal = a[column];
-        let bVal = b[column];
-        
-        // Handle null/undefined values
-        if (aVal === null || aVal === undefined) aVal = '';
-        if (bVal === null || bVal === undefined) bVal = '';
-        
-        // For dates, convert to timestamp
-        if (column === 'createdDateTime' || column === 'modifiedDateTime') {
-            aVal = aVal ? new Date(aVal).getTime() : 0;
-            bVal = bVal ? new Date(bVal).getTime() : 0;
-        }
-        
-        // For strings, case-insensitive comparison
-        if (typeof aVal === 'string') {
-            aVal = aVal.toLowerCase();
-            bVal = bVal.toLowerCase();
-        }
-        
-        // Compare values
-        if (aVal < bVal) return currentSortDirection === 'asc' ? -1 : 1;
-        if (aVal > bVal) return currentSortDirection === 'asc' ? 1 : -1;
-        return 0;
-    });
+    policyQuery.offset = 0;
     
     // Update sort icons
-    updateSortIcons(column, currentSortDirection);
+    updateSortIcons(column, policyQuery.order);
     
-    // Display sorted policies
-    displayPolicies(sortedPolicies);
+    loadPolicyPage();
+}
+
+// Search policies by name or ID (debounced while typing)
+function searchPolicies() {
+    clearTimeout(policySearchTimer);
+    policySearchTimer = setTimeout(() => {
+        policyQuery.search = document.getElementById('policySearch').value.trim();
+        policyQuery.offset = 0;
+        loadPolicyPage();
+    }, 300);
+}
+
+// Filter policies by state
+function filterPoliciesByState() {
+    policyQuery.state = document.getElementById('policyStateFilter').value;
+    policyQuery.offset = 0;
+    loadPolicyPage();
+}
+
+// Move to the previous (-1) or next (1) page
+function changePolicyPage(direction) {
+    const offset = policyQuery.offset + direction * POLICY_PAGE_SIZE;
+    if (offset < 0 || offset >= policyTotal) return;
+    policyQuery.offset = offset;
+    loadPolicyPage();
+}
+
+// Update the pager below the policies table
+function updatePolicyPager() {
+    const first = policyTotal ? policyQuery.offset + 1 : 0;
+    const last = Math.min(policyQuery.offset + POLICY_PAGE_SIZE, policyTotal);
+    document.getElementById('policiesPageInfo').textContent = `Showing ${first}-${last} of ${policyTotal}`;
+    document.getElementById('policiesPrevPage').disabled = policyQuery.offset === 0;
+    document.getElementById('policiesNextPage').disabled = last >= policyTotal;
 }
 
 // Update sort direction icons
@@ -668,6 +715,143 @@ async function deletePolicy(policyId, policyName) {
     }
 }
 
+// Event types sent by /api/jobs/<id>/events
+const JOB_EVENT_TYPES = ['started', 'created', 'deleted', 'skipped', 'throttled', 'failed', 'cancelled', 'done'];
+
+// Start a bulk operation as a background job; returns {job_id, job}.
+// Without a job store every server worker can reach, the server runs the
+// operation while streaming its events in the response (NDJSON); job_id is
+// then null and followJob reads the events from that stream.
+async function startJob(url, body = {}) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ ...body, background: true })
+    });
+    if ((response.headers.get('Content-Type') || '').startsWith('application/x-ndjson')) {
+        const lines = readJsonLines(response.body);
+        const first = await lines.next();
+        if (first.done) {
+            throw new Error('The server closed the job stream early');
+        }
+        return { job_id: null, job: first.value.job, lines };
+    }
+    const data = await response.json();
+    if (!data.success) {
+        throw new Error(data.error || `Request failed (${response.status})`);
+    }
+    return data;
+}
+
+// Parse a streamed NDJSON response body, one JSON value per line
+async function* readJsonLines(body) {
+    const reader = body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        for (const line of lines) {
+            if (line.trim()) {
+                yield JSON.parse(line);
+            }
+        }
+        if (done) {
+            if (buffer.trim()) {
+                yield JSON.parse(buffer);
+            }
+            return;
+        }
+    }
+}
+
+// Follow a job started with startJob: its events are passed to onEvent as
+// they happen (Server-Sent Events, or the response stream of a job that
+// runs without a shared job store). Resolves with the finished job. If the
+// SSE stream cannot be opened, the job is polled instead and onEvent only
+// receives {type: 'progress', done, total}.
+function followJob(started, onEvent) {
+    const jobId = started.job_id;
+    if (!jobId) {
+        return followJobStream(started, onEvent);
+    }
+
+    const fetchJob = async () => {
+        const response = await fetch(`/api/jobs/${jobId}`);
+        const data = await response.json();
+        if (!data.success) {
+            throw new Error(data.error);
+        }
+        return data.job;
+    };
+
+    const pollJob = async () => {
+        while (true) {
+            const job = await fetchJob();
+            onEvent({ type: 'progress', done: job.done, total: job.total });
+            if (['succeeded', 'failed', 'cancelled'].includes(job.status)) {
+                return job;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    };
+
+    if (!window.EventSource) {
+        return pollJob();
+    }
+
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`/api/jobs/${jobId}/events`);
+        let received = false;
+
+        const handle = (message) => {
+            received = true;
+            const event = JSON.parse(message.data);
+            if (event.type === 'done') {
+                source.close();
+                fetchJob().then(resolve, reject);
+                return;
+            }
+            onEvent(event);
+        };
+        JOB_EVENT_TYPES.forEach(type => source.addEventListener(type, handle));
+
+        // EventSource reconnects by itself (resuming after the last event);
+        // fall back to polling only if the stream never opened
+        source.onerror = () => {
+            if (!received && source.readyState === EventSource.CLOSED) {
+                pollJob().then(resolve, reject);
+            }
+        };
+    });
+}
+
+// Read a streamed job's events until its 'done' event
+async function followJobStream(started, onEvent) {
+    for await (const event of started.lines) {
+        if (event.type === 'done') {
+            return { ...started.job, status: event.status, result: event.result, error: event.error };
+        }
+        if (event.type !== 'heartbeat') {
+            onEvent(event);
+        }
+    }
+    throw new Error('The server closed the job stream early');
+}
+
+function setProgress(progressBar, done, total) {
+    if (!total) {
+        return;
+    }
+    const percentComplete = Math.round((done / total) * 100);
+    progressBar.style.width = `${percentComplete}%`;
+    progressBar.textContent = `${percentComplete}%`;
+}
+
 // Bulk delete policies
 async function bulkDeletePolicies() {
     if (selectedPolicyIds.size === 0) {
@@ -685,7 +869,6 @@ async function bulkDeletePolicies() {
     
     const policyIds = Array.from(selectedPolicyIds);
     const total = policyIds.length;
-    let completed = 0;
     let succeeded = 0;
     let failed = 0;
     
@@ -711,36 +894,42 @@ async function bulkDeletePolicies() {
     addLog(`Starting bulk delete of ${total} policies...`, 'info');
     
     try {
-        // Process policies one at a time for better progress tracking
-        for (let i = 0; i < policyIds.length; i++) {
-            const policyId = policyIds[i];
-            const policyName = allPolicies.find(p => p.id === policyId)?.displayName || policyId.substring(0, 8);
-            
-            try {
-                addLog(`Deleting: ${policyName}...`, 'info');
-                
-                const response = await fetch(`/api/policies/${policyId}`, {
-                    method: 'DELETE'
-                });
-                
-                const data = await response.json();
-                
-                if (data.success) {
+        // Deletes run on the server in $batch rounds; progress arrives as events
+        const started = await startJob('/api/policies/bulk-delete', { policy_ids: policyIds });
+        
+        const job = await followJob(started, event => {
+            const policyName = policyNames.get(event.id) || (event.id || '').substring(0, 8);
+            switch (event.type) {
+                case 'started':
+                    addLog(`Deleting ${event.ids.length} policies...`, 'info');
+                    break;
+                case 'deleted':
                     succeeded++;
                     addLog(`✓ Successfully deleted: ${policyName}`, 'success');
-                } else {
+                    break;
+                case 'failed':
                     failed++;
-                    addLog(`✗ Failed to delete ${policyName}: ${data.error}`, 'error');
-                }
-            } catch (error) {
-                failed++;
-                addLog(`✗ Error deleting ${policyName}: ${error.message}`, 'error');
+                    addLog(`✗ Failed to delete ${policyName}: ${event.error}`, 'error');
+                    break;
+                case 'throttled':
+                    addLog(`Microsoft Graph is throttling requests, retrying in ${event.retry_after}s...`, 'warning');
+                    break;
             }
-            
-            completed++;
-            const percentComplete = Math.round((completed / total) * 100);
-            progressBar.style.width = `${percentComplete}%`;
-            progressBar.textContent = `${percentComplete}%`;
+            if (event.done !== undefined) {
+                setProgress(progressBar, event.done, event.total);
+            }
+        });
+        
+        // Counts from the final result (events are not seen when polling)
+        const result = job.result || {};
+        succeeded = result.deleted ?? succeeded;
+        failed = (result.results || []).filter(r => !r.success).length || failed;
+        setProgress(progressBar, (result.results || []).length, total);
+        
+        if (job.status === 'failed') {
+            addLog(`Fatal error: ${job.error}`, 'error');
+        } else if (job.status === 'cancelled') {
+            addLog('Bulk delete was cancelled', 'warning');
         }
         
         // Final summary
@@ -891,65 +1080,62 @@ async function deployAllTemplates() {
     };
     
     try {
-        // Get all templates
-        const templatesResponse = await fetch('/api/templates');
-        const templatesData = await templatesResponse.json();
-        
-        if (!templatesData.success) {
-            addLog('Failed to load templates', 'error');
-            closeButton.disabled = false;
-            return;
-        }
-        
-        // templatesData.templates is already an array of template objects
-        const allTemplates = templatesData.templates;
+        // Templates are deployed on the server (several at a time); progress
+        // arrives as events
+        const started = await startJob('/api/templates/deploy-all');
         
-        const total = allTemplates.length;
-        let completed = 0;
+        const total = started.job.total;
         let succeeded = 0;
+        let skipped = 0;
         let failed = 0;
         
         addLog(`Starting deployment of ${total} templates...`, 'info');
         
-        // Deploy templates one at a time
-        for (const item of allTemplates) {
-            try {
-                addLog(`Deploying: ${item.display_name || item.name}...`, 'info');
-                
-                const response = await fetch('/api/templates/deploy', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify({ template: item.template })
-                });
-                
-                const data = await response.json();
-                
-                if (data.success) {
+        const job = await followJob(started, event => {
+            switch (event.type) {
+                case 'started':
+                    addLog(`Deploying: ${event.displayName || event.template}...`, 'info');
+                    break;
+                case 'created':
                     succeeded++;
-                    addLog(`✓ Successfully deployed: ${item.display_name || item.name}`, 'success');
-                } else {
+                    addLog(`✓ Successfully deployed: ${event.displayName || event.template}`, 'success');
+                    break;
+                case 'skipped':
+                    skipped++;
+                    addLog(`- Skipped ${event.displayName || event.template}: ${event.error}`, 'warning');
+                    break;
+                case 'failed':
                     failed++;
-                    addLog(`✗ Failed to deploy ${item.display_name || item.name}: ${data.error}`, 'error');
-                }
-            } catch (error) {
-                failed++;
-                addLog(`✗ Error deploying ${item.display_name || item.name}: ${error.message}`, 'error');
+                    addLog(`✗ Failed to deploy ${event.displayName || event.template}: ${event.error}`, 'error');
+                    break;
+                case 'throttled':
+                    addLog(`Microsoft Graph is throttling requests, retrying in ${event.retry_after}s...`, 'warning');
+                    break;
             }
-            
-            completed++;
-            const percentComplete = Math.round((completed / total) * 100);
-            progressBar.style.width = `${percentComplete}%`;
-            progressBar.textContent = `${percentComplete}%`;
+            if (event.done !== undefined) {
+                setProgress(progressBar, event.done, event.total);
+            }
+        });
+        
+        // Counts from the final result (events are not seen when polling)
+        const result = job.result || {};
+        succeeded = result.deployed ?? succeeded;
+        skipped = result.skipped ?? skipped;
+        failed = (result.results || []).filter(r => r.status === 'failed').length || failed;
+        setProgress(progressBar, (result.results || []).length, total);
+        
+        if (job.status === 'failed') {
+            addLog(`Fatal error: ${job.error}`, 'error');
+        } else if (job.status === 'cancelled') {
+            addLog('Deployment was cancelled', 'warning');
         }
         
         // Final summary
         addLog(`\n=== Deployment Complete ===`, 'info');
-        addLog(`Total: ${total} | Succeeded: ${succeeded} | Failed: ${failed}`, succeeded === total ? 'success' : 'warning');
+        addLog(`Total: ${total} | Succeeded: ${succeeded} | Skipped: ${skipped} | Failed: ${failed}`, succeeded + skipped === total ? 'success' : 'warning');
         
         if (succeeded > 0) {
-            showToast(`Deployed ${succeeded} of ${total} templates`, succeeded === total ? 'success' : 'warning');
+            showToast(`Deployed ${succeeded} of ${total} templates`, succeeded + skipped === total ? 'success' : 'warning');
             refreshPolicies();
         }
         
@@ -993,25 +1179,38 @@ async function createCAGroups() {
     
     try {
         addLog('Starting group creation...', 'info');
-        addLog('This will create approximately 66 security groups', 'info');
-        addLog('', 'info');
         
-        progressBar.style.width = '10%';
-        progressBar.textContent = '10%';
+        // Groups are created on the server; progress arrives as events
+        const started = await startJob('/api/groups/create-ca-groups');
+        addLog(`Checking ${started.job.total} security groups`, 'info');
+        addLog('', 'info');
         
-        const response = await fetch('/api/groups/create-ca-groups', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
+        const job = await followJob(started, event => {
+            switch (event.type) {
+                case 'started':
+                    addLog(`Creating ${event.names.length} missing groups...`, 'info');
+                    break;
+                case 'created':
+                    addLog(`✓ Created: ${event.name}`, 'success');
+                    break;
+                case 'skipped':
+                    addLog(`- Already exists: ${event.name}`, 'warning');
+                    break;
+                case 'failed':
+                    addLog(`✗ Failed to create ${event.name}: ${event.error}`, 'error');
+                    break;
+                case 'throttled':
+                    addLog(`Microsoft Graph is throttling requests, retrying in ${event.retry_after}s...`, 'warning');
+                    break;
+            }
+            if (event.done !== undefined) {
+                setProgress(progressBar, event.done, event.total);
             }
         });
         
-        progressBar.style.width = '90%';
-        progressBar.textContent = '90%';
+        const data = job.result;
         
-        const data = await response.json();
-        
-        if (data.success) {
+        if (job.status !== 'failed' && data) {
             addLog(`\n=== Group Creation Complete ===`, 'success');
             addLog(`Total Groups: ${data.total}`, 'info');
             addLog(`Created: ${data.created}`, 'success');
@@ -1029,10 +1228,10 @@ async function createCAGroups() {
             
             showToast(data.message, 'success');
         } else {
-            addLog(`\nError: ${data.error}`, 'error');
+            addLog(`\nError: ${job.error}`, 'error');
             progressBar.classList.remove('bg-primary');
             progressBar.classList.add('bg-danger');
-            showToast('Failed to create groups: ' + data.error, 'danger');
+            showToast('Failed to create groups: ' + job.error, 'danger');
         }
         
     } catch (error) {
@@ -169,7 +169,7 @@ State: {policy_json.get('state', 'unknown')}
 Configuration:
 {json.dumps(policy_json, indent=2)}
 
-IMPORTANT: When referencing groups, use the displayName from the 'includeGroupsWithNames' or 'excludeGroupsWithNames' arrays if available, NOT the group IDs.
+IMPORTANT: When referencing users, groups, roles, applications or locations, use the displayName from the matching '...WithNames' arrays (e.g. 'includeGroupsWithNames', 'excludeUsersWithNames', 'includeLocationsWithNames') if available, NOT the IDs.
 For example, if you see:
   "includeGroupsWithNames": [{{"id": "abc-123", "displayName": "External Users"}}]
 Then refer to the group as "External Users" (not the ID abc-123).
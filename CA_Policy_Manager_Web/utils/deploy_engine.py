@@ -0,0 +1,161 @@
+"""
+Deploy Engine - Bounded-concurrency deployment of policy templates
+Creates many CA policies in parallel while keeping the duplicate-name guard
+consistent across worker threads
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from utils.policy_cache import name_key
+
+# Conditional Access writes are throttled per tenant; a handful of parallel
+# creates is where throughput stops improving
+DEFAULT_CONCURRENCY = 4
+
+
+class DeployEngine:
+    """
+    Deploys templates on a thread pool with at most max_workers in flight.
+
+    A display name is claimed under a lock before its template is sent, so two
+    templates with the same name in one run (or a name that already exists in
+    the tenant) are never created twice. Names are compared case-insensitively,
+    like Entra ID does. A failed create releases its claim.
+    Throttling (429/503 + Retry-After) is handled by GraphClient per request.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_CONCURRENCY,
+                 existing_names: Optional[Iterable[str]] = None,
+                 claim_name: Optional[Callable[[str], bool]] = None,
+                 release_name: Optional[Callable[[str], None]] = None):
+        """
+        Args:
+            max_workers: Maximum number of concurrent create calls
+            existing_names: Display names of policies already in the tenant
+            claim_name: Optional shared reservation (e.g. the policy cache's
+                name index) so other requests deploying the same name are seen;
+                returns False if the name is taken
+            release_name: Releases a name reserved by claim_name
+        """
+        self.max_workers = max(1, int(max_workers or 1))
+        self.existing_names: Set[str] = {name_key(name) for name in existing_names or []}
+        self.claim_name = claim_name
+        self.release_name = release_name
+        self._lock = threading.Lock()
+
+    def _claim(self, policy_name: str) -> bool:
+        """Reserve a display name; False if it already exists or is in flight."""
+        key = name_key(policy_name)
+        with self._lock:
+            if key in self.existing_names:
+                return False
+            self.existing_names.add(key)
+        if self.claim_name is not None and not self.claim_name(policy_name):
+            return False
+        return True
+
+    def _release(self, policy_name: str, created: bool = False):
+        if self.release_name is not None:
+            self.release_name(policy_name)
+        if not created:
+            with self._lock:
+                self.existing_names.discard(name_key(policy_name))
+
+    def _deploy_one(self, template_name: str, template: Dict,
+                    deploy: Callable[[str, Dict], Optional[Dict]],
+                    should_stop: Optional[Callable[[], bool]] = None,
+                    on_start: Optional[Callable[[str, str], None]] = None) -> Dict[str, Any]:
+        policy_name = template.get('displayName', '')
+        result: Dict[str, Any] = {'template': template_name, 'displayName': policy_name}
+
+        if should_stop is not None and should_stop():
+            result.update(status='cancelled', error='Cancelled')
+            return result
+
+        if not self._claim(policy_name):
+            result.update(status='skipped', error='Already exists')
+            return result
+
+        if on_start is not None:
+            on_start(template_name, policy_name)
+        try:
+            created = deploy(template_name, template)
+        except Exception as e:
+            self._release(policy_name)
+            result.update(status='failed', error=str(e))
+            return result
+
+        if created is None:
+            self._release(policy_name)
+            result.update(status='failed', error='Policy was not created')
+            return result
+
+        self._release(policy_name, created=True)
+        result.update(status='deployed', policy_id=created.get('id'))
+        return result
+
+    def run(self, templates: Dict[str, Dict],
+            deploy: Callable[[str, Dict], Optional[Dict]],
+            on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+            should_stop: Optional[Callable[[], bool]] = None,
+            on_start: Optional[Callable[[str, str], None]] = None) -> List[Dict[str, Any]]:
+        """
+        Deploy templates concurrently.
+
+        Args:
+            templates: Template name -> policy definition, in deployment order
+            deploy: Called as deploy(template_name, template) from a worker
+                    thread; returns the created policy, or None / raises on
+                    failure. It must not touch Flask's request or session.
+            on_result: Called with each result as it finishes (completion order)
+            should_stop: Checked before each template is started; once it
+                         returns True the remaining templates are cancelled
+            on_start: Called as on_start(template_name, display_name) from the
+                      worker thread just before a create is sent
+
+        Returns:
+            One result dict per template, in the same order as templates, with
+            'template', 'displayName', 'status' ('deployed', 'skipped',
+            'failed' or 'cancelled') and 'policy_id' or 'error'
+        """
+        items = list(templates.items())
+        if not items:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items)),
+                                thread_name_prefix='deploy') as executor:
+            futures = [executor.submit(self._deploy_one, name, template, deploy, should_stop, on_start)
+                       for name, template in items]
+            if on_result is not None:
+                for future in as_completed(futures):
+                    on_result(future.result())
+            return [future.result() for future in futures]
+
+
+def summarize_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Build the deploy-all response fields from DeployEngine results.
+
+    Returns:
+        Dictionary with 'deployed', 'skipped', 'cancelled', 'total', 'errors'
+        and 'results'
+    """
+    deployed = sum(1 for r in results if r['status'] == 'deployed')
+    skipped = sum(1 for r in results if r['status'] == 'skipped')
+    cancelled = sum(1 for r in results if r['status'] == 'cancelled')
+    errors = []
+    for r in results:
+        if r['status'] == 'skipped':
+            errors.append(f"Skipped {r['displayName']}: {r['error']}")
+        elif r['status'] == 'failed':
+            errors.append(f"Failed to deploy {r['template']}: {r['error']}")
+    return {
+        'deployed': deployed,
+        'skipped': skipped,
+        'cancelled': cancelled,
+        'total': len(results),
+        'errors': errors,
+        'results': results
+    }
@@ -0,0 +1,281 @@
+"""
+Directory Cache - Shared, TTL-bounded cache for directory lookups
+Holds name -> ID and ID -> name mappings per tenant and object type, with a
+bounded in-process LRU in front of an optional Redis tier shared by all
+gunicorn workers
+"""
+
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+# Returned by lookups when a key is not cached at all. A cached None means
+# "looked up and not found" (negative entry).
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-entry time to live.
+
+    Expired entries are dropped lazily when read (or by purge_expired); the
+    least recently used entry is evicted once maxsize is reached.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300):
+        """
+        Args:
+            maxsize: Maximum number of entries kept
+            ttl: Default time to live in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """Return the cached value, or default if absent or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value, evicting the least recently used entry if full."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store(key, value, expires_at)
+
+    def update(self, key: Hashable, func: Callable[[Any], Any], ttl: Optional[float] = None) -> Any:
+        """
+        Replace a value atomically with func(current value), resetting its TTL.
+
+        func receives None when the key is absent or expired and must not
+        mutate its argument. Returns the stored result.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            current = entry[1] if entry is not None and entry[0] > now else None
+            value = func(current)
+            self._store(key, value, now + (self.ttl if ttl is None else ttl))
+            return value
+
+    def _store(self, key: Hashable, value: Any, expires_at: float):
+        """Insert under the lock and evict the least recently used entries."""
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def purge_expired(self) -> int:
+        """Drop every expired entry; returns how many were removed."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._data.items() if expires_at <= now]
+            for key in expired:
+                del self._data[key]
+            self.expirations += len(expired)
+        return len(expired)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+
+class DirectoryCache:
+    """
+    Tenant-scoped cache for directory object lookups.
+
+    Entries are keyed by (tenant, object type, direction, key) where direction
+    is 'id' (name -> ID) or 'name' (ID -> display name). Names are matched
+    case-insensitively, like Graph's displayName filter. "Not found" results
+    are cached for a shorter negative TTL.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: int = 900, negative_ttl: int = 120,
+                 redis_client=None, key_prefix: str = 'dircache'):
+        """
+        Args:
+            maxsize: Entries kept in the per-worker LRU
+            ttl: Seconds a positive entry stays valid
+            negative_ttl: Seconds a "not found" entry stays valid
+            redis_client: Optional Redis client for the shared tier
+            key_prefix: Redis key prefix
+        """
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.redis_hits = 0
+        self.redis_errors = 0
+
+    @staticmethod
+    def _normalize(direction: str, key: str) -> str:
+        return key.casefold() if direction == 'id' else key
+
+    def _redis_key(self, cache_key: Tuple[str, str, str, str]) -> str:
+        return f"{self.key_prefix}:" + ':'.join(cache_key)
+
+    def _get_many(self, tenant_id: str, object_type: str, direction: str,
+                  keys: Iterable[str]) -> Tuple[Dict[str, Any], List[str]]:
+        found: Dict[str, Any] = {}
+        remote: List[Tuple[str, Tuple[str, str, str, str]]] = []
+
+        for key in dict.fromkeys(keys):
+            cache_key = (tenant_id, object_type, direction, self._normalize(direction, key))
+            value = self.local.get(cache_key)
+            if value is MISSING:
+                remote.append((key, cache_key))
+            else:
+                found[key] = value
+
+        if remote and self.redis_client is not None:
+            try:
+                raw_values = self.redis_client.mget([self._redis_key(ck) for _, ck in remote])
+                still_missing = []
+                for (key, cache_key), raw in zip(remote, raw_values):
+                    if raw is None:
+                        still_missing.append((key, cache_key))
+                        continue
+                    value = json.loads(raw)
+                    self.redis_hits += 1
+                    self.local.set(cache_key, value, ttl=self.ttl if value is not None else self.negative_ttl)
+                    found[key] = value
+                remote = still_missing
+            except Exception as e:
+                self.redis_errors += 1
+                print(f"⚠️  Directory cache Redis read failed: {e}")
+
+        return found, [key for key, _ in remote]
+
+    def _set_many(self, tenant_id: str, object_type: str, direction: str, values: Dict[str, Any]):
+        if not values:
+            return
+        entries = []
+        for key, value in values.items():
+            cache_key = (tenant_id, object_type, direction, self._normalize(direction, key))
+            ttl = self.ttl if value is not None else self.negative_ttl
+            self.local.set(cache_key, value, ttl=ttl)
+            entries.append((cache_key, value, ttl))
+
+        if self.redis_client is not None:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for cache_key, value, ttl in entries:
+                    pipe.setex(self._redis_key(cache_key), int(ttl), json.dumps(value))
+                pipe.execute()
+            except Exception as e:
+                self.redis_errors += 1
+                print(f"⚠️  Directory cache Redis write failed: {e}")
+
+    def get_ids(self, tenant_id: str, object_type: str, names: Iterable[str]) -> Tuple[Dict[str, Optional[str]], List[str]]:
+        """
+        Look up cached name -> ID mappings.
+
+        Returns:
+            (found, missing) where found maps name to ID (None = known not found)
+            and missing lists the names that must be fetched from Graph
+        """
+        return self._get_many(tenant_id, object_type, 'id', names)
+
+    def set_ids(self, tenant_id: str, object_type: str, mapping: Dict[str, Optional[str]]):
+        """Cache name -> ID mappings (None caches "not found")."""
+        self._set_many(tenant_id, object_type, 'id', mapping)
+
+    def get_names(self, tenant_id: str, object_type: str, object_ids: Iterable[str]) -> Tuple[Dict[str, Optional[str]], List[str]]:
+        """
+        Look up cached ID -> display name mappings.
+
+        Returns:
+            (found, missing) as for get_ids
+        """
+        return self._get_many(tenant_id, object_type, 'name', object_ids)
+
+    def set_names(self, tenant_id: str, object_type: str, mapping: Dict[str, Optional[str]]):
+        """Cache ID -> display name mappings (None caches "not found")."""
+        self._set_many(tenant_id, object_type, 'name', mapping)
+
+    def remember(self, tenant_id: str, object_type: str, object_id: str, display_name: str):
+        """
+        Cache both directions for an object that was just fetched or created.
+
+        The name -> ID entry is stored under object_type; the ID -> name entry
+        under 'directoryObject', since object IDs are unique across types and
+        that is how DirectoryResolver looks them up.
+        """
+        self.set_ids(tenant_id, object_type, {display_name: object_id})
+        self.set_names(tenant_id, 'directoryObject', {object_id: display_name})
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring."""
+        local = self.local.stats()
+        return {
+            **local,
+            'redis_enabled': self.redis_client is not None,
+            'redis_hits': self.redis_hits,
+            'redis_errors': self.redis_errors,
+            'misses': local['misses'] - self.redis_hits
+        }
+
+
+_cache: Optional[DirectoryCache] = None
+_cache_lock = threading.Lock()
+
+
+def configure_directory_cache(**settings: Any) -> DirectoryCache:
+    """
+    Replace the shared DirectoryCache.
+
+    Args:
+        **settings: Keyword arguments for DirectoryCache (maxsize, ttl, redis_client...)
+    """
+    global _cache
+    with _cache_lock:
+        _cache = DirectoryCache(**{k: v for k, v in settings.items() if v is not None})
+    return _cache
+
+
+def get_directory_cache() -> DirectoryCache:
+    """Return the shared DirectoryCache (in-process only until configured)."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DirectoryCache()
+    return _cache
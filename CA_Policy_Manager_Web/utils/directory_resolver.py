@@ -0,0 +1,537 @@
+"""
+Directory Resolver - Bulk ID -> display name resolution for CA policies
+Collects every GUID referenced in policy conditions and resolves them in a
+handful of Graph calls instead of one call per ID
+"""
+
+import re
+import copy
+from urllib.parse import quote, urlencode
+from typing import Callable, Dict, List, Iterable, Set, Optional, Any
+
+from graph_client import GraphClient, get_graph_client, odata_params, tenant_id_from_token
+from utils.directory_cache import DirectoryCache, get_directory_cache
+
+GUID_PATTERN = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+
+# directoryObjects/getByIds accepts at most 1000 IDs per call
+GET_BY_IDS_LIMIT = 1000
+
+# Directory queries accept at most 15 values in an 'in (...)' filter
+FILTER_IN_LIMIT = 15
+
+# Well-known Microsoft apps that always exist
+WELL_KNOWN_APPS = {
+    "00000003-0000-0000-c000-000000000000": "Microsoft Graph",
+    "0000000a-0000-0000-c000-000000000000": "Microsoft Intune (MAM/MDM)"
+}
+
+# Where each kind of ID lives inside a policy: (conditions section, field names)
+DIRECTORY_OBJECT_FIELDS = [
+    ('users', ['includeUsers', 'excludeUsers', 'includeGroups', 'excludeGroups']),
+    ('clientApplications', ['includeServicePrincipals', 'excludeServicePrincipals'])
+]
+ROLE_FIELDS = [('users', ['includeRoles', 'excludeRoles'])]
+LOCATION_FIELDS = [('locations', ['includeLocations', 'excludeLocations'])]
+APPLICATION_FIELDS = [('applications', ['includeApplications', 'excludeApplications'])]
+
+
+def is_guid(value: Any) -> bool:
+    """True for object IDs; False for keywords such as 'All' or 'GuestsOrExternalUsers'."""
+    return isinstance(value, str) and bool(GUID_PATTERN.match(value))
+
+
+def _collect(policies: Iterable[Dict], field_map: List) -> Set[str]:
+    """Gather the distinct GUIDs found in the given condition fields."""
+    ids: Set[str] = set()
+    for policy in policies:
+        conditions = (policy or {}).get('conditions') or {}
+        for section, fields in field_map:
+            values = conditions.get(section) or {}
+            for field in fields:
+                ids.update(v for v in (values.get(field) or []) if is_guid(v))
+    return ids
+
+
+def collect_policy_ids(policies: Iterable[Dict]) -> Dict[str, Set[str]]:
+    """
+    Collect every GUID referenced by one or more policies, grouped by kind.
+
+    Args:
+        policies: Policy objects
+
+    Returns:
+        {'directory_objects': {...}, 'roles': {...}, 'locations': {...}, 'applications': {...}}
+    """
+    policies = list(policies)
+    return {
+        'directory_objects': _collect(policies, DIRECTORY_OBJECT_FIELDS),
+        'roles': _collect(policies, ROLE_FIELDS),
+        'locations': _collect(policies, LOCATION_FIELDS),
+        'applications': _collect(policies, APPLICATION_FIELDS)
+    }
+
+
+def odata_quote(value: str) -> str:
+    """Quote a string literal for an OData filter (single quotes are doubled)."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def fetch_service_principal_names(graph: GraphClient, headers: Dict[str, str], verify_ssl: bool,
+                                  app_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+    """
+    Look up service principals for many application IDs with chunked
+    'appId in (...)' filters.
+
+    Args:
+        graph: Graph transport
+        headers: Request headers including Authorization
+        verify_ssl: Enable SSL certificate verification
+        app_ids: Application (client) IDs
+
+    Returns:
+        Definitive answers only: appId -> display name, or None if the tenant
+        has no such service principal. IDs in a chunk whose query failed are
+        omitted.
+    """
+    app_ids = sorted(set(app_ids))
+    names: Dict[str, Optional[str]] = {}
+    for start in range(0, len(app_ids), FILTER_IN_LIMIT):
+        chunk = app_ids[start:start + FILTER_IN_LIMIT]
+        quoted = ','.join(odata_quote(app_id) for app_id in chunk)
+        try:
+            found = {
+                sp['appId']: sp.get('displayName') or sp['appId']
+                for sp in graph.iter_values(
+                    '/servicePrincipals',
+                    params=odata_params(filter=f"appId in ({quoted})", select='appId,displayName'),
+                    headers=headers,
+                    verify=verify_ssl
+                )
+                if sp.get('appId')
+            }
+        except Exception as e:
+            print(f"⚠️  Service principal lookup failed for {len(chunk)} apps: {e}")
+            continue
+        names.update({app_id: found.get(app_id) for app_id in chunk})
+    return names
+
+
+class DirectoryResolver:
+    """
+    Resolves users, groups, service principals, roles, named locations and
+    applications referenced in CA policies to display names.
+
+    Directory objects go through directoryObjects/getByIds in chunks of 1000,
+    role templates and named locations are each one (paged) list call, and
+    application IDs are resolved through chunked appId in (...) filter
+    queries on servicePrincipals. Answers (including "not found") are kept in the shared
+    DirectoryCache, so only IDs not seen recently reach Graph.
+    """
+
+    def __init__(self, access_token: str, verify_ssl: bool = True,
+                 graph_client: Optional[GraphClient] = None,
+                 tenant_id: Optional[str] = None,
+                 cache: Optional[DirectoryCache] = None):
+        """
+        Args:
+            access_token: Bearer token (delegated or app-only)
+            verify_ssl: Enable SSL certificate verification
+            graph_client: Optional transport (defaults to the shared per-worker client)
+            tenant_id: Tenant used to partition the cache (read from the token if omitted)
+            cache: Optional cache (defaults to the shared DirectoryCache)
+        """
+        self.headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+        self.verify_ssl = verify_ssl
+        self.graph = graph_client or get_graph_client()
+        self.tenant_id = tenant_id or tenant_id_from_token(access_token)
+        self.cache = cache or get_directory_cache()
+
+    def _lookup_cached(self, object_type: str, ids: Iterable[str],
+                       fetch: Callable[[List[str]], Dict[str, Optional[str]]]) -> Dict[str, Optional[str]]:
+        """
+        Serve IDs from the cache and fetch the rest.
+
+        fetch() returns only definitive answers (name, or None for "not
+        found"); IDs it could not look up are omitted and left uncached.
+        """
+        ids = sorted(set(ids))
+        if not ids:
+            return {}
+        if not self.tenant_id:
+            return fetch(ids)
+        found, missing = self.cache.get_names(self.tenant_id, object_type, ids)
+        if missing:
+            fetched = fetch(missing)
+            self.cache.set_names(self.tenant_id, object_type, fetched)
+            found.update(fetched)
+        return found
+
+    def _resolve_cached(self, object_type: str, ids: Iterable[str],
+                        fetch: Callable[[List[str]], Dict[str, Optional[str]]]) -> Dict[str, str]:
+        """Like _lookup_cached, but only the IDs that were found."""
+        return {k: v for k, v in self._lookup_cached(object_type, ids, fetch).items() if v is not None}
+
+    def resolve_policies(self, policies: Iterable[Dict]) -> Dict[str, str]:
+        """
+        Build an ID -> display name map for everything a set of policies references.
+
+        Lookups that fail are left out of the map, so callers should fall
+        back to the raw ID.
+
+        Args:
+            policies: Policy objects (a single policy or a whole tenant)
+
+        Returns:
+            Dictionary mapping object ID to display name
+        """
+        ids = collect_policy_ids(policies)
+        names: Dict[str, str] = {}
+        names.update(self.resolve_directory_objects(ids['directory_objects']))
+        names.update(self.resolve_roles(ids['roles']))
+        names.update(self.resolve_named_locations(ids['locations']))
+        names.update(self.resolve_applications(ids['applications']))
+        return names
+
+    def resolve_directory_objects(self, object_ids: Iterable[str]) -> Dict[str, str]:
+        """Resolve users, groups, service principals etc. with directoryObjects/getByIds."""
+        return self._resolve_cached('directoryObject', object_ids, self._fetch_directory_objects)
+
+    def resolve_roles(self, role_ids: Iterable[str]) -> Dict[str, str]:
+        """Resolve directory role template IDs (as used by include/excludeRoles)."""
+        return self._resolve_cached('role', role_ids, self._fetch_roles)
+
+    def resolve_named_locations(self, location_ids: Iterable[str]) -> Dict[str, str]:
+        """Resolve named location IDs (not directory objects, so listed directly)."""
+        return self._resolve_cached('namedLocation', location_ids, self._fetch_named_locations)
+
+    def resolve_applications(self, app_ids: Iterable[str]) -> Dict[str, str]:
+        """Resolve application (client) IDs via their service principals."""
+        return self._resolve_cached('application', app_ids, self._fetch_applications)
+
+    def lookup_applications(self, app_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Like resolve_applications, but also returns None for apps known not to exist."""
+        return self._lookup_cached('application', app_ids, self._fetch_applications)
+
+    def _fetch_directory_objects(self, object_ids: List[str]) -> Dict[str, Optional[str]]:
+        names: Dict[str, Optional[str]] = {}
+        for start in range(0, len(object_ids), GET_BY_IDS_LIMIT):
+            chunk = object_ids[start:start + GET_BY_IDS_LIMIT]
+            try:
+                response = self.graph.post(
+                    '/directoryObjects/getByIds',
+                    json={'ids': chunk},
+                    headers=self.headers,
+                    verify=self.verify_ssl
+                )
+                response.raise_for_status()
+            except Exception as e:
+                print(f"⚠️  getByIds lookup failed for {len(chunk)} IDs: {e}")
+                continue
+            names.update(dict.fromkeys(chunk))
+            for obj in response.json().get('value', []):
+                if obj.get('id'):
+                    names[obj['id']] = obj.get('displayName') or obj.get('userPrincipalName') or obj['id']
+        return names
+
+    def _fetch_listed(self, path: str, ids: List[str]) -> Dict[str, Optional[str]]:
+        """Resolve IDs by listing a (small) collection once."""
+        try:
+            listed = {
+                item['id']: item.get('displayName', item['id'])
+                for item in self.graph.iter_values(
+                    path,
+                    params=odata_params(select='id,displayName'),
+                    headers=self.headers,
+                    verify=self.verify_ssl
+                )
+                if item.get('id')
+            }
+        except Exception as e:
+            print(f"⚠️  Lookup of {path} failed: {e}")
+            return {}
+        return {i: listed.get(i) for i in ids}
+
+    def _fetch_roles(self, role_ids: List[str]) -> Dict[str, Optional[str]]:
+        return self._fetch_listed('/directoryRoleTemplates', role_ids)
+
+    def _fetch_named_locations(self, location_ids: List[str]) -> Dict[str, Optional[str]]:
+        return self._fetch_listed('/identity/conditionalAccess/namedLocations', location_ids)
+
+    def _fetch_applications(self, app_ids: List[str]) -> Dict[str, Optional[str]]:
+        return fetch_service_principal_names(self.graph, self.headers, self.verify_ssl, app_ids)
+
+
+class ApplicationValidator:
+    """
+    Set-based validation of excludeApplications for a whole deployment.
+
+    prefetch() takes the union of app IDs across every policy being deployed
+    and resolves the unknown ones in chunked 'appId in (...)' queries. Answers
+    are memoized on the instance and in the shared DirectoryCache, so
+    validating each individual template afterwards costs no Graph calls.
+    """
+
+    def __init__(self, access_token: str, verify_ssl: bool = True,
+                 graph_client: Optional[GraphClient] = None,
+                 tenant_id: Optional[str] = None,
+                 cache: Optional[DirectoryCache] = None):
+        """
+        Args:
+            access_token: Bearer token (delegated or app-only)
+            verify_ssl: Enable SSL certificate verification
+            graph_client: Optional transport (defaults to the shared per-worker client)
+            tenant_id: Tenant used to partition the cache (read from the token if omitted)
+            cache: Optional cache (defaults to the shared DirectoryCache)
+        """
+        self.resolver = DirectoryResolver(access_token, verify_ssl=verify_ssl, graph_client=graph_client,
+                                          tenant_id=tenant_id, cache=cache)
+        self.known: Dict[str, bool] = {app_id: True for app_id in WELL_KNOWN_APPS}
+
+    def prefetch(self, policies: Iterable[Dict]):
+        """Validate every excluded application referenced by the given policies at once."""
+        app_ids = set()
+        for policy in policies:
+            applications = ((policy or {}).get('conditions') or {}).get('applications') or {}
+            app_ids.update(applications.get('excludeApplications') or [])
+        self.validate(app_ids)
+
+    def validate(self, app_ids: Iterable[str]) -> Dict[str, bool]:
+        """
+        Check which application IDs have a service principal in the tenant.
+
+        IDs that could not be checked (Graph error) are reported as invalid
+        but not memoized, so a later call retries them.
+
+        Returns:
+            appId -> True if it exists
+        """
+        app_ids = set(app_ids)
+        unknown = app_ids - self.known.keys()
+        if unknown:
+            for app_id, name in self.resolver.lookup_applications(unknown).items():
+                self.known[app_id] = name is not None
+        return {app_id: self.known.get(app_id, False) for app_id in app_ids}
+
+    def clean_policy(self, policy_definition: Dict) -> Dict:
+        """
+        Return a copy of a policy with invalid excludeApplications removed.
+
+        Args:
+            policy_definition: Policy configuration dictionary
+
+        Returns:
+            Cleaned policy definition
+        """
+        policy = copy.deepcopy(policy_definition)
+        try:
+            exclude_apps = policy.get("conditions", {}).get("applications", {}).get("excludeApplications", [])
+
+            if exclude_apps:
+                print(f"🔍 Validating {len(exclude_apps)} excluded applications...")
+                validity = self.validate(exclude_apps)
+                valid_apps = []
+
+                for app_id in exclude_apps:
+                    if validity.get(app_id):
+                        valid_apps.append(app_id)
+                    else:
+                        print(f"   ⚠️  Removing invalid app: {app_id}")
+
+                if valid_apps:
+                    policy["conditions"]["applications"]["excludeApplications"] = valid_apps
+                    print(f"   ✅ Kept {len(valid_apps)} valid excluded applications")
+                else:
+                    # Remove excludeApplications key if no valid apps remain
+                    del policy["conditions"]["applications"]["excludeApplications"]
+                    print("   ℹ️  Removed excludeApplications (no valid apps)")
+
+        except Exception as e:
+            print(f"⚠️  Error cleaning policy applications: {e}")
+
+        return policy
+
+
+class GroupNameResolver:
+    """
+    Resolves group display names used in templates to object IDs for a whole
+    deployment at once.
+
+    prefetch() gathers the distinct group names across all policies, serves
+    what it can from the shared DirectoryCache, and fetches the rest with one
+    paged startswith(displayName, '<prefix>') query per shared prefix (e.g.
+    'CA-'), falling back to a $batch of exact-match lookups for the odd names
+    out. Every policy is then rewritten from the same name -> ID map.
+    """
+
+    # Group fields that may hold display names instead of IDs
+    GROUP_FIELDS = ('includeGroups', 'excludeGroups')
+
+    def __init__(self, access_token: str, verify_ssl: bool = True,
+                 graph_client: Optional[GraphClient] = None,
+                 tenant_id: Optional[str] = None,
+                 cache: Optional[DirectoryCache] = None):
+        """
+        Args:
+            access_token: Bearer token (delegated or app-only)
+            verify_ssl: Enable SSL certificate verification
+            graph_client: Optional transport (defaults to the shared per-worker client)
+            tenant_id: Tenant used to partition the cache (read from the token if omitted)
+            cache: Optional cache (defaults to the shared DirectoryCache)
+        """
+        self.headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+        self.verify_ssl = verify_ssl
+        self.graph = graph_client or get_graph_client()
+        self.tenant_id = tenant_id or tenant_id_from_token(access_token)
+        self.cache = cache or get_directory_cache()
+        # casefolded name -> ID (None = known not to exist)
+        self.ids: Dict[str, Optional[str]] = {}
+
+    @classmethod
+    def collect_group_names(cls, policies: Iterable[Dict]) -> Set[str]:
+        """Distinct non-GUID group references across policies."""
+        names: Set[str] = set()
+        for policy in policies:
+            users = ((policy or {}).get('conditions') or {}).get('users') or {}
+            for field in cls.GROUP_FIELDS:
+                names.update(g for g in (users.get(field) or []) if isinstance(g, str) and not is_guid(g))
+        return names
+
+    @staticmethod
+    def _prefix(name: str) -> Optional[str]:
+        """Naming-convention prefix of a group name, e.g. 'CA-' for 'CA-Persona-Admins'."""
+        head, sep, _ = name.partition('-')
+        return f"{head}{sep}" if sep and head else None
+
+    def prefetch(self, policies: Iterable[Dict]):
+        """Resolve every group name referenced by the given policies."""
+        names = [n for n in self.collect_group_names(policies) if n.casefold() not in self.ids]
+        if not names:
+            return
+
+        missing = names
+        if self.tenant_id:
+            cached, missing = self.cache.get_ids(self.tenant_id, 'group', names)
+            self.ids.update({name.casefold(): group_id for name, group_id in cached.items()})
+        if not missing:
+            return
+
+        fetched: Dict[str, Optional[str]] = {}
+        by_prefix: Dict[Optional[str], List[str]] = {}
+        for name in missing:
+            by_prefix.setdefault(self._prefix(name), []).append(name)
+
+        for prefix, prefix_names in by_prefix.items():
+            if prefix and len(prefix_names) > 1:
+                fetched.update(self._fetch_by_prefix(prefix, prefix_names))
+            else:
+                fetched.update(self._fetch_exact(prefix_names))
+
+        for name, group_id in fetched.items():
+            self.ids[name.casefold()] = group_id
+            if not self.tenant_id:
+                continue
+            if group_id:
+                self.cache.remember(self.tenant_id, 'group', group_id, name)
+            else:
+                self.cache.set_ids(self.tenant_id, 'group', {name: None})
+
+    def _fetch_by_prefix(self, prefix: str, names: List[str]) -> Dict[str, Optional[str]]:
+        """One paged startswith() query covering every name with the prefix."""
+        try:
+            listed = {
+                group['displayName'].casefold(): group['id']
+                for group in self.graph.iter_values(
+                    '/groups',
+                    params=odata_params(filter=f"startswith(displayName,{odata_quote(prefix)})",
+                                        select='id,displayName', top=999),
+                    headers=self.headers,
+                    verify=self.verify_ssl
+                )
+                if group.get('displayName') and group.get('id')
+            }
+        except Exception as e:
+            print(f"⚠️  Prefix lookup for '{prefix}' groups failed: {e}")
+            return self._fetch_exact(names)
+        return {name: listed.get(name.casefold()) for name in names}
+
+    def _fetch_exact(self, names: List[str]) -> Dict[str, Optional[str]]:
+        """$batch of displayName eq lookups for names without a shared prefix."""
+        try:
+            responses = self.graph.batch(
+                [{'method': 'GET',
+                  'url': '/groups?' + urlencode(odata_params(filter=f"displayName eq {odata_quote(name)}",
+                                                             select='id,displayName'),
+                                                quote_via=quote, safe='$,')}
+                 for name in names],
+                headers=self.headers,
+                verify=self.verify_ssl
+            )
+        except Exception as e:
+            print(f"⚠️  Group lookup failed for {len(names)} names: {e}")
+            return {}
+        results: Dict[str, Optional[str]] = {}
+        for name, result in zip(names, responses):
+            if result['status'] == 200 and result.get('body') is not None:
+                groups = result['body'].get('value', [])
+                results[name] = groups[0]['id'] if groups else None
+        return results
+
+    def resolve_policy(self, policy_data: Dict) -> Dict:
+        """
+        Return a copy of a policy with group names replaced by object IDs.
+
+        Names that could not be resolved are kept as-is (Graph will reject
+        them, which surfaces the missing group to the user).
+        """
+        policy = copy.deepcopy(policy_data)
+        self.prefetch([policy])
+        users = (policy.get('conditions') or {}).get('users')
+        if not users:
+            return policy
+        for field in self.GROUP_FIELDS:
+            if field not in users:
+                continue
+            resolved = []
+            for group in users[field] or []:
+                if isinstance(group, str) and not is_guid(group):
+                    group_id = self.ids.get(group.casefold())
+                    if not group_id:
+                        print(f"⚠️  Group not found: {group}")
+                    resolved.append(group_id or group)
+                else:
+                    resolved.append(group)
+            users[field] = resolved
+        return policy
+
+
+def annotate_policy_names(policy: Dict, names: Dict[str, str]) -> Dict:
+    """
+    Add '<field>WithNames' lists next to every ID field of a policy.
+
+    For example conditions.users.includeGroups gets a sibling
+    includeGroupsWithNames = [{'id': ..., 'displayName': ...}].
+
+    Args:
+        policy: Policy object (modified in place)
+        names: ID -> display name map from DirectoryResolver
+
+    Returns:
+        The same policy object
+    """
+    conditions = policy.get('conditions') or {}
+    for section, fields in DIRECTORY_OBJECT_FIELDS + ROLE_FIELDS + LOCATION_FIELDS + APPLICATION_FIELDS:
+        values = conditions.get(section)
+        if not values:
+            continue
+        for field in fields:
+            ids = [v for v in (values.get(field) or []) if is_guid(v)]
+            if ids:
+                values[f'{field}WithNames'] = [{'id': i, 'displayName': names.get(i, i)} for i in ids]
+    return policy
@@ -0,0 +1,242 @@
+"""
+Group Provisioning - Bulk creation of the CA framework groups
+Lists every existing group with the framework prefix in one paged query, works
+out the missing groups locally and creates them through $batch with several
+calls in flight, instead of one lookup and one create per group
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from graph_client import BATCH_LIMIT, GraphClient, get_graph_client, odata_params, tenant_id_from_token
+from utils.directory_cache import DirectoryCache, get_directory_cache
+from utils.directory_resolver import odata_quote
+
+# Every framework group name starts with this
+CA_GROUP_PREFIX = 'CA-'
+
+# Create outcomes that need a fresh listing to settle: 0 = the $batch call
+# raised, 504 = Graph timed out, possibly after creating the group
+UNCONFIRMED_STATUSES = {0, 504}
+
+PERSONA_GROUPS = [
+    {'name': 'CA-BreakGlassAccounts', 'description': 'Emergency break-glass admin accounts excluded from all CA policies'},
+    {'name': 'CA-Persona-Admins', 'description': 'Administrative users persona group for CA policies'},
+    {'name': 'CA-Persona-Internals', 'description': 'Internal employees persona group for CA policies'},
+    {'name': 'CA-Persona-Externals', 'description': 'External contractors/consultants persona group for CA policies'},
+    {'name': 'CA-Persona-Guests', 'description': 'Guest users (B2B) persona group for CA policies'},
+    {'name': 'CA-Persona-GuestAdmins', 'description': 'Guest administrators persona group for CA policies'},
+    {'name': 'CA-Persona-Microsoft365ServiceAccounts', 'description': 'Microsoft 365 service accounts persona group for CA policies'},
+    {'name': 'CA-Persona-AzureServiceAccounts', 'description': 'Azure service accounts persona group for CA policies'},
+    {'name': 'CA-Persona-CorpServiceAccounts', 'description': 'Corporate service accounts persona group for CA policies'},
+    {'name': 'CA-Persona-WorkloadIdentities', 'description': 'Workload identities persona group for CA policies'},
+    {'name': 'CA-Persona-Developers', 'description': 'Developer users persona group for CA policies'}
+]
+
+# Each persona gets one exclusion group per policy type
+EXCLUSION_PERSONAS = ['Admins', 'Internals', 'Externals', 'Guests', 'GuestAdmins',
+                      'Microsoft365ServiceAccounts', 'AzureServiceAccounts', 'CorpServiceAccounts',
+                      'WorkloadIdentities', 'Developers']
+POLICY_TYPES = ['BaseProtection', 'IdentityProtection', 'DataandAppProtection',
+                'AttackSurfaceReduction', 'Compliance']
+
+
+def ca_group_definitions() -> List[Dict[str, str]]:
+    """Persona groups plus one exclusion group per persona and policy type."""
+    exclusion_groups = [
+        {
+            'name': f'CA-Persona-{persona}-{policy_type}-Exclusions',
+            'description': f'Exclusions for {persona} {policy_type} CA policies'
+        }
+        for persona in EXCLUSION_PERSONAS
+        for policy_type in POLICY_TYPES
+    ]
+    return PERSONA_GROUPS + exclusion_groups
+
+
+def security_group_body(group: Dict[str, str]) -> Dict[str, Any]:
+    """POST /groups body for a non-mail-enabled security group."""
+    return {
+        'displayName': group['name'],
+        'mailNickname': group['name'].replace('-', ''),
+        'description': group['description'],
+        'mailEnabled': False,
+        'securityEnabled': True
+    }
+
+
+class GroupProvisioner:
+    """
+    Creates the groups of a definition list that do not exist yet.
+
+    1. One paged startswith(displayName, prefix) query lists the existing
+       groups (names compare case-insensitively, like Entra ID does).
+    2. The missing groups are computed locally.
+    3. They are created with POST sub-requests in $batch calls, in rounds of
+       as many calls as the client keeps in flight; throttled sub-requests
+       are retried by GraphClient.batch, and creates that timed out are
+       checked against a fresh listing instead of being resent.
+
+    Created and found groups are written to the DirectoryCache, so deploying
+    templates right afterwards resolves their names without another lookup.
+    """
+
+    def __init__(self, access_token: str, verify_ssl: bool = True,
+                 graph_client: Optional[GraphClient] = None,
+                 tenant_id: Optional[str] = None,
+                 cache: Optional[DirectoryCache] = None,
+                 prefix: str = CA_GROUP_PREFIX):
+        """
+        Args:
+            access_token: Bearer token (delegated or app-only) with Group.ReadWrite.All
+            verify_ssl: Enable SSL certificate verification
+            graph_client: Optional transport (defaults to the shared per-worker client)
+            tenant_id: Tenant used to partition the cache (read from the token if omitted)
+            cache: Optional cache (defaults to the shared DirectoryCache)
+            prefix: Name prefix shared by every group to provision
+        """
+        self.headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+        self.verify_ssl = verify_ssl
+        self.graph = graph_client or get_graph_client()
+        self.tenant_id = tenant_id or tenant_id_from_token(access_token)
+        self.cache = cache or get_directory_cache()
+        self.prefix = prefix
+
+    def existing_groups(self) -> Dict[str, str]:
+        """
+        Every group whose name starts with the prefix.
+
+        Returns:
+            casefolded display name -> object ID
+
+        Raises:
+            requests.exceptions.HTTPError: If the listing fails (nothing is
+                created then, since the missing set would be unknown)
+        """
+        existing: Dict[str, str] = {}
+        for group in self.graph.iter_values(
+            '/groups',
+            params=odata_params(filter=f"startswith(displayName,{odata_quote(self.prefix)})",
+                                select='id,displayName', top=999),
+            headers=self.headers,
+            verify=self.verify_ssl
+        ):
+            if group.get('displayName') and group.get('id'):
+                existing.setdefault(group['displayName'].casefold(), group['id'])
+        return existing
+
+    def _remember(self, groups: Dict[str, str]):
+        """Write name -> ID pairs to the directory cache."""
+        if not self.tenant_id:
+            return
+        for name, group_id in groups.items():
+            self.cache.remember(self.tenant_id, 'group', group_id, name)
+
+    def _confirm_unknown(self, groups: List[Dict[str, str]], indexes: List[int],
+                         responses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Settle creates whose outcome Graph left open.
+
+        A 504 sub-response (or a $batch call that raised, status 0) may come
+        after the group was created, and resending the POST would create a
+        duplicate, since display names need not be unique. The prefix is
+        listed again instead: such groups that exist now count as created
+        (they were missing before the round), the rest stay failed.
+        """
+        unknown = [position for position, response in enumerate(responses)
+                   if response['status'] in UNCONFIRMED_STATUSES]
+        if not unknown:
+            return responses
+        try:
+            existing = self.existing_groups()
+        except Exception:
+            return responses
+        responses = list(responses)
+        for position in unknown:
+            group_id = existing.get(groups[indexes[position]]['name'].casefold())
+            if group_id:
+                responses[position] = {'status': 201, 'body': {'id': group_id}}
+        return responses
+
+    def provision(self, groups: Iterable[Dict[str, str]],
+                  on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+                  on_round: Optional[Callable[[List[str]], None]] = None,
+                  should_stop: Optional[Callable[[], bool]] = None,
+                  max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Create the groups that do not exist yet.
+
+        Args:
+            groups: Dicts with 'name' and 'description'
+            on_result: Called with each result as soon as it is known
+            on_round: Called with the names about to be created in each round
+            should_stop: Checked before each round; once it returns True the
+                         remaining groups are reported as cancelled
+            max_workers: Concurrent $batch calls (defaults to the client setting)
+
+        Returns:
+            One {'name', 'status', 'id' or 'error'} dict per group, in input
+            order; status is 'created', 'skipped' (already exists), 'failed'
+            or 'cancelled'
+        """
+        groups = list(groups)
+        existing = self.existing_groups()
+        self._remember({g['name']: existing[g['name'].casefold()]
+                        for g in groups if g['name'].casefold() in existing})
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(groups)
+
+        def report(index: int, result: Dict[str, Any]):
+            results[index] = result
+            if on_result is not None:
+                on_result(result)
+
+        missing: List[int] = []
+        seen = set(existing)
+        for index, group in enumerate(groups):
+            key = group['name'].casefold()
+            if key in seen:
+                report(index, {'name': group['name'], 'status': 'skipped', 'id': existing.get(key)})
+            else:
+                seen.add(key)
+                missing.append(index)
+
+        workers = max(1, max_workers or self.graph.batch_concurrency)
+        round_size = BATCH_LIMIT * workers
+        for start in range(0, len(missing), round_size):
+            indexes = missing[start:start + round_size]
+            if should_stop is not None and should_stop():
+                for index in missing[start:]:
+                    report(index, {'name': groups[index]['name'], 'status': 'cancelled', 'error': 'Cancelled'})
+                break
+
+            if on_round is not None:
+                on_round([groups[index]['name'] for index in indexes])
+            try:
+                responses = self.graph.batch(
+                    [{'method': 'POST', 'url': '/groups', 'body': security_group_body(groups[index])}
+                     for index in indexes],
+                    max_workers=workers,
+                    headers=self.headers,
+                    verify=self.verify_ssl
+                )
+            except Exception as e:
+                # Chunks sent before the failure may have created their groups
+                responses = [{'status': 0, 'body': {'error': {'message': str(e)}}}] * len(indexes)
+            responses = self._confirm_unknown(groups, indexes, responses)
+
+            created: Dict[str, str] = {}
+            for index, response in zip(indexes, responses):
+                name = groups[index]['name']
+                body = response.get('body') or {}
+                if response['status'] == 201 and body.get('id'):
+                    created[name] = body['id']
+                    report(index, {'name': name, 'status': 'created', 'id': body['id']})
+                else:
+                    error = (body.get('error') or {}).get('message') or str(response['status'])
+                    report(index, {'name': name, 'status': 'failed', 'error': error})
+            self._remember(created)
+
+        return [r for r in results if r is not None]
@@ -0,0 +1,123 @@
+"""
+HTTP Cache - Strong ETags, 304 Not Modified and gzip/brotli negotiation for JSON
+Used by the read-mostly API routes; static payloads (the template library) are
+serialized and compressed once and served from memory
+"""
+
+import gzip
+import hashlib
+from typing import Any, Dict, Optional
+
+from flask import Response, current_app, request
+
+# Brotli is optional; gzip is always available
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+# Bodies smaller than this are sent uncompressed (not worth the CPU)
+MIN_COMPRESS_SIZE = 1024
+
+# Browsers may keep responses but must revalidate them (cheap with a 304)
+DEFAULT_CACHE_CONTROL = 'private, no-cache'
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _accepted_encodings(min_size: int, size: int):
+    """Encodings to try for the current request, best first."""
+    if size < min_size:
+        return []
+    accepted = request.accept_encodings
+    encodings = []
+    if BROTLI_AVAILABLE and accepted['br']:
+        encodings.append('br')
+    if accepted['gzip']:
+        encodings.append('gzip')
+    return encodings
+
+
+class CachedBody:
+    """
+    A serialized JSON body with its content hash and compressed variants.
+
+    Compressed variants get their own strong ETag ('"<hash>-gzip"'), as the
+    bytes differ; a conditional request matches any variant of the same content.
+    """
+
+    def __init__(self, body: bytes, precompress: bool = False):
+        """
+        Args:
+            body: Serialized JSON
+            precompress: Compress every supported encoding now (for payloads
+                         that are served many times)
+        """
+        self.body = body
+        self.digest = hashlib.sha256(body).hexdigest()[:32]
+        self._variants: Dict[str, bytes] = {}
+        if precompress:
+            for encoding in ('br', 'gzip') if BROTLI_AVAILABLE else ('gzip',):
+                self._variants[encoding] = _compress(body, encoding)
+
+    def etag(self, encoding: Optional[str] = None) -> str:
+        return f"{self.digest}-{encoding}" if encoding else self.digest
+
+    def not_modified(self) -> bool:
+        """Whether the request's If-None-Match matches this content."""
+        if_none_match = request.if_none_match
+        if not if_none_match:
+            return False
+        return any(if_none_match.contains(self.etag(encoding)) for encoding in (None, 'gzip', 'br'))
+
+    def variant(self, encoding: str) -> bytes:
+        data = self._variants.get(encoding)
+        if data is None:
+            data = self._variants[encoding] = _compress(self.body, encoding)
+        return data
+
+    def respond(self, status: int = 200, cache_control: str = DEFAULT_CACHE_CONTROL,
+                min_compress_size: int = MIN_COMPRESS_SIZE) -> Response:
+        """Build the response for the current request (304, compressed or plain)."""
+        encodings = _accepted_encodings(min_compress_size, len(self.body))
+        encoding = encodings[0] if encodings else None
+        if status == 200 and self.not_modified():
+            response = Response(status=304)
+            response.set_etag(self.etag(encoding))
+        else:
+            data = self.variant(encoding) if encoding else self.body
+            response = Response(data, status=status, mimetype='application/json')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            if status == 200:
+                response.set_etag(self.etag(encoding))
+        response.headers['Cache-Control'] = cache_control
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+def serialize_json(payload: Any) -> bytes:
+    """Serialize like jsonify (same key order and separators)."""
+    return (current_app.json.dumps(payload) + '\n').encode('utf-8')
+
+
+def json_response(payload: Any, status: int = 200,
+                  cache_control: str = DEFAULT_CACHE_CONTROL) -> Response:
+    """
+    jsonify() with a strong ETag, 304 handling and response compression.
+
+    Args:
+        payload: JSON-serializable response body
+        status: HTTP status (only 200 responses get an ETag / 304)
+        cache_control: Cache-Control header value
+
+    Returns:
+        Flask Response
+    """
+    return CachedBody(serialize_json(payload)).respond(status, cache_control)
@@ -0,0 +1,549 @@
+"""
+Background Jobs - Long-running bulk operations off the request thread
+A route submits a job and returns its ID at once; the work runs on a per-worker
+thread pool (or, with the Redis queue, on whichever worker picks it up). Job
+state - progress, partial results, outcome - is stored with a TTL and polled
+through /api/jobs/<id>; per-item events can be followed as they happen
+through /api/jobs/<id>/events. When no store is reachable from every request,
+stream_job runs the handler and hands its events to the response instead
+"""
+
+import json
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Type of the last event of every job (its data includes the final status)
+DONE_EVENT = 'done'
+
+# Handlers by job kind; registered at import so every worker can run any job
+JOB_HANDLERS: Dict[str, Callable[..., Any]] = {}
+
+
+def job_handler(kind: str):
+    """
+    Register the function that runs jobs of this kind.
+
+    The handler is called as handler(job, **params) on a background thread,
+    where job is a JobContext. It must not touch Flask's request or session,
+    and its return value (JSON-serializable) becomes the job's result.
+    """
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler to stop the job, optionally with a partial result."""
+
+    def __init__(self, result: Any = None):
+        super().__init__('Job cancelled')
+        self.result = result
+
+
+class JobContext:
+    """Handle a running job uses to report progress and partial results."""
+
+    def __init__(self, runner: Optional['JobRunner'] = None, job_id: Optional[str] = None,
+                 on_event: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        Args:
+            runner: Runner that owns the job (None = run inline; progress is
+                    dropped and events are kept in self.events)
+            job_id: Job identifier
+            on_event: Receives each event of an inline job instead of self.events
+        """
+        self.runner = runner
+        self.job_id = job_id
+        self.on_event = on_event
+        self.events: List[Dict[str, Any]] = []
+        self._cancel_requested = False
+
+    def progress(self, done: Optional[int] = None, total: Optional[int] = None,
+                 message: Optional[str] = None):
+        """Update the done/total counters and status message."""
+        if self.runner is not None:
+            self.runner.update(self.job_id, done=done, total=total, message=message)
+
+    def add_results(self, items: List[Any], done: Optional[int] = None,
+                    message: Optional[str] = None):
+        """Append finished items to the job's partial results."""
+        if self.runner is not None and items:
+            self.runner.update(self.job_id, results=items, done=done, message=message)
+
+    def event(self, event_type: str, **data: Any):
+        """
+        Append an event (e.g. 'started', 'created', 'skipped', 'throttled',
+        'failed') to the job's event log.
+        """
+        if self.runner is not None:
+            self.runner.add_event(self.job_id, event_type, **data)
+        elif self.on_event is not None:
+            self.on_event({'type': event_type, 'time': time.time(), **data})
+        else:
+            self.events.append({'type': event_type, **data})
+
+    def cancel(self):
+        """Request cancellation of an inline job."""
+        self._cancel_requested = True
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether cancellation has been requested."""
+        if self.runner is None:
+            return self._cancel_requested
+        return self.runner.store.is_cancel_requested(self.job_id)
+
+    def check_cancelled(self, result: Any = None):
+        """Raise JobCancelled (with result as the partial result) if cancellation was requested."""
+        if self.cancelled:
+            raise JobCancelled(result)
+
+
+class MemoryJobStore:
+    """Job records in this worker's memory (jobs are only visible to this worker)."""
+
+    def __init__(self, ttl: int = 3600):
+        self.ttl = ttl
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._events: Dict[str, List[Dict[str, Any]]] = {}
+        self._expires: Dict[str, float] = {}
+        self._cancel_requested = set()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def _purge(self, now: float):
+        for job_id in [j for j, expires in self._expires.items() if expires <= now]:
+            self._jobs.pop(job_id, None)
+            self._events.pop(job_id, None)
+            self._expires.pop(job_id, None)
+            self._cancel_requested.discard(job_id)
+
+    def create(self, record: Dict[str, Any]):
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            self._jobs[record['id']] = record
+            self._events[record['id']] = []
+            self._expires[record['id']] = now + self.ttl
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if self._expires.get(job_id, 0) <= time.monotonic():
+                return None
+            record = self._jobs.get(job_id)
+            return json.loads(json.dumps(record)) if record is not None else None
+
+    def update(self, job_id: str, changes: Dict[str, Any], results: Optional[List[Any]] = None):
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is None:
+                return
+            record.update(changes)
+            if results:
+                record['results'].extend(results)
+            self._expires[job_id] = time.monotonic() + self.ttl
+
+    def add_events(self, job_id: str, events: List[Dict[str, Any]]):
+        with self._lock:
+            log = self._events.get(job_id)
+            if log is None:
+                return
+            log.extend(events)
+            self._changed.notify_all()
+
+    def events(self, job_id: str, after: int = 0) -> List[Dict[str, Any]]:
+        """Events with a sequence number above after (numbered from 1)."""
+        with self._lock:
+            log = self._events.get(job_id, [])
+            return [{'seq': seq, **event} for seq, event in enumerate(log[after:], start=after + 1)]
+
+    def wait(self, job_id: str, after: int, timeout: float):
+        """Block until the job has more than after events (or timeout)."""
+        with self._lock:
+            self._changed.wait_for(lambda: len(self._events.get(job_id, ())) > after, timeout)
+
+    def request_cancel(self, job_id: str):
+        with self._lock:
+            self._cancel_requested.add(job_id)
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        return job_id in self._cancel_requested
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+
+class RedisJobStore:
+    """
+    Job records in Redis, visible to every worker.
+
+    Each job is a JSON document at job:<id> (rewritten on every update, which
+    is fine for the few hundred items a bulk operation produces), a
+    job_events:<id> list and a job_cancel:<id> flag; all expire after ttl
+    seconds. Event readers poll the list every poll_interval seconds.
+    """
+
+    def __init__(self, redis_client, ttl: int = 3600, key_prefix: str = 'job',
+                 poll_interval: float = 0.5):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.key_prefix}:{job_id}"
+
+    def create(self, record: Dict[str, Any]):
+        self.redis_client.setex(self._key(record['id']), self.ttl, json.dumps(record))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        data = self.redis_client.get(self._key(job_id))
+        return json.loads(data) if data else None
+
+    def update(self, job_id: str, changes: Dict[str, Any], results: Optional[List[Any]] = None):
+        # Only the worker running a job writes to it; the lock orders its own threads
+        with self._lock:
+            record = self.get(job_id)
+            if record is None:
+                return
+            record.update(changes)
+            if results:
+                record['results'].extend(results)
+            self.redis_client.setex(self._key(job_id), self.ttl, json.dumps(record))
+
+    def add_events(self, job_id: str, events: List[Dict[str, Any]]):
+        key = f"{self.key_prefix}_events:{job_id}"
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.rpush(key, *[json.dumps(event) for event in events])
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def events(self, job_id: str, after: int = 0) -> List[Dict[str, Any]]:
+        """Events with a sequence number above after (numbered from 1)."""
+        log = self.redis_client.lrange(f"{self.key_prefix}_events:{job_id}", after, -1)
+        return [{'seq': seq, **json.loads(event)} for seq, event in enumerate(log, start=after + 1)]
+
+    def wait(self, job_id: str, after: int, timeout: float):
+        time.sleep(min(timeout, self.poll_interval))
+
+    def request_cancel(self, job_id: str):
+        self.redis_client.setex(f"{self.key_prefix}_cancel:{job_id}", self.ttl, '1')
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        return bool(self.redis_client.exists(f"{self.key_prefix}_cancel:{job_id}"))
+
+    def count(self) -> Optional[int]:
+        return None
+
+
+class JobRunner:
+    """
+    Runs registered job handlers in the background.
+
+    Jobs go to this worker's thread pool, or - with use_queue and a Redis
+    client - onto a Redis list that every worker's consumer threads pop from,
+    so a job survives the submitting worker being busy and its state is
+    visible to all workers.
+
+    Without Redis, job state lives in this worker's memory, which every
+    request only reaches when a single process serves the app.
+    """
+
+    def __init__(self, max_workers: int = 4, ttl: int = 3600, redis_client=None,
+                 use_queue: bool = False, queue_key: str = 'jobs:queue',
+                 single_process: bool = True):
+        """
+        Args:
+            max_workers: Jobs run concurrently by this worker
+            ttl: Seconds a job's state is kept after its last update
+            redis_client: Optional Redis client for shared job state
+            use_queue: Dispatch jobs through a Redis list instead of the local pool
+            queue_key: Redis list used as the queue
+            single_process: Whether this is the only process serving the app
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.ttl = ttl
+        self.redis_client = redis_client
+        self.single_process = single_process
+        self.use_queue = bool(use_queue and redis_client is not None)
+        self.queue_key = queue_key
+        self.store = RedisJobStore(redis_client, ttl) if redis_client is not None else MemoryJobStore(ttl)
+        self.submitted = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._consumers: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='job')
+        return self._executor
+
+    def start_consumers(self):
+        """Start the threads that take queued jobs from Redis (queue mode only)."""
+        if not self.use_queue or self._consumers:
+            return
+        for n in range(self.max_workers):
+            consumer = threading.Thread(target=self._consume, name=f'job-consumer-{n}', daemon=True)
+            consumer.start()
+            self._consumers.append(consumer)
+
+    def _consume(self):
+        while True:
+            try:
+                item = self.redis_client.brpop(self.queue_key, timeout=5)
+            except Exception as e:
+                print(f"⚠️  Job queue read failed: {e}")
+                time.sleep(5)
+                continue
+            if item:
+                self._execute(item[1])
+
+    def submit(self, kind: str, owner: str, params: Dict[str, Any],
+               total: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Create a job and start (or queue) it.
+
+        Args:
+            kind: Registered handler name
+            owner: Session ID allowed to see and cancel the job
+            params: Keyword arguments for the handler (JSON-serializable)
+            total: Number of items, when known up front
+
+        Returns:
+            The job's public state
+        """
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        now = time.time()
+        record = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'owner': owner,
+            'params': params,
+            'status': QUEUED,
+            'done': 0,
+            'total': total,
+            'message': None,
+            'results': [],
+            'result': None,
+            'error': None,
+            'created_at': now,
+            'updated_at': now,
+            'finished_at': None
+        }
+        self.store.create(record)
+        self.submitted += 1
+        if self.use_queue:
+            self.redis_client.lpush(self.queue_key, record['id'])
+        else:
+            self._pool().submit(self._execute, record['id'])
+        return public_job(record)
+
+    def update(self, job_id: str, results: Optional[List[Any]] = None, **changes: Any):
+        """Record progress for a job (None values are left unchanged)."""
+        changes = {k: v for k, v in changes.items() if v is not None}
+        changes['updated_at'] = time.time()
+        try:
+            self.store.update(job_id, changes, results)
+        except Exception as e:
+            print(f"⚠️  Failed to update job {job_id}: {e}")
+
+    def add_event(self, job_id: str, event_type: str, **data: Any):
+        """Append an event to a job's event log."""
+        try:
+            self.store.add_events(job_id, [{'type': event_type, 'time': time.time(), **data}])
+        except Exception as e:
+            print(f"⚠️  Failed to record {event_type} event for job {job_id}: {e}")
+
+    def _finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None):
+        self.update(job_id, status=status, result=result, error=error, finished_at=time.time())
+        self.add_event(job_id, DONE_EVENT, status=status, error=error)
+
+    def _execute(self, job_id: str):
+        record = self.store.get(job_id)
+        if record is None or record['status'] != QUEUED:
+            return
+        if self.store.is_cancel_requested(job_id):
+            self._finish(job_id, CANCELLED)
+            return
+
+        self.update(job_id, status=RUNNING)
+        status, result, error = run_handler(JOB_HANDLERS[record['kind']], JobContext(self, job_id),
+                                            record['params'], f"{job_id} ({record['kind']})")
+        self._finish(job_id, status, result=result, error=error)
+
+    def get(self, job_id: str, owner: str) -> Optional[Dict[str, Any]]:
+        """Public state of a job, or None if it does not exist (or belongs to someone else)."""
+        record = self.store.get(job_id)
+        if record is None or record['owner'] != owner:
+            return None
+        return public_job(record, self.store.is_cancel_requested(job_id))
+
+    def follow(self, job_id: str, after: int = 0,
+               heartbeat: float = 15.0) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        Yield a job's events as they are recorded, starting after sequence number after.
+
+        None is yielded when nothing happened for heartbeat seconds (so a
+        stream can send a keep-alive). Ends after the 'done' event, or when the
+        job has expired.
+        """
+        while True:
+            events = self.store.events(job_id, after)
+            for event in events:
+                yield event
+                after = event['seq']
+                if event['type'] == DONE_EVENT:
+                    return
+            if events:
+                continue
+            started = time.monotonic()
+            while time.monotonic() - started < heartbeat:
+                self.store.wait(job_id, after, heartbeat - (time.monotonic() - started))
+                if self.store.events(job_id, after):
+                    break
+            else:
+                if self.store.get(job_id) is None:
+                    return
+                yield None
+
+    def cancel(self, job_id: str, owner: str) -> Optional[Dict[str, Any]]:
+        """
+        Request cancellation of a job.
+
+        A queued job is cancelled before it starts; a running one stops at its
+        next check (items already finished stay done).
+
+        Returns:
+            The job's public state, or None if it does not exist
+        """
+        record = self.store.get(job_id)
+        if record is None or record['owner'] != owner:
+            return None
+        if record['status'] in FINISHED:
+            return public_job(record)
+        self.store.request_cancel(job_id)
+        return public_job(record, cancel_requested=True)
+
+    @property
+    def shared_state(self) -> bool:
+        """Whether every request can see the jobs (Redis store, or the only process's memory)."""
+        return self.redis_client is not None or self.single_process
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'backend': 'redis-queue' if self.use_queue else 'thread-pool',
+            'shared_state': self.shared_state,
+            'single_process': self.single_process,
+            'max_workers': self.max_workers,
+            'submitted': self.submitted,
+            'stored': self.store.count(),
+            'ttl': self.ttl
+        }
+
+
+def run_handler(handler: Callable[..., Any], job: JobContext, params: Dict[str, Any],
+                label: str = '') -> Tuple[str, Any, Optional[str]]:
+    """
+    Run a handler to completion.
+
+    Returns:
+        (final status, result, error); a result with "success": false counts as failed
+    """
+    try:
+        result = handler(job, **params)
+    except JobCancelled as e:
+        return CANCELLED, e.result, None
+    except Exception as e:
+        print(f"❌ Job {label} failed: {e}")
+        return FAILED, None, str(e)
+    if isinstance(result, dict) and result.get('success') is False:
+        return FAILED, result, result.get('error')
+    return SUCCEEDED, result, None
+
+
+def stream_job(handler: Callable[..., Any], params: Dict[str, Any], label: str = '',
+               heartbeat: float = 15.0) -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    Run a handler on its own thread and yield its events as they happen.
+
+    For background requests when no store is reachable from every request:
+    the progress goes straight into the response instead of into a job
+    record. None is yielded after heartbeat seconds without an event (so a
+    stream can send a keep-alive). The last event is 'done' with the final
+    status, result and error. Closing the iterator early (the client went
+    away) cancels the job at its next check.
+    """
+    events: 'queue.Queue[Dict[str, Any]]' = queue.Queue()
+    job = JobContext(on_event=events.put)
+
+    def run():
+        status, result, error = run_handler(handler, job, params, label)
+        events.put({'type': DONE_EVENT, 'time': time.time(), 'status': status,
+                    'result': result, 'error': error})
+
+    threading.Thread(target=run, name='job-stream', daemon=True).start()
+    try:
+        while True:
+            try:
+                event = events.get(timeout=heartbeat)
+            except queue.Empty:
+                yield None
+                continue
+            yield event
+            if event['type'] == DONE_EVENT:
+                return
+    finally:
+        job.cancel()
+
+
+def public_job(record: Dict[str, Any], cancel_requested: bool = False) -> Dict[str, Any]:
+    """The /api/jobs representation of a job (no owner or handler parameters)."""
+    job = {k: v for k, v in record.items() if k not in ('owner', 'params')}
+    job['cancel_requested'] = cancel_requested
+    return job
+
+
+_runner: Optional[JobRunner] = None
+_runner_lock = threading.Lock()
+
+
+def configure_job_runner(**settings: Any) -> JobRunner:
+    """
+    Replace the shared JobRunner.
+
+    Args:
+        **settings: Keyword arguments for JobRunner (max_workers, ttl, redis_client...)
+    """
+    global _runner
+    with _runner_lock:
+        _runner = JobRunner(**{k: v for k, v in settings.items() if v is not None})
+    _runner.start_consumers()
+    return _runner
+
+
+def get_job_runner() -> JobRunner:
+    """Return the shared JobRunner (in-process thread pool until configured)."""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = JobRunner()
+    return _runner
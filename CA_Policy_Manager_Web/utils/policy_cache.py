@@ -0,0 +1,368 @@
+"""
+Policy Cache - Short-lived per-tenant snapshot of the Conditional Access policy list
+Serves the policies table, duplicate-name checks and deploy-all from memory and
+is updated in place (write-through) when this app creates, updates or deletes
+a policy
+"""
+
+import time
+import threading
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+# (tenant ID, principal ID) - snapshots are kept per signed-in principal so a
+# user never sees policies fetched with someone else's permissions
+CacheIdentity = Tuple[str, str]
+
+# Returned by PolicyCache.claim_name while another request is creating the name
+NAME_PENDING = 'pending'
+
+# Columns of the policies table; enough for duplicate-name checks as well
+SUMMARY_FIELDS = ('id', 'displayName', 'state', 'createdDateTime', 'modifiedDateTime')
+
+# Fields the policies list can be sorted by (Graph timestamps are ISO 8601,
+# so they sort correctly as strings)
+SORT_FIELDS = ('displayName', 'state', 'createdDateTime', 'modifiedDateTime')
+
+# Largest page the policies list returns in one response
+MAX_PAGE_SIZE = 500
+
+
+def field_set(fields: Optional[Iterable[str]]) -> Optional[FrozenSet[str]]:
+    """Normalize a $select field list (None = every field); 'id' is always included."""
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    return frozenset({'id', *(f.strip() for f in fields if f.strip())})
+
+
+def name_key(display_name: Optional[str]) -> str:
+    """Normalize a display name for case-insensitive comparison."""
+    return (display_name or '').strip().casefold()
+
+
+class _Snapshot:
+    """Policies of one tenant as seen by one principal, indexed by ID and name."""
+
+    def __init__(self, policies: Iterable[Dict], ttl: float,
+                 fields: Optional[FrozenSet[str]] = None):
+        self.fields = fields
+        self.policies: Dict[str, Dict] = {}
+        self.names: Dict[str, Set[str]] = {}
+        self.sort_keys: Dict[str, Dict[str, str]] = {}
+        self._orders: Dict[str, List[str]] = {}
+        for policy in policies:
+            self.put(policy)
+        self.fetched_at = time.monotonic()
+        self.expires_at = self.fetched_at + ttl
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+    def covers(self, fields: Optional[FrozenSet[str]]) -> bool:
+        """Whether the snapshot was fetched with (at least) these fields."""
+        return self.fields is None or (fields is not None and fields <= self.fields)
+
+    def put(self, policy: Dict):
+        policy_id = policy.get('id')
+        if not policy_id:
+            return
+        self.drop(policy_id)
+        self._orders.clear()
+        self.policies[policy_id] = policy
+        self.names.setdefault(name_key(policy.get('displayName')), set()).add(policy_id)
+        keys = {field: name_key(policy.get(field)) for field in SORT_FIELDS}
+        keys['search'] = f"{keys['displayName']}\n{policy_id.casefold()}"
+        self.sort_keys[policy_id] = keys
+
+    def drop(self, policy_id: str):
+        old = self.policies.pop(policy_id, None)
+        if old is None:
+            return
+        self.sort_keys.pop(policy_id, None)
+        self._orders.clear()
+        key = name_key(old.get('displayName'))
+        ids = self.names.get(key)
+        if ids is not None:
+            ids.discard(policy_id)
+            if not ids:
+                del self.names[key]
+
+    def find_name(self, display_name: str) -> Optional[str]:
+        ids = self.names.get(name_key(display_name))
+        return min(ids) if ids else None
+
+    def order(self, sort: str) -> List[str]:
+        """Policy IDs in ascending sort order (memoized until the next change)."""
+        ids = self._orders.get(sort)
+        if ids is None:
+            keys = self.sort_keys
+            ids = sorted(keys, key=lambda policy_id: (keys[policy_id][sort], policy_id))
+            self._orders[sort] = ids
+        return ids
+
+    def query(self, states: Optional[Set[str]] = None, search: Optional[str] = None,
+              sort: str = 'displayName', descending: bool = False,
+              offset: int = 0, limit: Optional[int] = None) -> Tuple[List[Dict], int]:
+        ids = self.order(sort)
+        if descending:
+            ids = ids[::-1]
+        if states:
+            states = {name_key(state) for state in states}
+            ids = [i for i in ids if self.sort_keys[i]['state'] in states]
+        if search:
+            needle = search.casefold()
+            ids = [i for i in ids if needle in self.sort_keys[i]['search']]
+        end = None if limit is None else offset + limit
+        return [self.policies[i] for i in ids[offset:end]], len(ids)
+
+
+class PolicyCache:
+    """
+    Per-worker cache of full policy lists with a short TTL.
+
+    A snapshot is filled by one full enumeration, optionally with a $select
+    field list (e.g. SUMMARY_FIELDS); it then only serves requests for a
+    subset of those fields. Writes made through this app are applied to every
+    snapshot of the tenant, so they are visible at once without re-downloading
+    the list. Changes made elsewhere (portal, other workers) show up when the
+    snapshot expires or is refreshed explicitly.
+    """
+
+    def __init__(self, ttl: float = 60, max_snapshots: int = 256):
+        """
+        Args:
+            ttl: Seconds a snapshot is served before it is fetched again
+            max_snapshots: Snapshots kept per worker (oldest dropped first)
+        """
+        self.ttl = ttl
+        self.max_snapshots = max_snapshots
+        self._snapshots: Dict[CacheIdentity, _Snapshot] = {}
+        self._lock = threading.Lock()
+        self._fill_locks: Dict[CacheIdentity, threading.Lock] = {}
+        self._pending_names: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, identity: CacheIdentity, policies: Iterable[Dict],
+               fields: Optional[FrozenSet[str]] = None) -> _Snapshot:
+        snapshot = _Snapshot(policies, self.ttl, fields)
+        with self._lock:
+            self._snapshots.pop(identity, None)
+            self._snapshots[identity] = snapshot
+            while len(self._snapshots) > self.max_snapshots:
+                evicted = next(iter(self._snapshots))
+                self._snapshots.pop(evicted)
+                self._fill_locks.pop(evicted, None)
+        return snapshot
+
+    def _fresh_snapshot(self, identity: CacheIdentity,
+                        fields: Optional[FrozenSet[str]] = None) -> Optional[_Snapshot]:
+        snapshot = self._snapshots.get(identity)
+        if snapshot is not None and snapshot.fresh and snapshot.covers(fields):
+            return snapshot
+        return None
+
+    def _snapshot(self, identity: CacheIdentity, fetch: Callable[[], Iterable[Dict]],
+                  refresh: bool = False, fields: Optional[Iterable[str]] = None) -> _Snapshot:
+        fields = field_set(fields)
+        snapshot = None if refresh else self._fresh_snapshot(identity, fields)
+        if snapshot is not None:
+            self.hits += 1
+            return snapshot
+
+        requested_at = time.monotonic()
+        with self._lock:
+            fill_lock = self._fill_locks.setdefault(identity, threading.Lock())
+        with fill_lock:
+            # Another request may have filled it while we waited
+            snapshot = self._fresh_snapshot(identity, fields)
+            if snapshot is None or (refresh and snapshot.fetched_at < requested_at):
+                self.misses += 1
+                snapshot = self._store(identity, fetch(), fields)
+            else:
+                self.hits += 1
+        return snapshot
+
+    def get_policies(self, identity: CacheIdentity, fetch: Callable[[], Iterable[Dict]],
+                     refresh: bool = False, fields: Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        Return the policy list, fetching it only if the snapshot is missing,
+        expired or a refresh is requested.
+
+        Concurrent misses for the same identity share one fetch.
+
+        Args:
+            identity: (tenant ID, principal ID)
+            fetch: Returns every policy from Graph (all pages) with the given fields
+            refresh: Ignore the current snapshot
+            fields: Fields fetch asks Graph for ($select); None = every field
+
+        Returns:
+            List of policy objects (do not modify them in place); they may
+            carry more fields than requested
+        """
+        snapshot = self._snapshot(identity, fetch, refresh, fields)
+        with self._lock:
+            return list(snapshot.policies.values())
+
+    def query(self, identity: CacheIdentity, fetch: Callable[[], Iterable[Dict]],
+              refresh: bool = False, fields: Optional[Iterable[str]] = None,
+              **criteria: Any) -> Tuple[List[Dict], int]:
+        """
+        Filter, sort and page the snapshot without copying the whole list.
+
+        Args:
+            identity, fetch, refresh, fields: As for get_policies
+            **criteria: states, search, sort, descending, offset, limit
+                        (see query_snapshot)
+
+        Returns:
+            (policies on the requested page, number of matching policies)
+        """
+        snapshot = self._snapshot(identity, fetch, refresh, fields)
+        with self._lock:
+            return snapshot.query(**criteria)
+
+    def policy_names(self, identity: CacheIdentity, fetch: Callable[[], Iterable[Dict]],
+                     fields: Optional[Iterable[str]] = SUMMARY_FIELDS) -> Set[str]:
+        """Normalized display names (see name_key) of every policy in the tenant."""
+        snapshot = self._snapshot(identity, fetch, fields=fields)
+        with self._lock:
+            return set(snapshot.names)
+
+    def claim_name(self, identity: CacheIdentity, display_name: str,
+                   fetch: Callable[[], Iterable[Dict]],
+                   fields: Optional[Iterable[str]] = SUMMARY_FIELDS) -> Optional[str]:
+        """
+        Check a display name before creating a policy and reserve it.
+
+        Matching is case-insensitive. While reserved, concurrent claims for the
+        same name in the tenant get NAME_PENDING; call release_name once the
+        create has finished (after upsert on success).
+
+        Args:
+            identity: (tenant ID, principal ID)
+            display_name: Name of the policy about to be created
+            fetch: Returns every policy from Graph (used on a cache miss)
+            fields: Fields fetch asks Graph for ($select)
+
+        Returns:
+            None if the name is free (now reserved), the existing policy's ID,
+            or NAME_PENDING
+        """
+        snapshot = self._snapshot(identity, fetch, fields=fields)
+        key = name_key(display_name)
+        with self._lock:
+            existing = snapshot.find_name(display_name)
+            if existing:
+                return existing
+            pending = self._pending_names.setdefault(identity[0], set())
+            if key in pending:
+                return NAME_PENDING
+            pending.add(key)
+        return None
+
+    def release_name(self, tenant_id: Optional[str], display_name: str):
+        """Release a name reserved by claim_name."""
+        with self._lock:
+            pending = self._pending_names.get(tenant_id)
+            if pending is not None:
+                pending.discard(name_key(display_name))
+                if not pending:
+                    del self._pending_names[tenant_id]
+
+    def collecting(self, identity: CacheIdentity, items: Iterable[Dict],
+                   fields: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+        """
+        Pass items through (e.g. while streaming them) and store them as the
+        snapshot once the iteration completes.
+        """
+        collected = []
+        for item in items:
+            collected.append(item)
+            yield item
+        self.misses += 1
+        self._store(identity, collected, field_set(fields))
+
+    def peek(self, identity: CacheIdentity,
+             fields: Optional[Iterable[str]] = None) -> Optional[List[Dict]]:
+        """Policies from a fresh snapshot with these fields, or None without fetching."""
+        snapshot = self._fresh_snapshot(identity, field_set(fields))
+        if snapshot is None:
+            return None
+        with self._lock:
+            return list(snapshot.policies.values())
+
+    def _tenant_snapshots(self, tenant_id: str) -> List[_Snapshot]:
+        with self._lock:
+            return [s for (tid, _), s in self._snapshots.items() if tid == tenant_id and s.fresh]
+
+    def upsert(self, tenant_id: Optional[str], policy: Optional[Dict]):
+        """Write-through: add or replace a policy created/updated by this app."""
+        if not tenant_id or not policy or not policy.get('id'):
+            return
+        for snapshot in self._tenant_snapshots(tenant_id):
+            with self._lock:
+                snapshot.put(policy)
+
+    def remove(self, tenant_id: Optional[str], policy_ids: Iterable[str]):
+        """Write-through: drop policies deleted by this app."""
+        if not tenant_id:
+            return
+        policy_ids = list(policy_ids)
+        for snapshot in self._tenant_snapshots(tenant_id):
+            with self._lock:
+                for policy_id in policy_ids:
+                    snapshot.drop(policy_id)
+
+    def invalidate(self, tenant_id: Optional[str] = None):
+        """Drop the snapshots of one tenant (or of every tenant)."""
+        with self._lock:
+            for identity in list(self._snapshots):
+                if tenant_id is None or identity[0] == tenant_id:
+                    del self._snapshots[identity]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'snapshots': len(self._snapshots),
+            'policies': sum(len(s.policies) for s in list(self._snapshots.values())),
+            'pending_names': sum(len(names) for names in list(self._pending_names.values())),
+            'hits': self.hits,
+            'misses': self.misses,
+            'ttl': self.ttl
+        }
+
+
+def query_snapshot(policies: Iterable[Dict], **criteria: Any) -> Tuple[List[Dict], int]:
+    """
+    Filter, sort and page an uncached policy list like PolicyCache.query.
+
+    Args:
+        policies: Policy objects
+        **criteria: states (set of states to keep), search (case-insensitive
+                    substring of the name or ID), sort (one of SORT_FIELDS),
+                    descending, offset, limit
+    """
+    return _Snapshot(policies, ttl=0).query(**criteria)
+
+
+def project_policy(policy: Dict, select: Optional[Iterable[str]]) -> Dict:
+    """
+    Apply a $select field list to a cached policy.
+
+    Args:
+        policy: Full policy object
+        select: Field names, as a list or comma-separated string (None/empty
+                keeps every field)
+    """
+    fields = field_set(select) if select else None
+    if fields is None:
+        return policy
+    return {k: v for k, v in policy.items() if k in fields}
+
+
+def summary_row(policy: Dict) -> List[Any]:
+    """Compact table row: the SUMMARY_FIELDS values of a policy, in order."""
+    return [policy.get(field) for field in SUMMARY_FIELDS]
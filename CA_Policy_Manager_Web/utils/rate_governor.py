@@ -0,0 +1,365 @@
+"""
+Rate Governor - Per-tenant adaptive rate limiting for Microsoft Graph
+A token bucket per tenant that halves its rate when Graph throttles (429/503)
+and creeps back up on success. With Redis the bucket is shared by all
+gunicorn workers; otherwise each worker keeps its own
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# Lua keeps each bucket update atomic across workers. Numbers are returned as
+# strings because Redis truncates Lua numbers to integers.
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate', 'blocked_until')
+local rate = tonumber(data[3]) or tonumber(ARGV[3])
+local burst = tonumber(ARGV[4])
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+local blocked = tonumber(data[4]) or 0
+if blocked > now then
+    return tostring(blocked - now)
+end
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now), 'rate', tostring(rate))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[5]))
+return tostring(wait)
+"""
+
+_PENALIZE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local data = redis.call('HMGET', KEYS[1], 'rate', 'blocked_until', 'decreased_at')
+local rate = tonumber(data[1]) or tonumber(ARGV[2])
+local blocked = tonumber(data[2]) or 0
+local decreased_at = tonumber(data[3]) or 0
+if now - decreased_at >= tonumber(ARGV[5]) then
+    rate = math.max(tonumber(ARGV[3]), rate * tonumber(ARGV[4]))
+    decreased_at = now
+end
+blocked = math.max(blocked, now + tonumber(ARGV[6]))
+redis.call('HSET', KEYS[1], 'rate', tostring(rate), 'blocked_until', tostring(blocked),
+           'decreased_at', tostring(decreased_at), 'tokens', '0', 'ts', tostring(now))
+redis.call('HINCRBY', KEYS[1], 'throttled', 1)
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[7]))
+return tostring(rate)
+"""
+
+_REWARD_SCRIPT = """
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate'))
+if not rate then
+    return ARGV[1]
+end
+rate = math.min(tonumber(ARGV[1]), rate + tonumber(ARGV[2]))
+redis.call('HSET', KEYS[1], 'rate', tostring(rate))
+return tostring(rate)
+"""
+
+
+class _Bucket:
+    """In-process state for one tenant."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.decreased_at = 0.0
+        self.waiting = 0
+        self.throttled = 0
+        self.pending_rewards = 0
+
+
+class RateGovernor:
+    """
+    Adaptive token bucket per tenant (AIMD).
+
+    Each Graph call takes a token before it is sent. A throttled response
+    multiplies the tenant's rate by decrease_factor (at most once per
+    decrease_interval, so a burst of 429s counts once) and blocks the tenant
+    until its Retry-After has passed. Each success adds increase_step
+    requests/second back, up to max_rate.
+    """
+
+    def __init__(self, max_rate: float = 20.0, min_rate: float = 1.0, burst: float = 40.0,
+                 increase_step: float = 0.5, decrease_factor: float = 0.5,
+                 decrease_interval: float = 1.0, max_wait: float = 60.0,
+                 redis_client=None, key_prefix: str = 'graphrate',
+                 reward_every: int = 10, state_ttl: int = 3600):
+        """
+        Args:
+            max_rate: Starting and highest rate per tenant (requests/second)
+            min_rate: Lowest rate the governor backs off to
+            burst: Bucket capacity (requests that may be sent back to back)
+            increase_step: Requests/second added back per successful call
+            decrease_factor: Multiplier applied to the rate when throttled
+            decrease_interval: Minimum seconds between two rate decreases
+            max_wait: Longest a caller waits for a token before sending anyway
+            redis_client: Optional Redis client to share buckets across workers
+            key_prefix: Redis key prefix
+            reward_every: Successes batched into one Redis rate update
+            state_ttl: Seconds an idle tenant's Redis state is kept
+        """
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = max(burst, 1.0)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.decrease_interval = decrease_interval
+        self.max_wait = max_wait
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.reward_every = max(1, reward_every)
+        self.state_ttl = state_ttl
+        self.redis_errors = 0
+
+        self._buckets: Dict[str, _Bucket] = {}
+        self._lock = threading.Lock()
+        self._listeners: Dict[str, List[Callable[[float], None]]] = {}
+        self._scripts = None
+        if redis_client is not None:
+            self._scripts = (
+                redis_client.register_script(_ACQUIRE_SCRIPT),
+                redis_client.register_script(_PENALIZE_SCRIPT),
+                redis_client.register_script(_REWARD_SCRIPT)
+            )
+
+    def _bucket(self, tenant_id: str) -> _Bucket:
+        bucket = self._buckets.get(tenant_id)
+        if bucket is None:
+            bucket = self._buckets.setdefault(tenant_id, _Bucket(self.max_rate, self.burst))
+        return bucket
+
+    def _redis_key(self, tenant_id: str) -> str:
+        return f"{self.key_prefix}:{tenant_id}"
+
+    def _redis_failed(self, action: str, error: Exception):
+        self.redis_errors += 1
+        print(f"⚠️  Rate governor Redis {action} failed, using local bucket: {error}")
+
+    def try_acquire(self, tenant_id: str, cost: float = 1) -> float:
+        """Take tokens without blocking; returns 0 on success, else the seconds to wait."""
+        if self._scripts is not None:
+            try:
+                return float(self._scripts[0](
+                    keys=[self._redis_key(tenant_id)],
+                    args=[time.time(), cost, self.max_rate, self.burst, self.state_ttl]
+                ))
+            except Exception as e:
+                self._redis_failed('acquire', e)
+
+        with self._lock:
+            bucket = self._bucket(tenant_id)
+            now = time.monotonic()
+            if bucket.blocked_until > now:
+                return bucket.blocked_until - now
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+            if bucket.tokens >= cost:
+                bucket.tokens -= cost
+                return 0.0
+            return (cost - bucket.tokens) / bucket.rate
+
+    def acquire(self, tenant_id: Optional[str], cost: float = 1) -> float:
+        """
+        Block until the tenant may send a request costing the given tokens.
+
+        Args:
+            tenant_id: Tenant the request is for (None = not governed)
+            cost: Tokens to take (e.g. the sub-request count of a $batch call)
+
+        Returns:
+            Seconds spent waiting
+        """
+        if not tenant_id:
+            return 0.0
+        cost = min(max(cost, 1), self.burst)
+        wait = self.try_acquire(tenant_id, cost)
+        if wait <= 0:
+            return 0.0
+
+        started = time.monotonic()
+        bucket = self._bucket(tenant_id)
+        with self._lock:
+            bucket.waiting += 1
+        try:
+            while wait > 0:
+                remaining = self.max_wait - (time.monotonic() - started)
+                if remaining <= 0:
+                    print(f"⚠️  Rate governor wait for tenant {tenant_id} exceeded {self.max_wait}s, sending anyway")
+                    break
+                time.sleep(min(wait, remaining))
+                wait = self.try_acquire(tenant_id, cost)
+        finally:
+            with self._lock:
+                bucket.waiting -= 1
+        return time.monotonic() - started
+
+    @contextmanager
+    def watch(self, tenant_id: Optional[str], callback: Callable[[float], None]):
+        """
+        Call callback(retry_after) whenever this worker sees the tenant throttled.
+
+        Used to report throttling while a bulk operation runs; the callback
+        is removed when the with block exits.
+        """
+        if not tenant_id:
+            yield
+            return
+        with self._lock:
+            self._listeners.setdefault(tenant_id, []).append(callback)
+        try:
+            yield
+        finally:
+            with self._lock:
+                listeners = self._listeners.get(tenant_id, [])
+                if callback in listeners:
+                    listeners.remove(callback)
+                if not listeners:
+                    self._listeners.pop(tenant_id, None)
+
+    def _notify_throttled(self, tenant_id: str, retry_after: float):
+        with self._lock:
+            listeners = list(self._listeners.get(tenant_id, ()))
+        for callback in listeners:
+            try:
+                callback(retry_after)
+            except Exception as e:
+                print(f"⚠️  Throttle listener failed: {e}")
+
+    def record_throttle(self, tenant_id: Optional[str], retry_after: float):
+        """
+        Report a throttled response: lower the tenant's rate and pause it.
+
+        Args:
+            tenant_id: Tenant that was throttled
+            retry_after: Seconds Graph asked us to wait
+        """
+        if not tenant_id:
+            return
+        with self._lock:
+            bucket = self._bucket(tenant_id)
+            bucket.throttled += 1
+            bucket.pending_rewards = 0
+        self._notify_throttled(tenant_id, retry_after)
+
+        if self._scripts is not None:
+            try:
+                self._scripts[1](
+                    keys=[self._redis_key(tenant_id)],
+                    args=[time.time(), self.max_rate, self.min_rate, self.decrease_factor,
+                          self.decrease_interval, retry_after, self.state_ttl]
+                )
+                return
+            except Exception as e:
+                self._redis_failed('penalize', e)
+
+        with self._lock:
+            now = time.monotonic()
+            if now - bucket.decreased_at >= self.decrease_interval:
+                bucket.rate = max(self.min_rate, bucket.rate * self.decrease_factor)
+                bucket.decreased_at = now
+            bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+            bucket.tokens = 0.0
+            bucket.updated = now
+
+    def record_success(self, tenant_id: Optional[str]):
+        """Report a successful response so the tenant's rate can recover."""
+        if not tenant_id:
+            return
+        with self._lock:
+            bucket = self._bucket(tenant_id)
+            if self._scripts is None:
+                bucket.rate = min(self.max_rate, bucket.rate + self.increase_step)
+                return
+            bucket.pending_rewards += 1
+            if bucket.pending_rewards < self.reward_every:
+                return
+            rewards, bucket.pending_rewards = bucket.pending_rewards, 0
+
+        try:
+            self._scripts[2](
+                keys=[self._redis_key(tenant_id)],
+                args=[self.max_rate, self.increase_step * rewards]
+            )
+        except Exception as e:
+            self._redis_failed('reward', e)
+
+    def _tenant_stats(self, tenant_id: str, bucket: _Bucket) -> Dict[str, Any]:
+        stats = {
+            'rate': round(bucket.rate, 2),
+            'tokens': round(min(self.burst, bucket.tokens + (time.monotonic() - bucket.updated) * bucket.rate), 2),
+            'queue_depth': bucket.waiting,
+            'throttled': bucket.throttled,
+            'blocked_for': round(max(0.0, bucket.blocked_until - time.monotonic()), 2)
+        }
+        if self.redis_client is not None:
+            try:
+                shared = self.redis_client.hgetall(self._redis_key(tenant_id))
+                if shared:
+                    stats.update({
+                        'rate': round(float(shared.get('rate', self.max_rate)), 2),
+                        'tokens': round(float(shared.get('tokens', self.burst)), 2),
+                        'throttled': int(shared.get('throttled', 0)),
+                        'blocked_for': round(max(0.0, float(shared.get('blocked_until', 0)) - time.time()), 2)
+                    })
+            except Exception as e:
+                self._redis_failed('stats', e)
+        return stats
+
+    def stats(self, tenant_ids: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Current rate, tokens and queue depth per tenant seen by this worker.
+
+        Args:
+            tenant_ids: Only report these tenants (all tenants if omitted)
+        """
+        with self._lock:
+            buckets = list(self._buckets.items())
+        if tenant_ids is not None:
+            wanted = set(tenant_ids)
+            buckets = [(tenant_id, bucket) for tenant_id, bucket in buckets if tenant_id in wanted]
+        return {
+            'redis_enabled': self.redis_client is not None,
+            'max_rate': self.max_rate,
+            'min_rate': self.min_rate,
+            'burst': self.burst,
+            'queue_depth': sum(bucket.waiting for _, bucket in buckets),
+            'tenants': {tenant_id: self._tenant_stats(tenant_id, bucket) for tenant_id, bucket in buckets}
+        }
+
+
+_governor: Optional[RateGovernor] = None
+_governor_lock = threading.Lock()
+
+
+def configure_rate_governor(**settings: Any) -> RateGovernor:
+    """
+    Replace the shared RateGovernor.
+
+    Args:
+        **settings: Keyword arguments for RateGovernor (max_rate, burst, redis_client...)
+    """
+    global _governor
+    with _governor_lock:
+        _governor = RateGovernor(**{k: v for k, v in settings.items() if v is not None})
+    return _governor
+
+
+def get_rate_governor() -> RateGovernor:
+    """Return the shared RateGovernor (per-worker buckets until configured)."""
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                _governor = RateGovernor()
+    return _governor
@@ -422,20 +422,21 @@ class SecurityReportAnalyzer:
         
         return result
     
-    def get_policy_recommendations(self, ca_policy_examples) -> List[Dict]:
+    def get_policy_recommendations(self, registry=None) -> List[Dict]:
         """
         Match findings to specific CA policy templates.
         Returns list of recommended policies to deploy.
+        
+        Args:
+            registry: TemplateRegistry to match against (defaults to the
+                      compiled template library)
         """
         print(f"🔍 get_policy_recommendations called with {len(self.findings)} findings")
         recommendations = []
         
-        # Get POLICY_TEMPLATES dictionary from the module
-        if not hasattr(ca_policy_examples, 'POLICY_TEMPLATES'):
-            print("Warning: ca_policy_examples module does not have POLICY_TEMPLATES")
-            return recommendations
-        
-        policy_templates = ca_policy_examples.POLICY_TEMPLATES
+        if registry is None:
+            from utils.template_registry import TEMPLATE_REGISTRY
+            registry = TEMPLATE_REGISTRY
         
         # Debug: Check first finding
         if self.findings:
@@ -448,7 +449,7 @@ class SecurityReportAnalyzer:
                     test_new.update(self.CATEGORY_TRANSLATION[old_cat])
                     print(f"  '{old_cat}' → {self.CATEGORY_TRANSLATION[old_cat]}")
             print(f"  New categories: {test_new}")
-            print(f"  Available template categories: {list(policy_templates.keys())}")
+            print(f"  Available template categories: {list(registry.categories)}")
         
         for finding in self.findings:
             # Get relevant policy categories (old format: baseline, mfa, device, etc.)
@@ -462,21 +463,19 @@ class SecurityReportAnalyzer:
             
             # Find matching templates in new categories
             for new_category in new_categories:
-                if new_category in policy_templates:
-                    templates = policy_templates[new_category]
-                    for template_name, template in templates.items():
-                        relevance = self._calculate_relevance(finding, template)
-                        if relevance > 0:  # Only include if there's some relevance
-                            recommendations.append({
-                                'finding_title': finding['title'],
-                                'finding_severity': finding['severity'],
-                                'finding_status': finding['status'],
-                                'policy_category': new_category,
-                                'policy_name': template_name,
-                                'policy_display_name': template.get('displayName', template_name),
-                                'relevance_score': relevance,
-                                'template': template  # Include full template for deployment
-                            })
+                for entry in registry.in_category(new_category):
+                    relevance = self._calculate_relevance(finding, entry.template)
+                    if relevance > 0:  # Only include if there's some relevance
+                        recommendations.append({
+                            'finding_title': finding['title'],
+                            'finding_severity': finding['severity'],
+                            'finding_status': finding['status'],
+                            'policy_category': new_category,
+                            'policy_name': entry.key,
+                            'policy_display_name': entry.display_name,
+                            'relevance_score': relevance,
+                            'template': entry  # Replaced by a copy below
+                        })
         
         # Sort by relevance and remove duplicates
         recommendations = sorted(recommendations, key=lambda x: x['relevance_score'], reverse=True)
@@ -486,6 +485,8 @@ class SecurityReportAnalyzer:
             key = rec['policy_name']
             if key not in seen:
                 seen.add(key)
+                # Include full template for deployment (a mutable copy)
+                rec['template'] = rec['template'].instance()
                 unique_recommendations.append(rec)
         
         return unique_recommendations
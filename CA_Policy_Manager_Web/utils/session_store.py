@@ -0,0 +1,108 @@
+"""
+Session Store - Bounded, expiring in-memory backend for SessionManager
+Used when Redis is not configured: entries expire after their TTL, the store
+never holds more than maxsize entries (least recently used go first), and a
+background sweeper removes expired entries nobody reads again
+"""
+
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from utils.directory_cache import MISSING, TTLCache
+
+
+class MemorySessionStore:
+    """
+    Thread-safe TTL + LRU store split into lock stripes.
+
+    Keys are spread over several TTLCache shards, each with its own lock, so
+    threads working on different sessions rarely wait for each other. Each
+    shard holds maxsize / stripes entries, which bounds the whole store.
+
+    Expired entries are dropped when read, and every sweep_interval seconds
+    by a daemon thread that is started on first use in each process (so the
+    store can be created before gunicorn forks its workers).
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600, stripes: int = 16,
+                 sweep_interval: float = 60):
+        """
+        Args:
+            maxsize: Maximum number of entries across all stripes
+            ttl: Default time to live in seconds
+            stripes: Number of independently locked shards
+            sweep_interval: Seconds between sweeps for expired entries (0 disables the sweeper)
+        """
+        self.stripes = max(1, stripes)
+        shard_size = max(1, maxsize // self.stripes)
+        self.maxsize = shard_size * self.stripes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._shards = [TTLCache(maxsize=shard_size, ttl=ttl)
+                        for _ in range(self.stripes)]
+        self._sweeper_pid = None
+        self._sweeper_lock = threading.Lock()
+        self.sweeps = 0
+
+    def _shard(self, key: Hashable) -> TTLCache:
+        self._ensure_sweeper()
+        return self._shards[hash(key) % self.stripes]
+
+    def _ensure_sweeper(self):
+        """Start this process's sweeper thread (threads do not survive fork)"""
+        if not self.sweep_interval or self._sweeper_pid == os.getpid():
+            return
+        with self._sweeper_lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+            threading.Thread(target=self._sweep_loop, name='session-sweeper', daemon=True).start()
+
+    def _sweep_loop(self):
+        pid = os.getpid()
+        while self._sweeper_pid == pid:
+            time.sleep(self.sweep_interval)
+            self.sweep()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the stored value, or default if absent or expired."""
+        value = self._shard(key).get(key, MISSING)
+        return default if value is MISSING else value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value for ttl seconds (default TTL if omitted)."""
+        self._shard(key).set(key, value, ttl)
+
+    def update(self, key: Hashable, func: Callable[[Any], Any], ttl: Optional[float] = None) -> Any:
+        """Atomically replace a value with func(current or None) and reset its TTL."""
+        return self._shard(key).update(key, func, ttl)
+
+    def delete(self, key: Hashable):
+        self._shard(key).delete(key)
+
+    def sweep(self) -> int:
+        """Remove expired entries from every stripe; returns how many were removed."""
+        removed = sum(shard.purge_expired() for shard in self._shards)
+        self.sweeps += 1
+        return removed
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def stats(self) -> Dict[str, int]:
+        """Size, eviction and expiry counters for monitoring."""
+        totals: Dict[str, int] = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+        for shard in self._shards:
+            shard_stats = shard.stats()
+            for name in totals:
+                totals[name] += shard_stats[name]
+        return {
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'stripes': self.stripes,
+            'ttl': self.ttl,
+            'sweeps': self.sweeps,
+            **totals
+        }
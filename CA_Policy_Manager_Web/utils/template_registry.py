@@ -0,0 +1,162 @@
+"""
+Template Registry - The policy template library, compiled once at import
+Templates from ca_policy_examples.POLICY_TEMPLATES are frozen (read-only
+mappings and tuples) and indexed by key, display name, category, persona group,
+referenced group names, excluded app IDs and grant control. Callers that need
+to change a template (deployments) get their own mutable copy
+"""
+
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+
+from ca_policy_examples import POLICY_TEMPLATES
+
+PERSONA_PREFIX = 'CA-Persona-'
+
+# User condition fields that reference groups (by ID or, in templates, by name)
+GROUP_FIELDS = ('includeGroups', 'excludeGroups')
+
+
+def freeze(value: Any) -> Any:
+    """Deep read-only view of a JSON value (dict -> mappingproxy, list -> tuple)."""
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Mutable deep copy of a frozen (or plain) JSON value."""
+    if isinstance(value, Mapping):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    return value
+
+
+class TemplateEntry:
+    """One frozen template with the attributes it is indexed by."""
+
+    __slots__ = ('key', 'category', 'display_name', 'state', 'template',
+                 'persona_groups', 'group_names', 'app_ids', 'grant_controls')
+
+    def __init__(self, key: str, category: str, template: Mapping):
+        conditions = template.get('conditions') or {}
+        users = conditions.get('users') or {}
+        applications = conditions.get('applications') or {}
+        grant = template.get('grantControls') or {}
+
+        self.key = key
+        self.category = category
+        self.template = freeze(template)
+        self.display_name: str = template.get('displayName', key)
+        self.state: str = template.get('state', 'Unknown')
+        self.group_names: FrozenSet[str] = frozenset(
+            g for field in GROUP_FIELDS for g in users.get(field) or [] if isinstance(g, str)
+        )
+        self.persona_groups: FrozenSet[str] = frozenset(
+            g for g in users.get('includeGroups') or [] if g.startswith(PERSONA_PREFIX)
+        )
+        self.app_ids: FrozenSet[str] = frozenset(
+            a for field in ('includeApplications', 'excludeApplications') for a in applications.get(field) or []
+        )
+        controls = set(grant.get('builtInControls') or [])
+        if grant.get('authenticationStrength'):
+            controls.add('authenticationStrength')
+        self.grant_controls: FrozenSet[str] = frozenset(controls)
+
+    def instance(self) -> Dict:
+        """A mutable copy of the template, e.g. to resolve group names before deploying."""
+        return thaw(self.template)
+
+    def summary(self) -> Dict[str, Any]:
+        """The /api/templates representation."""
+        return {
+            'category': self.category,
+            'name': self.key,
+            'display_name': self.display_name,
+            'state': self.state,
+            'template': self.instance()
+        }
+
+
+class TemplateRegistry:
+    """
+    Read-only template library with O(1) lookups.
+
+    Iteration order (categories and templates) follows the source dictionary.
+    """
+
+    def __init__(self, templates: Mapping[str, Mapping[str, Mapping]]):
+        """
+        Args:
+            templates: Category -> template key -> policy definition
+        """
+        self.entries: Tuple[TemplateEntry, ...] = tuple(
+            TemplateEntry(key, category, template)
+            for category, category_templates in templates.items()
+            for key, template in category_templates.items()
+        )
+        self.categories: Tuple[str, ...] = tuple(templates.keys())
+
+        self.by_key: Dict[str, TemplateEntry] = {e.key: e for e in self.entries}
+        self.by_display_name: Dict[str, TemplateEntry] = {}
+        for entry in self.entries:
+            self.by_display_name.setdefault(entry.display_name.casefold(), entry)
+        self.by_category = self._index((e.category,) for e in self.entries)
+        self.by_persona = self._index(e.persona_groups for e in self.entries)
+        self.by_group_name = self._index((g.casefold() for g in e.group_names) for e in self.entries)
+        self.by_app_id = self._index(e.app_ids for e in self.entries)
+        self.by_grant_control = self._index(e.grant_controls for e in self.entries)
+
+    def _index(self, keys_per_entry: Iterable[Iterable[str]]) -> Dict[str, Tuple[TemplateEntry, ...]]:
+        index: Dict[str, List[TemplateEntry]] = {}
+        for entry, keys in zip(self.entries, keys_per_entry):
+            for key in keys:
+                index.setdefault(key, []).append(entry)
+        return {key: tuple(entries) for key, entries in index.items()}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Optional[TemplateEntry]:
+        return self.by_key.get(key)
+
+    def find_by_display_name(self, display_name: str) -> Optional[TemplateEntry]:
+        """Template with this display name (case-insensitive)."""
+        return self.by_display_name.get((display_name or '').casefold())
+
+    def in_category(self, category: str) -> Tuple[TemplateEntry, ...]:
+        return self.by_category.get(category, ())
+
+    def using_group(self, group_name: str) -> Tuple[TemplateEntry, ...]:
+        """Templates that include or exclude the named group (case-insensitive)."""
+        return self.by_group_name.get(group_name.casefold(), ())
+
+    def templates(self, category: Optional[str] = None) -> Dict[str, Mapping]:
+        """
+        Frozen templates keyed by template key, in library order.
+
+        Args:
+            category: Only this category (None = every template)
+        """
+        entries = self.in_category(category) if category else self.entries
+        return {e.key: e.template for e in entries}
+
+    def all_templates(self) -> List[Mapping]:
+        """Every frozen template (read-only; use instance() to modify one)."""
+        return [e.template for e in self.entries]
+
+    def instance(self, key: str) -> Dict:
+        """
+        A mutable copy of a template.
+
+        Raises:
+            KeyError: If there is no template with this key
+        """
+        return self.by_key[key].instance()
+
+
+# Built once per process, at import
+TEMPLATE_REGISTRY = TemplateRegistry(POLICY_TEMPLATES)